@@ -1,16 +1,39 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django import forms
+from django.conf import settings
 from django.contrib import admin, messages
 from django.contrib.admin import DateFieldListFilter
+from django.contrib.admin.widgets import FilteredSelectMultiple
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import GroupAdmin as DjangoGroupAdmin
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
 from django.contrib.auth.models import Group
+from django.db.models import Count
 from django.shortcuts import get_object_or_404, redirect
 from django.template.response import TemplateResponse
 from django.urls import path, reverse
 from django.utils import timezone
 from django.utils.crypto import get_random_string
 from django.utils.html import format_html, format_html_join
-from .models import BroadcastLog, Command, Device, DeviceLog, WavFile
+from .auth import invalidate_device_credentials
+from .delivery import delivery_stats
+from .heartbeat import apply_last_seen
+from .inbox import dispatch_command
+from .library import apply_prefetch_coverage, prefetch_coverage
+from .models import (
+    BroadcastLog,
+    Command,
+    CommandArchive,
+    Device,
+    DeviceGroup,
+    DeviceLog,
+    DeviceLogDaily,
+    WavFile,
+)
+from .notify import notify_command_created
+from .permissions import can_view_device, filter_visible, has_visible_devices, sees_all_devices, visible_devices
 
 admin.site.site_header = "통합주차관제센터 방송 시스템"
 admin.site.site_title = "통합주차관제센터 방송 시스템"
@@ -41,9 +64,12 @@ class WavFileAdmin(admin.ModelAdmin):
     list_display = (
         "title_link",
         "file_name",
+        "audio_summary",
+        "variant_summary",
+        "predistribute",
     )
     list_display_links = ("title_link",)
-    fields = ("title", "description", "file")
+    fields = ("title", "description", "file", "predistribute")
     change_form_template = "admin/alert/wavfile/change_form.html"
 
     def title_link(self, obj):
@@ -57,6 +83,28 @@ class WavFileAdmin(admin.ModelAdmin):
 
     file_name.short_description = "파일명"
 
+    def audio_summary(self, obj):
+        # 업로드 때 저장해 둔 값만 사용 (파일을 열지 않음)
+        if not obj.sample_rate:
+            return "-"
+        return (
+            f"{obj.duration_ms / 1000:.1f}초 · {obj.sample_rate / 1000:g}kHz · "
+            f"{obj.bits_per_sample}bit {obj.channels}ch · {obj.size / 1024 / 1024:.1f}MB"
+        )
+
+    audio_summary.short_description = "오디오"
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related("variants")
+
+    def variant_summary(self, obj):
+        variants = obj.variants.all()
+        if not variants or not obj.size:
+            return "-"
+        return ", ".join(f"{v.codec} {v.size * 100 // obj.size}%" for v in variants)
+
+    variant_summary.short_description = "압축본(원본 대비)"
+
     def get_urls(self):
         urls = super().get_urls()
         custom = [
@@ -78,81 +126,261 @@ class WavFileAdmin(admin.ModelAdmin):
     all_stop_button.short_description = "전체 정지"
 
     def render_change_form(self, request, context, add=False, change=False, form_url="", obj=None):
-        context["devices"] = Device.objects.filter(is_active=True).select_related("user").order_by("id")
+        # 선택 장비 제어 목록은 수정 화면에만 있고, 이름/최근 접속만 표시한다
+        if change and obj:
+            context["devices"] = apply_last_seen(
+                Device.objects
+                .filter(is_active=True)
+                .select_related("user")
+                .only("id", "name", "last_seen_at", "user__username")
+                .order_by("id")
+            )
+            context["device_groups"] = DeviceGroup.objects.annotate(device_count=Count("devices")).order_by("name")
+            context["play_in_max"] = settings.SCHEDULED_PLAY_MAX_AHEAD
         return super().render_change_form(request, context, add, change, form_url, obj)
 
+    def _play_at(self, request):
+        """
+        play_in=<초> 가 있으면 예약 재생 시각 (장비들이 이 시각에 맞춰 같이 재생).
+        (play_at, 메시지 꼬리, 오류) 를 돌려준다.
+        """
+        raw = (request.POST.get("play_in") or request.GET.get("play_in") or "").strip()
+        if not raw:
+            return None, "", None
+        try:
+            seconds = int(raw)
+        except ValueError:
+            return None, "", "예약 시간은 초 단위 숫자로 입력하세요."
+        if not 0 < seconds <= settings.SCHEDULED_PLAY_MAX_AHEAD:
+            return None, "", f"예약 시간은 1~{settings.SCHEDULED_PLAY_MAX_AHEAD}초 사이여야 합니다."
+        play_at = timezone.now() + timedelta(seconds=seconds)
+        return play_at, f" · {timezone.localtime(play_at):%H:%M:%S} 예약", None
+
+    def _selected_targets(self, request):
+        devices = list(Device.objects.filter(id__in=request.POST.getlist("device_ids"), is_active=True))
+        groups = list(DeviceGroup.objects.filter(id__in=request.POST.getlist("group_ids")))
+        summary = f"장비 {len(devices)}대"
+        if groups:
+            summary += f", 그룹 {', '.join(g.name for g in groups)}"
+        return devices, groups, summary
+
     def all_play(self, request, wav_id):
         wav = get_object_or_404(WavFile, pk=wav_id)
-        Command.objects.create(action=Command.Action.PLAY, wav=wav, all_devices=True)
-        BroadcastLog.objects.create(action="PLAY", wav=wav, executed_by=request.user, all_devices=True)
-        self.message_user(request, "[전체] 방송 실행 기록 생성", level=messages.SUCCESS)
+        play_at, when, error = self._play_at(request)
+        if error:
+            self.message_user(request, error, level=messages.ERROR)
+            return redirect("admin:alert_wavfile_change", object_id=wav_id)
+
+        dispatch_command(Command.Action.PLAY, wav=wav, executed_by=request.user, play_at=play_at)
+        self.message_user(request, f"[전체] 방송 실행 기록 생성{when}", level=messages.SUCCESS)
         return redirect("admin:alert_wavfile_changelist")
 
     def all_stop(self, request):
-        Command.objects.create(action=Command.Action.STOP, all_devices=True)
-        BroadcastLog.objects.create(action="STOP", executed_by=request.user, all_devices=True)
+        dispatch_command(Command.Action.STOP, executed_by=request.user)
         self.message_user(request, "[전체] 정지 실행 기록 생성", level=messages.SUCCESS)
         return redirect("admin:alert_wavfile_changelist")
 
     def target_play(self, request, wav_id):
         wav = get_object_or_404(WavFile, pk=wav_id)
-        ids = request.POST.getlist("device_ids")
-        devices = Device.objects.filter(id__in=ids, is_active=True)
-
-        cmd = Command.objects.create(action=Command.Action.PLAY, wav=wav, all_devices=False)
-        cmd.targets.set(devices)
-
-        log = BroadcastLog.objects.create(action="PLAY", wav=wav, executed_by=request.user, all_devices=False)
-        log.targets.set(devices)
+        play_at, when, error = self._play_at(request)
+        if error:
+            self.message_user(request, error, level=messages.ERROR)
+            return redirect("admin:alert_wavfile_change", object_id=wav_id)
+        devices, groups, summary = self._selected_targets(request)
+
+        dispatch_command(
+            Command.Action.PLAY, wav=wav, devices=devices, groups=groups, executed_by=request.user, play_at=play_at
+        )
 
-        self.message_user(request, f"[선택] 방송 기록 생성 (장비 {devices.count()}대)", level=messages.SUCCESS)
+        self.message_user(request, f"[선택] 방송 기록 생성 ({summary}){when}", level=messages.SUCCESS)
         return redirect("admin:alert_wavfile_change", object_id=wav_id)
 
     def target_stop(self, request, wav_id):
-        ids = request.POST.getlist("device_ids")
-        devices = Device.objects.filter(id__in=ids, is_active=True)
-
-        cmd = Command.objects.create(action=Command.Action.STOP, all_devices=False)
-        cmd.targets.set(devices)
+        devices, groups, summary = self._selected_targets(request)
 
-        log = BroadcastLog.objects.create(action="STOP", executed_by=request.user, all_devices=False)
-        log.targets.set(devices)
+        dispatch_command(Command.Action.STOP, devices=devices, groups=groups, executed_by=request.user)
 
-        self.message_user(request, f"[선택] 정지 기록 생성 (장비 {devices.count()}대)", level=messages.SUCCESS)
+        self.message_user(request, f"[선택] 정지 기록 생성 ({summary})", level=messages.SUCCESS)
         return redirect("admin:alert_wavfile_change", object_id=wav_id)
 
 
 @admin.register(Command)
 class CommandAdmin(SuperuserOnlyAdminMixin, admin.ModelAdmin):
-    list_display = ("id", "action", "wav", "all_devices", "created_at")
-    filter_horizontal = ("targets",)
+    list_display = ("id", "action", "wav", "all_devices", "play_at", "created_at")
+    filter_horizontal = ("targets", "target_groups")
+    list_filter = ("action", "all_devices")
+    list_select_related = ("wav",)
+
+    def save_related(self, request, form, formsets, change):
+        # 장비/그룹 커서는 대상 추가 시그널에서 갱신된다 (alert.signals)
+        super().save_related(request, form, formsets, change)
+        notify_command_created()
+
+
+@admin.register(CommandArchive)
+class CommandArchiveAdmin(SuperuserOnlyAdminMixin, admin.ModelAdmin):
+    list_display = ("command_id", "action", "wav", "all_devices", "play_at", "created_at", "archived_at")
     list_filter = ("action", "all_devices")
+    list_select_related = ("wav",)
+    ordering = ("-command_id",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(BroadcastLog)
 class BroadcastLogAdmin(SuperuserOnlyAdminMixin, admin.ModelAdmin):
-    list_display = ("executed_at", "action", "wav", "executed_by", "device_summary")
+    list_display = (
+        "executed_at",
+        "action",
+        "wav",
+        "executed_by",
+        "device_summary",
+        "latency_summary",
+        "skew_summary",
+        "never_acked",
+    )
     list_filter = ("action", "all_devices", "executed_at")
     search_fields = ("wav__file", "executed_by__username")
+    list_select_related = ("wav", "executed_by")
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(target_count=Count("targets"))
+
+    def get_changelist_instance(self, request):
+        # 현재 페이지 명령들의 전달 기록과 대상 그룹을 한 번에 집계
+        cl = super().get_changelist_instance(request)
+        logs = list(cl.result_list)
+        stats = delivery_stats([log.command_id for log in logs if log.command_id])
+
+        LogGroups = BroadcastLog.target_groups.through
+        log_ids = [log.pk for log in logs if not log.all_devices]
+        group_names = defaultdict(list)
+        for log_id, name in (
+            LogGroups.objects
+            .filter(broadcastlog_id__in=log_ids)
+            .order_by("devicegroup__name")
+            .values_list("broadcastlog_id", "devicegroup__name")
+        ):
+            group_names[log_id].append(name)
+        # 그룹 소속 장비 수는 지금 기준 (명령은 그룹만 참조한다)
+        group_devices = dict(
+            LogGroups.objects
+            .filter(broadcastlog_id__in=list(group_names))
+            .values("broadcastlog_id")
+            .annotate(n=Count("devicegroup__devices", distinct=True))
+            .values_list("broadcastlog_id", "n")
+        ) if group_names else {}
+
+        active = None
+        for log in logs:
+            log.delivery = stats.get(log.command_id)
+            log.group_names = group_names.get(log.pk, [])
+            if log.all_devices:
+                if active is None:
+                    active = Device.objects.filter(is_active=True).count()
+                log.expected = active
+            else:
+                log.expected = log.target_count + group_devices.get(log.pk, 0)
+        return cl
 
     def device_summary(self, obj):
         if obj.all_devices:
             return "전체 장비"
-        return f"{obj.targets.count()}대"
+        groups = getattr(obj, "group_names", None)
+        if groups:
+            parts = [f"그룹 {', '.join(groups)}"]
+            if obj.target_count:
+                parts.append(f"장비 {obj.target_count}대")
+            return f"{' + '.join(parts)} ({obj.expected}대)"
+        return f"{obj.target_count}대"
 
     device_summary.short_description = "대상 장비"
 
+    def latency_summary(self, obj):
+        stats = getattr(obj, "delivery", None)
+        if not stats or stats["p50"] is None:
+            return "-"
+        return f"{stats['p50']:.1f}s / {stats['p95']:.1f}s / {stats['max']:.1f}s"
+
+    latency_summary.short_description = "지연 p50/p95/max"
+
+    def skew_summary(self, obj):
+        # 예약 재생에서 장비들이 play_at 과 어긋난 정도
+        stats = getattr(obj, "delivery", None)
+        skew = stats and stats["skew"]
+        if not skew:
+            return "-"
+        return f"{skew['p50']}ms / {skew['p95']}ms / {skew['max']}ms"
+
+    skew_summary.short_description = "동기 오차 p50/p95/max"
+
+    def never_acked(self, obj):
+        stats = getattr(obj, "delivery", None)
+        if stats is None:
+            return "-"
+        missing = max(0, obj.expected - stats["acked"])
+        if not missing:
+            return "0"
+        return format_html('<span style="color:#c00;">{}</span>', missing)
+
+    never_acked.short_description = "미응답 장비"
+
+
+class DeviceGroupForm(forms.ModelForm):
+    # 소속은 through 모델(DeviceGroupMembership)이라 기본 폼에 나오지 않으므로 직접 둔다
+    devices = forms.ModelMultipleChoiceField(
+        Device.objects.all(),
+        required=False,
+        label="장비",
+        widget=FilteredSelectMultiple("장비", is_stacked=False),
+    )
+
+    class Meta:
+        model = DeviceGroup
+        fields = ("name",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields["devices"].initial = self.instance.devices.all()
+
+
+@admin.register(DeviceGroup)
+class DeviceGroupAdmin(admin.ModelAdmin):
+    form = DeviceGroupForm
+    list_display = ("name", "device_count")
+    search_fields = ("name",)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # 새로 넣은 장비만 추가된다 (alert.signals 에서 join_cursor 를 채움)
+        form.instance.devices.set(form.cleaned_data["devices"])
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(device_count=Count("devices"))
+
+    def device_count(self, obj):
+        return obj.device_count
+
+    device_count.short_description = "장비 수"
+    device_count.admin_order_field = "device_count"
+
 
 @admin.register(Device)
 class DeviceAdmin(admin.ModelAdmin):
-    list_display = ("name_link", "user", "is_active", "last_seen_at")
+    list_display = ("name_link", "user", "is_active", "last_seen_display", "prefetch_coverage_display")
     list_display_links = ("name_link",)
     search_fields = ("name", "user__username")
     list_filter = ("is_active",)
     list_select_related = ("user",)
+    filter_horizontal = ("viewer_groups",)
 
     def get_fieldsets(self, request, obj=None):
-        base = ((None, {"fields": ("name", "user", "is_active")}),)
+        base = ((None, {"fields": ("name", "user", "is_active", "viewer_groups")}),)
         if obj:
             return base + (("최근 클라이언트 로그 (최신 25개)", {"fields": ("recent_device_logs",)}),)
         return base
@@ -207,6 +435,11 @@ class DeviceAdmin(admin.ModelAdmin):
 
     recent_device_logs.short_description = "최근 로그"
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and not obj.is_active:
+            invalidate_device_credentials(obj)
+
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "user":
             kwargs["queryset"] = User.objects.filter(is_staff=False, is_superuser=False)
@@ -218,6 +451,28 @@ class DeviceAdmin(admin.ModelAdmin):
 
     name_link.short_description = "디바이스"
 
+    def get_changelist_instance(self, request):
+        # 목록의 최근 접속 시각과 사전 배포 현황을 한 번에 읽어 둔다 (행마다 조회하지 않음)
+        cl = super().get_changelist_instance(request)
+        apply_last_seen(cl.result_list)
+        apply_prefetch_coverage(cl.result_list)
+        return cl
+
+    def last_seen_display(self, obj):
+        return obj.last_seen_at
+
+    last_seen_display.short_description = "최근 접속"
+    last_seen_display.admin_order_field = "last_seen_at"
+
+    def prefetch_coverage_display(self, obj):
+        have, total = getattr(obj, "prefetch_coverage", None) or prefetch_coverage(obj)
+        if not total:
+            return "-"
+        color = "#2a7" if have == total else "#c60"
+        return format_html('<span style="color:{};">{}/{}</span>', color, have, total)
+
+    prefetch_coverage_display.short_description = "사전 배포"
+
     def get_urls(self):
         urls = super().get_urls()
         custom = [
@@ -247,6 +502,7 @@ class DeviceAdmin(admin.ModelAdmin):
         raw = get_random_string(24)
         user.set_password(raw)
         user.save(update_fields=["password"])
+        invalidate_device_credentials(device)
 
         context = dict(
             self.admin_site.each_context(request),
@@ -261,8 +517,7 @@ class DeviceAdmin(admin.ModelAdmin):
         device = get_object_or_404(Device, pk=device_id)
         
         # Create a PING command for the device
-        command = Command.objects.create(action=Command.Action.PING, all_devices=False)
-        command.targets.set([device])
+        dispatch_command(Command.Action.PING, devices=[device])
         
         self.message_user(
             request, 
@@ -274,40 +529,47 @@ class DeviceAdmin(admin.ModelAdmin):
 
 
 
+class VisibleDeviceListFilter(admin.RelatedFieldListFilter):
+    """장비 필터 선택지를 볼 수 있는 장비로 제한."""
+
+    def field_choices(self, field, request, model_admin):
+        if sees_all_devices(request.user):
+            return super().field_choices(field, request, model_admin)
+        ordering = self.field_admin_ordering(field, request, model_admin)
+        return field.get_choices(
+            include_blank=False,
+            ordering=ordering,
+            limit_choices_to={"pk__in": visible_devices(request.user).values("pk")},
+        )
+
+
 @admin.register(DeviceLog)
 class DeviceLogAdmin(admin.ModelAdmin):
-    list_display = ("created_at", "device", "level", "short_message")
-    list_filter = ("device", "level", ("created_at", DateFieldListFilter))
+    list_display = ("created_at", "client_ts", "device", "level", "short_message")
+    list_filter = (("device", VisibleDeviceListFilter), "level", ("created_at", DateFieldListFilter))
     search_fields = ("message", "device__name", "device__user__username")
     date_hierarchy = "created_at"
     ordering = ("-created_at",)
     list_select_related = ("device",)
+    # 필터 없는 전체 건수 COUNT 생략 (로그 테이블이 커도 목록 1회 COUNT 만)
+    show_full_result_count = False
 
     def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        if request.user.is_superuser:
-            return qs
-
-        # 사용자가 'view' 권한을 가진 Device 목록을 가져옴
-        allowed_device_ids = [
-            d.pk
-            for d in Device.objects.all()
-            if request.user.has_perm("alert.view_device", d)
-        ]
-        return qs.filter(device_id__in=allowed_device_ids)
+        # 볼 수 있는 장비의 로그만 (장비 목록을 파이썬에서 돌지 않고 서브쿼리 1개)
+        return filter_visible(super().get_queryset(request), request.user)
 
     def has_view_permission(self, request, obj=None):
         if request.user.is_superuser:
             return True
 
         if obj:  # 특정 DeviceLog 객체에 대한 권한 확인
-            return request.user.has_perm("alert.view_device", obj.device)
+            return can_view_device(request.user, obj.device)
 
         # 메뉴 노출 여부 결정: 사용자가 볼 수 있는 Device가 하나라도 있는지 확인
-        return any(
-            request.user.has_perm("alert.view_device", d)
-            for d in Device.objects.all()
-        )
+        return has_visible_devices(request.user)
+
+    def has_module_permission(self, request):
+        return request.user.is_superuser or has_visible_devices(request.user)
 
     def has_add_permission(self, request):
         return bool(request.user and request.user.is_superuser)
@@ -325,6 +587,21 @@ class DeviceLogAdmin(admin.ModelAdmin):
     short_message.short_description = "메시지"
 
 
+@admin.register(DeviceLogDaily)
+class DeviceLogDailyAdmin(SuperuserOnlyAdminMixin, admin.ModelAdmin):
+    list_display = ("date", "device", "heartbeats", "first_at", "last_at")
+    list_filter = ("device",)
+    date_hierarchy = "date"
+    ordering = ("-date",)
+    list_select_related = ("device",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 try:
     admin.site.unregister(User)
 except admin.sites.NotRegistered:
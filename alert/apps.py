@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AlertConfig(AppConfig):
     name = 'alert'
     verbose_name = "방송 시스템"
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
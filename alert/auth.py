@@ -1,30 +1,154 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
+from django.conf import settings
+from django.core import signing
 from django.http import JsonResponse
 from django.contrib.auth import authenticate
+from django.utils.crypto import constant_time_compare, salted_hmac
 from .models import Device
 
+TOKEN_SALT = "alert.device-token"
+
+
+def _password_fingerprint(user):
+    # 비밀번호가 바뀌면(앱 비밀번호 재발급) 값이 달라져서 토큰/캐시가 자동으로 무효화된다
+    return salted_hmac(TOKEN_SALT, user.password).hexdigest()[:16]
+
+
+def _load_device(device_id, fingerprint):
+    device = (
+        Device.objects
+        .select_related("user")
+        .filter(pk=device_id, is_active=True, user__is_active=True)
+        .first()
+    )
+    if not device or not constant_time_compare(_password_fingerprint(device.user), fingerprint):
+        return None
+    return device
+
+
+# =========================
+# 토큰 (POST /api/token 으로 발급)
+# =========================
+def issue_device_token(device):
+    return signing.dumps(
+        {"d": device.pk, "p": _password_fingerprint(device.user)},
+        salt=TOKEN_SALT,
+    )
+
+
+def device_from_token(token):
+    try:
+        data = signing.loads(token, salt=TOKEN_SALT, max_age=settings.DEVICE_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    return _load_device(data.get("d"), data.get("p", ""))
+
+
+# =========================
+# 검증된 Basic 인증 캐시 (PBKDF2 재계산 방지)
+# =========================
+class CredentialCache:
+    """
+    최근에 검증된 (username, password) -> (device_id, 비밀번호 지문) 를 프로세스 메모리에 보관.
+    크기 제한(LRU) + TTL. 평문 비밀번호는 저장하지 않는다.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def _key(username, password):
+        return hashlib.sha256(f"{username}\0{password}".encode("utf-8")).hexdigest()
+
+    def get(self, username, password):
+        key = self._key(username, password)
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+            if entry[2] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return _load_device(entry[0], entry[1])
+
+    def put(self, username, password, device):
+        key = self._key(username, password)
+        entry = (device.pk, _password_fingerprint(device.user), time.monotonic() + settings.DEVICE_AUTH_CACHE_TTL)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.DEVICE_AUTH_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def invalidate_device(self, device_id):
+        with self._lock:
+            for key in [k for k, v in self._entries.items() if v[0] == device_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+credential_cache = CredentialCache()
+
+
+def invalidate_device_credentials(device):
+    """비밀번호 재발급/비활성화 시 호출."""
+    credential_cache.invalidate_device(device.pk)
+
+
+def authenticate_device(request):
+    """
+    Basic 인증 또는 Bearer 토큰으로 장비를 확인한다.
+    (device, None) 또는 (None, 에러 응답) 을 돌려준다.
+    """
+    auth = request.META.get("HTTP_AUTHORIZATION", "")
+    if auth.startswith("Bearer "):
+        device = device_from_token(auth.split(" ", 1)[1].strip())
+        if not device:
+            return None, JsonResponse({"error": "invalid_token"}, status=401)
+        return device, None
+
+    if not auth.startswith("Basic "):
+        return None, JsonResponse({"error": "unauthorized"}, status=401)
+
+    import base64
+    try:
+        raw = base64.b64decode(auth.split(" ", 1)[1]).decode("utf-8")
+        username, password = raw.split(":", 1)
+    except Exception:
+        return None, JsonResponse({"error": "unauthorized"}, status=401)
+
+    device = credential_cache.get(username, password)
+    if device:
+        return device, None
+
+    user = authenticate(username=username, password=password)
+    if not user:
+        return None, JsonResponse({"error": "unauthorized"}, status=401)
+
+    device = Device.objects.select_related("user").filter(user=user, is_active=True).first()
+    if not device:
+        return None, JsonResponse({"error": "device_not_found_or_inactive"}, status=403)
+
+    credential_cache.put(username, password, device)
+    return device, None
+
+
 def basic_auth_device(view):
     @wraps(view)
     def wrapper(request, *args, **kwargs):
-        auth = request.META.get("HTTP_AUTHORIZATION", "")
-        if not auth.startswith("Basic "):
-            return JsonResponse({"error": "unauthorized"}, status=401)
-
-        import base64
-        try:
-            raw = base64.b64decode(auth.split(" ", 1)[1]).decode("utf-8")
-            username, password = raw.split(":", 1)
-        except Exception:
-            return JsonResponse({"error": "unauthorized"}, status=401)
-
-        user = authenticate(username=username, password=password)
-        if not user:
-            return JsonResponse({"error": "unauthorized"}, status=401)
-
-        device = Device.objects.filter(user=user, is_active=True).first()
-        if not device:
-            return JsonResponse({"error": "device_not_found_or_inactive"}, status=403)
+        device, error = authenticate_device(request)
+        if error:
+            return error
 
         request.device = device
         return view(request, *args, **kwargs)
-    return wrapper
\ No newline at end of file
+    return wrapper
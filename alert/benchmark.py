@@ -0,0 +1,279 @@
+"""
+부하 측정 (manage.py benchmark)
+
+가상 장비 N대를 만들고 여러 스레드에서 실제 view 를 호출한다 (django.test.Client, 미들웨어 포함).
+- status: 대부분의 트래픽. 장비별 last_id 를 들고 폴링
+- device-logs: 로그 묶음 전송
+- file: 최신 PLAY 명령 음원 다운로드
+- ack: 명령 전달 확인
+- 별도 스레드가 주기적으로 그룹/지정 PLAY 명령을 만든다 (dispatch)
+  명령은 측정용 장비와 측정용 그룹에만 보낸다 (전체 명령은 실제 장비에서 재생되므로 만들지 않음)
+
+장비는 실제 클라이언트처럼 Bearer 토큰을 쓴다 (토큰은 서버에서 바로 발급해서 준비 시간을 줄임).
+결과: endpoint 별 건수, 오류, 처리량, p50/p99/max (ms).
+
+운영 DB 에서 실수로 돌지 않도록 테스트/측정용 DB 에서만 돈다 (manage.py benchmark --i-know 로 무시).
+"""
+import io
+import json
+import random
+import threading
+import time
+import wave
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.db import connection, connections
+from django.test import Client
+from django.utils.crypto import get_random_string
+
+from .auth import issue_device_token
+from .delivery import percentile
+from .inbox import dispatch_command
+from .models import Command, Device, DeviceGroup, WavFile
+
+USERNAME_PREFIX = "bench-"
+
+# 요청 종류별 비중
+DEFAULT_MIX = {
+    "status": 80,
+    "device-logs": 10,
+    "file": 5,
+    "ack": 5,
+}
+
+
+def _silent_wav(seconds=1, rate=8000):
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b"\0\0" * rate * seconds)
+    return buf.getvalue()
+
+
+def _host():
+    # Client 기본 호스트(testserver)는 테스트 밖에서는 ALLOWED_HOSTS 에 걸린다
+    for host in settings.ALLOWED_HOSTS:
+        if host != "*":
+            return host.lstrip(".")
+    return "127.0.0.1"
+
+
+def is_scratch_database():
+    """테스트 DB(메모리 SQLite 포함)이거나 이름이 test 로 시작하거나 bench 가 들어간 DB 인지."""
+    if connection.vendor == "sqlite" and connection.is_in_memory_db():
+        return True
+    name = Path(str(connection.settings_dict["NAME"])).name.lower()
+    return name.startswith("test") or "bench" in name
+
+
+def provision(count):
+    """가상 장비 count 대와 이들을 묶은 측정용 그룹 생성 (비밀번호 해시는 1번만 계산)."""
+    cleanup()
+    password = make_password(get_random_string(20))
+    suffix = get_random_string(6).lower()
+    users = User.objects.bulk_create([
+        User(username=f"{USERNAME_PREFIX}{suffix}-{i}", password=password)
+        for i in range(count)
+    ])
+    users = list(User.objects.filter(username__startswith=f"{USERNAME_PREFIX}{suffix}-"))
+    Device.objects.bulk_create([Device(user=u, name=u.username) for u in users])
+    devices = list(Device.objects.filter(user__in=users).select_related("user"))
+    group = DeviceGroup.objects.create(name=f"{USERNAME_PREFIX}{suffix}")
+    group.devices.set(devices)
+
+    wav = WavFile(title=f"{USERNAME_PREFIX}audio")
+    wav.file.save(f"{USERNAME_PREFIX}audio.wav", ContentFile(_silent_wav()))
+    return devices, group, wav
+
+
+def cleanup():
+    """이전 측정에서 만든 장비/그룹/명령/음원 삭제."""
+    devices = Device.objects.filter(user__username__startswith=USERNAME_PREFIX)
+    groups = DeviceGroup.objects.filter(name__startswith=USERNAME_PREFIX)
+    Command.objects.filter(targets__in=devices).delete()
+    Command.objects.filter(target_groups__in=groups).delete()
+    groups.delete()
+    for wav in WavFile.objects.filter(title__startswith=USERNAME_PREFIX):
+        Command.objects.filter(wav=wav).delete()
+        for v in wav.variants.all():
+            v.file.delete(save=False)
+        wav.file.delete(save=False)
+        wav.delete()
+    User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+
+class _Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, name, seconds, ok):
+        with self.lock:
+            self.latencies[name].append(seconds)
+            if not ok:
+                self.errors[name] += 1
+
+
+class _SimDevice:
+    def __init__(self, device):
+        self.device = device
+        self.token = issue_device_token(device)
+        self.last_id = None
+        self.lock = threading.Lock()
+
+
+def _worker(sims, mix, deadline, recorder, seed):
+    rng = random.Random(seed)
+    client = Client(HTTP_HOST=_host())
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    try:
+        while time.monotonic() < deadline:
+            sim = rng.choice(sims)
+            name = rng.choices(names, weights)[0]
+            headers = {"HTTP_AUTHORIZATION": f"Bearer {sim.token}"}
+
+            start = time.perf_counter()
+            try:
+                ok = _REQUESTS[name](client, sim, headers)
+            except Exception:
+                ok = False
+            recorder.add(name, time.perf_counter() - start, ok)
+    finally:
+        connection.close()
+
+
+def _status(client, sim, headers):
+    params = {"last_id": sim.last_id} if sim.last_id is not None else {}
+    r = client.get("/api/status", params, **headers)
+    if r.status_code != 200:
+        return False
+    data = r.json()
+    if data.get("has_command"):
+        with sim.lock:
+            sim.last_id = max(sim.last_id or 0, data["command_id"])
+    return True
+
+
+def _device_logs(client, sim, headers):
+    now = time.time()
+    records = [{"level": "INFO", "message": f"[BENCH] line {i}", "ts": now} for i in range(10)]
+    r = client.post("/api/device-logs", json.dumps(records), content_type="application/json", **headers)
+    return r.status_code == 200
+
+
+def _file(client, sim, headers):
+    if sim.last_id is None:
+        return _status(client, sim, headers)
+    r = client.get("/api/file", {"command_id": sim.last_id}, **headers)
+    if r.status_code == 400:
+        # PLAY 가 아닌 명령 (STOP 등)
+        return True
+    if r.status_code != 200:
+        return False
+    for _ in r.streaming_content:
+        pass
+    return True
+
+
+def _ack(client, sim, headers):
+    if sim.last_id is None:
+        return _status(client, sim, headers)
+    body = {"command_id": sim.last_id, "fetched": time.time()}
+    r = client.post("/api/ack", json.dumps(body), content_type="application/json", **headers)
+    return r.status_code == 200
+
+
+_REQUESTS = {
+    "status": _status,
+    "device-logs": _device_logs,
+    "file": _file,
+    "ack": _ack,
+}
+
+
+def _dispatcher(devices, group, wav, interval, deadline, recorder, seed):
+    rng = random.Random(seed)
+    try:
+        while time.monotonic() < deadline:
+            # 측정용 그룹 = 측정용 장비 전체 (전체 명령 대신)
+            if rng.random() < 0.5:
+                name, targets, groups = "dispatch-group", None, [group]
+            else:
+                name, targets, groups = "dispatch-targeted", rng.sample(devices, max(1, len(devices) // 10)), None
+
+            start = time.perf_counter()
+            try:
+                dispatch_command(Command.Action.PLAY, wav=wav, devices=targets, groups=groups)
+                ok = True
+            except Exception:
+                ok = False
+            recorder.add(name, time.perf_counter() - start, ok)
+            time.sleep(interval)
+    finally:
+        connection.close()
+
+
+def run(devices=200, duration=10.0, concurrency=8, dispatch_interval=2.0, mix=None, seed=0):
+    """측정 후 결과 dict 를 돌려준다. 만든 데이터는 끝나면 지운다."""
+    mix = mix or DEFAULT_MIX
+    device_list, group, wav = provision(devices)
+    try:
+        sims = [_SimDevice(d) for d in device_list]
+        recorder = _Recorder()
+        deadline = time.monotonic() + duration
+
+        threads = [
+            threading.Thread(target=_worker, args=(sims, mix, deadline, recorder, seed + i))
+            for i in range(concurrency)
+        ]
+        if dispatch_interval > 0:
+            threads.append(threading.Thread(
+                target=_dispatcher,
+                args=(device_list, group, wav, dispatch_interval, deadline, recorder, seed - 1),
+            ))
+
+        started = time.monotonic()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.monotonic() - started
+    finally:
+        cleanup()
+        connections.close_all()
+
+    endpoints = {}
+    for name, values in sorted(recorder.latencies.items()):
+        values.sort()
+        endpoints[name] = {
+            "count": len(values),
+            "errors": recorder.errors[name],
+            "rps": round(len(values) / elapsed, 1),
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2),
+        }
+
+    total = sum(e["count"] for e in endpoints.values())
+    db = connections["default"]
+    return {
+        "devices": devices,
+        "duration_s": round(elapsed, 2),
+        "concurrency": concurrency,
+        "database": {"vendor": db.vendor, "engine": db.settings_dict["ENGINE"]},
+        "total": {
+            "count": total,
+            "errors": sum(e["errors"] for e in endpoints.values()),
+            "rps": round(total / elapsed, 1),
+        },
+        "endpoints": endpoints,
+    }
@@ -0,0 +1,41 @@
+"""
+시스템 체크 (manage.py check / runserver 시작 시, 배포용은 check --deploy)
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Tags, Warning, register
+
+# 프로세스별 캐시에서 명령 커서를 이보다 오래 두면 다른 워커의 새 명령을 늦게 받는다
+LOCAL_CACHE_MAX_TTL = 5
+
+
+@register(Tags.caches)
+def command_cache_check(app_configs, **kwargs):
+    if not isinstance(caches["default"], LocMemCache):
+        return []
+    if settings.COMMAND_CACHE_TTL <= LOCAL_CACHE_MAX_TTL:
+        return []
+    return [
+        Warning(
+            f"COMMAND_CACHE_TTL={settings.COMMAND_CACHE_TTL}초인데 캐시가 프로세스별(LocMemCache)입니다.",
+            hint=(
+                "워커가 여러 개면 다른 워커에서 만든 명령을 그만큼 늦게 받습니다. "
+                f"MFMC_REDIS_URL 로 공유 캐시를 쓰거나 COMMAND_CACHE_TTL 을 {LOCAL_CACHE_MAX_TTL}초 이하로 두세요."
+            ),
+            id="alert.W001",
+        )
+    ]
+
+
+@register(Tags.security, deploy=True)
+def metrics_token_check(app_configs, **kwargs):
+    if settings.METRICS_TOKEN:
+        return []
+    return [
+        Warning(
+            "METRICS_TOKEN 이 비어 있어 /metrics 가 404 를 돌려줍니다.",
+            hint="Prometheus 로 수집하려면 MFMC_METRICS_TOKEN 을 설정하세요.",
+            id="alert.W002",
+        )
+    ]
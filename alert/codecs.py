@@ -0,0 +1,152 @@
+"""
+음원 압축 변형 (무손실)
+
+원본 WAV 옆에 압축본을 만들어 두고, 클라이언트가 지원한다고 밝힌 것 중 가장 작은 것을 보낸다.
+
+- xz: PCM 프레임 크기만큼 delta 필터를 건 뒤 LZMA2 (표준 라이브러리 lzma 만으로 풀 수 있음)
+
+압축은 느리므로 장비 요청 경로에서는 만들지 않는다.
+관리자 업로드 뒤 별도 스레드에서, 또는 build_audio_variants 명령으로 만든다.
+"""
+import hashlib
+import logging
+import lzma
+import tempfile
+import threading
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connection, transaction
+
+from .wav import WavError, parse_wav
+
+CHUNK_SIZE = 64 * 1024
+
+# 원본 대비 이 비율보다 작아지지 않으면 압축본을 만들지 않는다
+MIN_SAVING_RATIO = 0.95
+
+logger = logging.getLogger(__name__)
+
+
+def _pcm_frame_size(f):
+    try:
+        return parse_wav(f).block_align
+    except WavError:
+        return None
+
+
+def encode_xz(src, dst):
+    frame_size = _pcm_frame_size(src)
+    filters = [{"id": lzma.FILTER_LZMA2, "preset": 6}]
+    if frame_size and frame_size <= 256:
+        filters.insert(0, {"id": lzma.FILTER_DELTA, "dist": frame_size})
+
+    compressor = lzma.LZMACompressor(format=lzma.FORMAT_XZ, filters=filters)
+    for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+        dst.write(compressor.compress(chunk))
+    dst.write(compressor.flush())
+
+
+ENCODERS = {
+    "xz": encode_xz,
+}
+
+
+def _encode_all(wav):
+    """임시 파일에 압축본을 만든다. {codec: (임시 파일, 크기, sha256)}"""
+    encoded = {}
+    for codec, encode in ENCODERS.items():
+        out = tempfile.TemporaryFile()
+        # FieldFile 은 인스턴스마다 파일 하나를 같이 쓰므로 저장소에서 따로 연다
+        with wav.file.storage.open(wav.file.name, "rb") as src:
+            encode(src, out)
+
+        size = out.tell()
+        if not wav.size or size > wav.size * MIN_SAVING_RATIO:
+            out.close()
+            continue
+
+        out.seek(0)
+        h = hashlib.sha256()
+        for chunk in iter(lambda: out.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+        out.seek(0)
+        encoded[codec] = (out, size, h.hexdigest())
+    return encoded
+
+
+def build_variants(wav):
+    """
+    wav 의 압축본을 모두 다시 만든다. 만든 codec 목록을 돌려준다.
+    압축은 잠금 없이 하고, 저장만 WavFile 행을 잠근 채 update_or_create 로 한다
+    (같은 음원을 동시에 만들어도 UniqueConstraint 에 걸리지 않음).
+    그 사이 음원이 바뀌었거나 지워졌으면 아무것도 저장하지 않는다.
+    """
+    from .models import WavFile, WavVariant
+
+    sha256 = wav.sha256
+    encoded = _encode_all(wav)
+    try:
+        with transaction.atomic():
+            locked = WavFile.objects.select_for_update().filter(pk=wav.pk, sha256=sha256).first()
+            if locked is None:
+                return []
+
+            stale = locked.variants.exclude(codec__in=list(encoded))
+            for old in stale:
+                old.file.delete(save=False)
+            stale.delete()
+
+            for codec, (out, size, digest) in encoded.items():
+                variant, _ = WavVariant.objects.update_or_create(
+                    wav=locked, codec=codec, defaults={"size": size, "sha256": digest}
+                )
+                old_name = variant.file.name
+                variant.file.save(f"{sha256}.wav.{codec}", File(out), save=True)
+                if old_name and old_name != variant.file.name:
+                    variant.file.storage.delete(old_name)
+    finally:
+        for out, _, _ in encoded.values():
+            out.close()
+    return list(encoded)
+
+
+_building = set()
+_building_lock = threading.Lock()
+
+
+def _build_in_thread(pk):
+    from .models import WavFile
+
+    try:
+        wav = WavFile.objects.filter(pk=pk).first()
+        if wav is not None:
+            build_variants(wav)
+    except Exception:
+        logger.exception("음원 %s 압축본 생성 실패", pk)
+    finally:
+        with _building_lock:
+            _building.discard(pk)
+        connection.close()
+
+
+def build_variants_in_background(pk):
+    """
+    관리자 업로드 뒤 압축본을 요청 밖(별도 스레드)에서 만든다.
+    같은 음원이 이미 만들어지는 중이면 건너뛴다 (못 만든 것은 build_audio_variants 로).
+    """
+    if not settings.WAV_VARIANTS_ON_UPLOAD:
+        return
+    with _building_lock:
+        if pk in _building:
+            return
+        _building.add(pk)
+    threading.Thread(target=_build_in_thread, args=(pk,), name=f"wav-variants-{pk}", daemon=True).start()
+
+
+def pick_variant(wav, accepted):
+    """클라이언트가 받을 수 있는 압축본 중 가장 작은 것 (없으면 None = 원본)."""
+    if not accepted:
+        return None
+    variants = [v for v in wav.variants.all() if v.codec in accepted and v.size < wav.size]
+    return min(variants, key=lambda v: v.size, default=None)
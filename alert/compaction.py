@@ -0,0 +1,90 @@
+"""
+오래된 명령 정리
+
+status/file 조회가 전체 이력을 끌고 다니지 않도록 오래된 Command 를
+CommandArchive 로 옮기거나(기본) 지운다.
+장비 커서가 가리키는 명령(최신 전체 명령, 각 장비/그룹의 last_command_id)은 남겨서
+오래된 last_id 를 가진 클라이언트도 계속 같은 최신 명령을 받는다.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+
+from .inbox import latest_all_devices_command_id
+from .models import Command, CommandArchive, Device, DeviceGroup
+
+
+def cursor_command_ids():
+    """장비 커서가 가리키고 있어서 지우면 안 되는 명령 ID."""
+    keep = set(
+        Device.objects
+        .filter(last_command_id__isnull=False)
+        .values_list("last_command_id", flat=True)
+        .distinct()
+    )
+    keep.update(
+        DeviceGroup.objects
+        .filter(last_command_id__isnull=False)
+        .values_list("last_command_id", flat=True)
+    )
+    latest_all = latest_all_devices_command_id()
+    if latest_all:
+        keep.add(latest_all)
+    return keep
+
+
+def _target_ids(through, column, command_ids):
+    targets = defaultdict(list)
+    for command_id, target_id in (
+        through.objects
+        .filter(command_id__in=command_ids)
+        .values_list("command_id", column)
+    ):
+        targets[command_id].append(target_id)
+    return targets
+
+
+def _archive(commands):
+    ids = [c.pk for c in commands]
+    targets = _target_ids(Command.targets.through, "device_id", ids)
+    groups = _target_ids(Command.target_groups.through, "devicegroup_id", ids)
+
+    CommandArchive.objects.bulk_create(
+        [
+            CommandArchive(
+                command_id=c.pk,
+                action=c.action,
+                wav_id=c.wav_id,
+                all_devices=c.all_devices,
+                target_ids=sorted(targets[c.pk]),
+                target_group_ids=sorted(groups[c.pk]),
+                play_at=c.play_at,
+                created_at=c.created_at,
+            )
+            for c in commands
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def compact_commands(qs, archive=True, batch_size=1000):
+    """
+    qs 의 명령을 batch_size 개씩 보관(또는 삭제)한다. 커서 명령은 건너뛴다.
+    처리한 건수를 돌려준다.
+    """
+    keep = cursor_command_ids()
+    qs = qs.exclude(pk__in=keep).order_by("pk")
+
+    total = 0
+    while True:
+        commands = list(qs.only("id", "action", "wav_id", "all_devices", "play_at", "created_at")[:batch_size])
+        if not commands:
+            return total
+        with transaction.atomic():
+            if archive:
+                _archive(commands)
+            ids = [c.pk for c in commands]
+            Command.targets.through.objects.filter(command_id__in=ids).delete()
+            Command.target_groups.through.objects.filter(command_id__in=ids).delete()
+            Command.objects.filter(pk__in=ids).delete()
+        total += len(commands)
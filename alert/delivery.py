@@ -0,0 +1,116 @@
+"""
+명령 전달 확인 (/api/ack) 과 지연 집계
+
+장비는 명령마다 fetched(명령 수신) / downloaded(음원 준비) / playing(재생 시작) 시각을 보고한다.
+예약 재생(play_at)이면 재생 시작이 play_at 에서 얼마나 어긋났는지(skew_ms)도 보고한다.
+같은 값은 처음 보고된 값만 남긴다.
+지연 = 명령 생성 시각부터 PLAY 는 playing, 그 외 명령과 예약 재생은 fetched 까지.
+"""
+import math
+
+from django.utils import timezone
+
+from .inbox import target_q
+from .models import Command, CommandDelivery
+
+STAGES = {
+    "fetched": "fetched_at",
+    "downloaded": "downloaded_at",
+    "playing": "playing_at",
+}
+# 단계 시각 외에 받는 값
+EXTRA_FIELDS = ("skew_ms",)
+
+
+def record_acks(device, acks):
+    """
+    acks: {command_id: {"fetched": datetime, ..., "skew_ms": int}}
+    대상이 아닌 명령은 무시한다. 반영한 명령 수를 돌려준다.
+    """
+    allowed = set(
+        Command.objects
+        .filter(pk__in=list(acks))
+        .filter(target_q(device))
+        .values_list("id", flat=True)
+        .distinct()
+    )
+    if not allowed:
+        return 0
+
+    existing = {
+        d.command_id: d
+        for d in CommandDelivery.objects.filter(device=device, command_id__in=allowed)
+    }
+
+    new, changed = [], []
+    for command_id in allowed:
+        values = {STAGES.get(k, k): v for k, v in acks[command_id].items()}
+        delivery = existing.get(command_id)
+        if delivery is None:
+            new.append(CommandDelivery(command_id=command_id, device=device, **values))
+            continue
+
+        dirty = False
+        for field, value in values.items():
+            if getattr(delivery, field) is None:
+                setattr(delivery, field, value)
+                dirty = True
+        if dirty:
+            changed.append(delivery)
+
+    # bulk_update 는 auto_now 를 채우지 않는다
+    now = timezone.now()
+    for delivery in changed:
+        delivery.updated_at = now
+
+    CommandDelivery.objects.bulk_create(new, ignore_conflicts=True)
+    CommandDelivery.objects.bulk_update(changed, [*STAGES.values(), *EXTRA_FIELDS, "updated_at"])
+    return len(allowed)
+
+
+def percentile(sorted_values, p):
+    """nearest-rank 백분위수."""
+    if not sorted_values:
+        return None
+    k = max(0, math.ceil(p * len(sorted_values) / 100) - 1)
+    return sorted_values[k]
+
+
+def delivery_stats(command_ids):
+    """
+    {command_id: {"acked": 장비 수, "p50": 초, "p95": 초, "max": 초, "skew": {...} 또는 None}}
+    (지연 값이 없으면 None, skew 는 |skew_ms| 의 p50/p95/max) — 명령 목록 전체를 쿼리 1번으로 집계.
+    """
+    rows = (
+        CommandDelivery.objects
+        .filter(command_id__in=command_ids)
+        .values_list(
+            "command_id", "command__action", "command__play_at", "command__created_at",
+            "fetched_at", "playing_at", "skew_ms",
+        )
+    )
+
+    latencies = {pk: [] for pk in command_ids}
+    skews = {pk: [] for pk in command_ids}
+    acked = dict.fromkeys(command_ids, 0)
+    for command_id, action, play_at, created_at, fetched_at, playing_at, skew_ms in rows:
+        acked[command_id] += 1
+        done = playing_at if action == Command.Action.PLAY and not play_at else fetched_at
+        if done:
+            # 장비 시계가 조금 빠르면 음수가 될 수 있어 0 으로 자른다
+            latencies[command_id].append(max(0.0, (done - created_at).total_seconds()))
+        if skew_ms is not None:
+            skews[command_id].append(abs(skew_ms))
+
+    stats = {}
+    for command_id, values in latencies.items():
+        values.sort()
+        skew = sorted(skews[command_id])
+        stats[command_id] = {
+            "acked": acked[command_id],
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "max": values[-1] if values else None,
+            "skew": {"p50": percentile(skew, 50), "p95": percentile(skew, 95), "max": skew[-1]} if skew else None,
+        }
+    return stats
@@ -0,0 +1,105 @@
+"""
+장비 last_seen_at 기록기
+
+폴링마다 Device 를 저장하지 않고 메모리에 모아 두었다가 주기적으로 한 번에 반영한다.
+- DB 값이 HEARTBEAT_RESOLUTION 초보다 오래됐을 때만 쓰기 대상이 된다.
+- 반영은 요청이 끝날 때(request_finished)와 프로세스 종료 시(atexit)에 한다.
+- 여러 프로세스가 같은 장비를 기록해도 DB 의 더 최근 값은 덮어쓰지 않는다.
+- 가장 최근 시각은 캐시에도 남겨서 어드민 화면에는 항상 최신 값이 보인다.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from .models import Device
+
+SEEN_KEY = "alert:seen:{}"
+
+BATCH_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+
+class HeartbeatRecorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+
+    def record(self, device, now=None):
+        now = now or timezone.now()
+        cache.set(SEEN_KEY.format(device.pk), now, settings.HEARTBEAT_CACHE_TTL)
+
+        stored = device.last_seen_at
+        if stored is None or (now - stored).total_seconds() >= settings.HEARTBEAT_RESOLUTION:
+            with self._lock:
+                self._pending[device.pk] = now
+
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if time.monotonic() - self._last_flush >= settings.HEARTBEAT_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+
+        if not pending:
+            return 0
+
+        items = list(pending.items())
+        for i in range(0, len(items), BATCH_SIZE):
+            batch = items[i : i + BATCH_SIZE]
+            # bulk_update 와 같은 CASE 문이지만, DB 값이 더 최근이면 그대로 둔다
+            newer = [
+                When(Q(pk=pk) & (Q(last_seen_at__isnull=True) | Q(last_seen_at__lt=seen)), then=Value(seen))
+                for pk, seen in batch
+            ]
+            Device.objects.filter(pk__in=[pk for pk, _ in batch]).update(
+                last_seen_at=Case(*newer, default=F("last_seen_at"))
+            )
+        return len(pending)
+
+    def flush_at_exit(self):
+        try:
+            self.flush()
+        except DatabaseError as e:
+            # 캐시에는 남아 있으므로 다음 기록 때 다시 채워진다
+            logger.info("종료 시 last_seen_at 반영 실패: %s", e)
+
+
+heartbeats = HeartbeatRecorder()
+atexit.register(heartbeats.flush_at_exit)
+
+
+def flush_heartbeats(**kwargs):
+    """request_finished 수신: 폴링이 뜸해도 쌓인 기록을 늦지 않게 반영한다."""
+    heartbeats.maybe_flush()
+
+
+def last_seen(device):
+    """DB 값과 아직 반영되지 않은 캐시 값 중 최신 시각."""
+    seen = cache.get(SEEN_KEY.format(device.pk))
+    if seen and (device.last_seen_at is None or seen > device.last_seen_at):
+        return seen
+    return device.last_seen_at
+
+
+def apply_last_seen(devices):
+    """장비 목록의 last_seen_at 을 캐시 값으로 한 번에 갱신 (화면 표시용)."""
+    devices = list(devices)
+    cached = cache.get_many([SEEN_KEY.format(d.pk) for d in devices])
+    for d in devices:
+        seen = cached.get(SEEN_KEY.format(d.pk))
+        if seen and (d.last_seen_at is None or seen > d.last_seen_at):
+            d.last_seen_at = seen
+    return devices
@@ -0,0 +1,220 @@
+"""
+장비별 명령 수신함
+
+status 조회 때마다 Command 전체를 OR+JOIN+DISTINCT 로 뒤지지 않도록
+- 전체 명령: (all_devices, id) 인덱스로 최신 1건
+- 지정 명령: Device.last_command_id (명령 생성 시 갱신)
+- 그룹 명령: DeviceGroup.last_command_id. 소속 장비마다 쓰지 않고, 읽을 때 장비의 그룹 목록으로 찾는다
+  (그룹에 들어올 때의 커서(join_cursor)보다 큰 것만. 들어오기 전 명령은 받지 않는다)
+셋 중 가장 큰 값이 그 장비의 최신 명령이다.
+
+값들은 캐시에도 올려 두어서(alert.signals 에서 커밋 후 갱신) 새 명령이 없는 폴링은 SQL 없이 끝난다.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import BroadcastLog, Command, Device, DeviceGroup, DeviceGroupMembership
+from .notify import notify_command_created
+
+ALL_KEY = "alert:cmd:all"
+DEVICE_KEY = "alert:cmd:device:{}"
+GROUP_KEY = "alert:cmd:group:{}"
+# 장비가 속한 그룹 [(그룹 ID, join_cursor), ...]
+MEMBERSHIP_KEY = "alert:groups:device:{}"
+
+
+def _update_cursors(model, command, ids):
+    if not ids:
+        return 0
+    return (
+        model.objects
+        .filter(pk__in=ids)
+        .filter(Q(last_command_id__isnull=True) | Q(last_command_id__lt=command.id))
+        .update(last_command_id=command.id)
+    )
+
+
+def update_device_cursors(command, device_ids):
+    """지정 명령 대상 장비들의 last_command_id 를 갱신 (UPDATE 1회)."""
+    return _update_cursors(Device, command, device_ids)
+
+
+def update_group_cursors(command, group_ids):
+    """그룹 명령 대상 그룹들의 last_command_id 를 갱신 (소속 장비 수와 상관없이 UPDATE 1회)."""
+    return _update_cursors(DeviceGroup, command, group_ids)
+
+
+def set_join_cursors(memberships):
+    """새 소속의 join_cursor 를 그룹의 지금 last_command_id 로 맞춘다 (UPDATE 1회)."""
+    group_cursor = DeviceGroup.objects.filter(pk=OuterRef("group_id")).values("last_command_id")[:1]
+    return memberships.update(join_cursor=Coalesce(Subquery(group_cursor), 0))
+
+
+def target_q(device):
+    """이 장비가 받는 명령 조건 (전체 / 장비 지정 / 들어온 뒤의 소속 그룹 지정)."""
+    return (
+        Q(all_devices=True)
+        | Q(targets=device)
+        | Q(
+            target_groups__memberships__device=device,
+            pk__gt=F("target_groups__memberships__join_cursor"),
+        )
+    )
+
+
+def is_target(command, device):
+    if command.all_devices:
+        return True
+    return Command.objects.filter(pk=command.pk).filter(target_q(device)).exists()
+
+
+def command_recipients(command):
+    """명령을 받을 장비 (지정 장비 + 명령 전에 지정 그룹에 들어와 있던 장비)."""
+    if command.all_devices:
+        return Device.objects.filter(is_active=True)
+    return (
+        Device.objects
+        .filter(
+            Q(commands=command)
+            | Q(group_memberships__group__commands=command, group_memberships__join_cursor__lt=command.pk)
+        )
+        .distinct()
+    )
+
+
+def dispatch_command(action, wav=None, devices=None, groups=None, executed_by=None, play_at=None):
+    """
+    명령 생성. devices 와 groups 가 모두 None 이면 전체 장비 명령.
+    play_at 이 있으면 장비들이 그 시각(서버 시계)에 맞춰 재생한다.
+    그룹 명령은 그룹 수만큼만 기록한다 (소속 장비 수와 무관).
+    executed_by 가 있으면 같은 트랜잭션에서 BroadcastLog 도 남긴다 (명령과 연결).
+    커밋 후 대기 중인 long-poll/스트림을 깨운다.
+    """
+    all_devices = devices is None and groups is None
+    devices = list(devices or [])
+    groups = list(groups or [])
+    if devices and groups:
+        # 고른 그룹에 이미 속한 장비는 따로 지정하지 않는다
+        members = set(
+            DeviceGroupMembership.objects
+            .filter(group__in=groups, device__in=devices)
+            .values_list("device_id", flat=True)
+        )
+        devices = [d for d in devices if d.pk not in members]
+
+    with transaction.atomic():
+        cmd = Command.objects.create(action=action, wav=wav, all_devices=all_devices, play_at=play_at)
+        # 장비/그룹 커서는 m2m 추가 시그널에서 갱신한다 (alert.signals)
+        if devices:
+            cmd.targets.set(devices)
+        if groups:
+            cmd.target_groups.set(groups)
+        if executed_by is not None:
+            log = BroadcastLog.objects.create(
+                action=action,
+                wav=wav,
+                executed_by=executed_by,
+                all_devices=all_devices,
+                command=cmd,
+            )
+            if devices:
+                log.targets.set(devices)
+            if groups:
+                log.target_groups.set(groups)
+        notify_command_created()
+    return cmd
+
+
+def latest_all_devices_command_id():
+    return (
+        Command.objects
+        .filter(all_devices=True)
+        .order_by("-id")
+        .values_list("id", flat=True)
+        .first()
+    )
+
+
+def bump_cached_cursor(key, command_id):
+    """커밋된 새 명령 ID 를 캐시에 반영 (더 큰 값만)."""
+    current = cache.get(key)
+    if current is None or current < command_id:
+        cache.set(key, command_id, settings.COMMAND_CACHE_TTL)
+
+
+def forget_cached_cursors(device_ids=(), all_devices=False, group_ids=()):
+    keys = [DEVICE_KEY.format(pk) for pk in device_ids]
+    keys += [GROUP_KEY.format(pk) for pk in group_ids]
+    if all_devices:
+        keys.append(ALL_KEY)
+    cache.delete_many(keys)
+
+
+def forget_memberships(device_ids):
+    cache.delete_many([MEMBERSHIP_KEY.format(pk) for pk in device_ids])
+
+
+def latest_group_command_id(memberships):
+    """
+    memberships: [(그룹 ID, join_cursor), ...]
+    들어온 뒤에 내려진 그룹 명령 ID 중 최댓값 (캐시에 없는 그룹만 DB 에서 읽는다).
+    """
+    join_cursors = dict(memberships)
+    keys = {GROUP_KEY.format(pk): pk for pk in join_cursors}
+    cursors = {keys[key]: command_id for key, command_id in cache.get_many(list(keys)).items()}
+
+    missing = [pk for pk in join_cursors if pk not in cursors]
+    if missing:
+        for pk, command_id in DeviceGroup.objects.filter(pk__in=missing).values_list("id", "last_command_id"):
+            cache.add(GROUP_KEY.format(pk), command_id or 0, settings.COMMAND_CACHE_TTL)
+            cursors[pk] = command_id or 0
+    return max((c for pk, c in cursors.items() if c > join_cursors[pk]), default=0)
+
+
+def latest_command_id(device):
+    """
+    캐시에 있으면 SQL 없이, 없으면 DB 에서 읽어서 캐시에 채운다.
+    (캐시는 add 로만 채워서 커밋 후 갱신된 값을 덮어쓰지 않는다)
+    """
+    device_key = DEVICE_KEY.format(device.pk)
+    membership_key = MEMBERSHIP_KEY.format(device.pk)
+    cached = cache.get_many([ALL_KEY, device_key, membership_key])
+
+    all_id = cached.get(ALL_KEY)
+    if all_id is None:
+        all_id = latest_all_devices_command_id() or 0
+        cache.add(ALL_KEY, all_id, settings.COMMAND_CACHE_TTL)
+
+    device_id = cached.get(device_key)
+    if device_id is None:
+        device_id = (
+            Device.objects
+            .filter(pk=device.pk)
+            .values_list("last_command_id", flat=True)
+            .first()
+        ) or 0
+        cache.add(device_key, device_id, settings.COMMAND_CACHE_TTL)
+
+    # 소속 그룹은 (device_id) 인덱스로 찾는다
+    memberships = cached.get(membership_key)
+    if memberships is None:
+        memberships = list(
+            DeviceGroupMembership.objects
+            .filter(device_id=device.pk)
+            .values_list("group_id", "join_cursor")
+        )
+        cache.add(membership_key, memberships, settings.COMMAND_CACHE_TTL)
+    group_id = latest_group_command_id(memberships) if memberships else 0
+
+    return max(all_id, device_id, group_id) or None
+
+
+def latest_command(device, last_id=None):
+    """last_id 보다 새 명령이 있으면 그 중 최신 명령, 없으면 None."""
+    latest = latest_command_id(device)
+    if latest is None or (last_id is not None and latest <= last_id):
+        return None
+    return Command.objects.select_related("wav").filter(pk=latest).first()
@@ -0,0 +1,63 @@
+"""
+음원 라이브러리 manifest / 사전 배포 현황
+
+목록은 캐시에 올려 두고 WavFile 이 저장·삭제되면 지운다(alert.signals).
+지우는 것은 이 프로세스의 캐시뿐일 수 있으므로(LocMem) 유지 시간은 명령 커서와 같게 짧게 둔다.
+해시가 아직 없는 예전 음원은 목록에서 빠진다 (manage.py build_audio_variants 가 채움).
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import WavFile
+
+MANIFEST_KEY = "alert:manifest"
+
+
+def build_manifest():
+    """(파일 목록, ETag)"""
+    cached = cache.get(MANIFEST_KEY)
+    if cached:
+        return cached
+
+    files = []
+    for w in WavFile.objects.order_by("id"):
+        if not w.file or not w.sha256:
+            continue
+        files.append({
+            "id": w.id,
+            "title": w.title,
+            "sha256": w.sha256,
+            "size": w.size,
+            "duration_ms": w.duration_ms,
+            "predistribute": w.predistribute,
+        })
+    body = json.dumps(files, sort_keys=True).encode("utf-8")
+    result = (files, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+    cache.set(MANIFEST_KEY, result, settings.COMMAND_CACHE_TTL)
+    return result
+
+
+def forget_manifest():
+    cache.delete(MANIFEST_KEY)
+
+
+def predistributed_hashes():
+    files, _ = build_manifest()
+    return {f["sha256"] for f in files if f["predistribute"]}
+
+
+def prefetch_coverage(device, wanted=None):
+    """(보유한 사전 배포 음원 수, 전체 사전 배포 음원 수)"""
+    if wanted is None:
+        wanted = predistributed_hashes()
+    return len(wanted.intersection(device.cached_hashes or [])), len(wanted)
+
+
+def apply_prefetch_coverage(devices):
+    """목록 화면용: manifest 를 한 번만 읽고 장비마다 prefetch_coverage 를 붙인다."""
+    wanted = predistributed_hashes()
+    for device in devices:
+        device.prefetch_coverage = prefetch_coverage(device, wanted)
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from alert.inbox import forget_cached_cursors, forget_memberships
+from alert.models import Command as BroadcastCommand
+from alert.models import Device, DeviceGroup, DeviceGroupMembership
+
+
+def _recompute(model, targets, column, batch_size):
+    """명령 대상 테이블(targets)의 최대 command_id 로 model.last_command_id 를 맞춘다. 바뀐 행 ID 목록."""
+    latest = dict(
+        targets.objects
+        .values(column)
+        .annotate(latest=Max("command_id"))
+        .values_list(column, "latest")
+    )
+
+    changed = []
+    for obj in model.objects.only("id", "last_command_id"):
+        value = latest.get(obj.pk)
+        if obj.last_command_id != value:
+            obj.last_command_id = value
+            changed.append(obj)
+
+    model.objects.bulk_update(changed, ["last_command_id"], batch_size=batch_size)
+    return [obj.pk for obj in changed]
+
+
+class Command(BaseCommand):
+    help = (
+        "명령 이력으로부터 장비/그룹별 최신 지정 명령 ID(last_command_id)를 다시 계산하고, "
+        "시그널 없이 만들어진 그룹 소속(join_cursor=0)의 가입 커서를 들어온 시각 기준으로 채웁니다."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+
+        device_ids = _recompute(Device, BroadcastCommand.targets.through, "device_id", batch_size)
+        forget_cached_cursors(device_ids)
+
+        group_ids = _recompute(DeviceGroup, BroadcastCommand.target_groups.through, "devicegroup_id", batch_size)
+        forget_cached_cursors(group_ids=group_ids)
+
+        # 들어오기 전에 그룹에 내려진 명령 중 마지막 것 (없으면 0 = 그룹 명령을 모두 받음)
+        before_join = (
+            BroadcastCommand.target_groups.through.objects
+            .filter(devicegroup_id=OuterRef("group_id"), command__created_at__lt=OuterRef("joined_at"))
+            .order_by("-command_id")
+            .values("command_id")[:1]
+        )
+        unset = dict(DeviceGroupMembership.objects.filter(join_cursor=0).values_list("id", "device_id"))
+        memberships = DeviceGroupMembership.objects.filter(pk__in=list(unset))
+        memberships.update(join_cursor=Coalesce(Subquery(before_join), 0))
+        joined = memberships.filter(join_cursor__gt=0).count()
+        forget_memberships(set(unset.values()))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"장비 {len(device_ids)}대, 그룹 {len(group_ids)}개 커서 갱신, 그룹 소속 {joined}건 가입 커서 채움"
+        ))
@@ -0,0 +1,106 @@
+import json
+import platform
+import subprocess
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from alert import benchmark
+
+
+def _git_revision():
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5,
+        )
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "가상 장비로 API 부하를 걸어 endpoint 별 처리량과 p50/p99 지연을 측정합니다. "
+        "DB 는 현재 설정(DATABASES)을 그대로 사용하고, 결과는 JSON 으로 저장합니다. "
+        "테스트/측정용 DB(이름이 test 로 시작하거나 bench 포함)가 아니면 --i-know 가 필요합니다."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--devices", type=int, default=200, help="가상 장비 수")
+        parser.add_argument("--duration", type=float, default=10.0, help="측정 시간(초)")
+        parser.add_argument("--concurrency", type=int, default=8, help="동시 요청 스레드 수")
+        parser.add_argument("--dispatch-interval", type=float, default=2.0, help="PLAY 명령 생성 주기(초), 0=생성 안 함")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--label", default="", help="결과 파일 이름에 붙일 표시")
+        parser.add_argument("--output", default=str(Path(settings.BASE_DIR) / "benchmarks"), help="결과 저장 폴더")
+        parser.add_argument("--no-save", action="store_true", help="결과 파일을 만들지 않음")
+        parser.add_argument("--compare", help="비교할 이전 결과 JSON 파일")
+        parser.add_argument(
+            "--i-know", action="store_true", dest="i_know",
+            help="테스트/측정용 DB 가 아니어도 실행 (측정용 장비/그룹/명령을 만들고 끝나면 지운다)",
+        )
+
+    def handle(self, *args, **options):
+        if options["devices"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--devices 와 --concurrency 는 1 이상이어야 합니다.")
+        if not options["i_know"] and not benchmark.is_scratch_database():
+            raise CommandError(
+                "테스트/측정용 DB 가 아닙니다. 운영 DB 에서 측정하려면 --i-know 를 붙이세요."
+            )
+
+        result = benchmark.run(
+            devices=options["devices"],
+            duration=options["duration"],
+            concurrency=options["concurrency"],
+            dispatch_interval=options["dispatch_interval"],
+            seed=options["seed"],
+        )
+        result.update({
+            "label": options["label"],
+            "revision": _git_revision(),
+            "started_at": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+        })
+
+        self._print(result)
+
+        if options["compare"]:
+            self._compare(result, json.loads(Path(options["compare"]).read_text(encoding="utf-8")))
+
+        if not options["no_save"]:
+            out_dir = Path(options["output"])
+            out_dir.mkdir(parents=True, exist_ok=True)
+            name = timezone.localtime().strftime("%Y%m%d-%H%M%S")
+            suffix = options["label"] or result["database"]["vendor"]
+            path = out_dir / f"{name}-{suffix}.json"
+            path.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+            self.stdout.write(self.style.SUCCESS(f"결과 저장: {path}"))
+
+    def _print(self, result):
+        self.stdout.write(
+            f"장비 {result['devices']}대, 스레드 {result['concurrency']}개, "
+            f"{result['duration_s']}초, DB={result['database']['vendor']}"
+        )
+        self.stdout.write(f"{'endpoint':<20}{'count':>8}{'err':>6}{'rps':>9}{'p50ms':>9}{'p99ms':>9}{'maxms':>9}")
+        for name, e in result["endpoints"].items():
+            self.stdout.write(
+                f"{name:<20}{e['count']:>8}{e['errors']:>6}{e['rps']:>9}{e['p50_ms']:>9}{e['p99_ms']:>9}{e['max_ms']:>9}"
+            )
+        t = result["total"]
+        self.stdout.write(f"{'total':<20}{t['count']:>8}{t['errors']:>6}{t['rps']:>9}")
+
+    def _compare(self, result, previous):
+        self.stdout.write(f"\n이전 결과와 비교 ({previous.get('revision')} {previous.get('label')})")
+        for name, e in result["endpoints"].items():
+            old = previous.get("endpoints", {}).get(name)
+            if not old:
+                continue
+            self.stdout.write(
+                f"{name:<20} rps {old['rps']} -> {e['rps']}  p99 {old['p99_ms']} -> {e['p99_ms']}ms"
+            )
+        self.stdout.write(f"{'total':<20} rps {previous['total']['rps']} -> {result['total']['rps']}")
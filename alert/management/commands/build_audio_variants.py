@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from alert.codecs import build_variants
+from alert.library import forget_manifest
+from alert.models import WavFile
+
+
+class Command(BaseCommand):
+    help = (
+        "방송 음원의 압축본(WavVariant)을 다시 만듭니다. 기본은 압축본이 없는 음원만. "
+        "해시가 없는 예전 음원은 해시/메타데이터도 채웁니다 (그 전에는 manifest 에 나오지 않음)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="이미 압축본이 있는 음원도 다시 생성")
+
+    def handle(self, *args, **options):
+        qs = WavFile.objects.order_by("id")
+        if not options["all"]:
+            qs = qs.filter(Q(variants__isnull=True) | Q(sha256="")).distinct()
+
+        backfilled = False
+        for wav in qs:
+            if not wav.file:
+                continue
+            if not wav.sha256:
+                wav.backfill_file_info()
+                backfilled = True
+            created = build_variants(wav)
+            self.stdout.write(f"{wav.pk} {wav}: {', '.join(created) or '압축 효과 없음'}")
+        if backfilled:
+            # backfill 은 시그널을 거치지 않는다
+            forget_manifest()
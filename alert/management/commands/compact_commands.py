@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from alert.compaction import compact_commands
+from alert.models import Command as BroadcastCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "보관 기간이 지난 방송 명령을 CommandArchive 로 옮깁니다 (장비 커서가 가리키는 명령은 유지). "
+        "작업 스케줄러/cron 으로 주기 실행하면 됩니다."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=settings.COMMAND_RETENTION_DAYS,
+            help="이 기간(일)보다 오래된 PLAY/STOP 명령을 정리",
+        )
+        parser.add_argument(
+            "--ping-days", type=int, default=settings.COMMAND_PING_RETENTION_DAYS,
+            help="이 기간(일)보다 오래된 PING(연결 확인) 명령을 정리",
+        )
+        parser.add_argument("--delete", action="store_true", help="보관하지 않고 바로 삭제")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        archive = not options["delete"]
+        batch_size = options["batch_size"]
+
+        pings = compact_commands(
+            BroadcastCommand.objects.filter(
+                action=BroadcastCommand.Action.PING,
+                created_at__lt=now - timedelta(days=options["ping_days"]),
+            ),
+            archive=archive,
+            batch_size=batch_size,
+        )
+        others = compact_commands(
+            BroadcastCommand.objects.filter(created_at__lt=now - timedelta(days=options["days"])),
+            archive=archive,
+            batch_size=batch_size,
+        )
+
+        verb = "보관" if archive else "삭제"
+        self.stdout.write(self.style.SUCCESS(f"PING {pings}건, 그 외 명령 {others}건 {verb}"))
@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from alert.retention import delete_old_logs, rollup_heartbeats
+
+
+class Command(BaseCommand):
+    help = "오래된 하트비트 로그를 일별 요약으로 합치고, 보관 기간이 지난 장비 로그를 지웁니다."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--heartbeat-days", type=int, default=settings.DEVICE_LOG_HEARTBEAT_RETENTION_DAYS,
+            help="이 기간(일)보다 오래된 하트비트 로그는 일별 요약으로 옮김",
+        )
+        parser.add_argument(
+            "--days", type=int, default=settings.DEVICE_LOG_RETENTION_DAYS,
+            help="이 기간(일)보다 오래된 로그는 삭제",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        batch_size = options["batch_size"]
+
+        rolled = rollup_heartbeats(now - timedelta(days=options["heartbeat_days"]), batch_size)
+        deleted = delete_old_logs(now - timedelta(days=options["days"]), batch_size)
+        self.stdout.write(self.style.SUCCESS(f"하트비트 {rolled}건 요약, 오래된 로그 {deleted}건 삭제"))
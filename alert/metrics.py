@@ -0,0 +1,297 @@
+"""
+운영 지표 (Prometheus text format, /metrics)
+
+- MetricsMiddleware: view 별 요청 수, 응답 시간/크기 히스토그램, ORM 쿼리 수/시간
+- 장비/명령/로그 게이지는 /metrics 를 읽을 때 DB 에서 계산
+
+값은 프로세스 메모리에만 있다 (워커가 여러 개면 워커별 값).
+요청마다 하는 일은 잠금 1번 + 숫자 몇 개 더하기라서 운영에서 켜 두어도 된다.
+"""
+import bisect
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, F, Q
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}    # (view, method, status) -> 건수
+        self.latency = {}     # view -> Histogram
+        self.size = {}        # view -> Histogram
+        self.queries = {}     # view -> [쿼리 수, 쿼리 시간]
+        self.counters = {}    # 이름 -> 값
+
+    def observe_request(self, view, method, status, seconds, size, queries, query_seconds):
+        with self._lock:
+            key = (view, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+            if view not in self.latency:
+                self.latency[view] = Histogram(LATENCY_BUCKETS)
+                self.size[view] = Histogram(SIZE_BUCKETS)
+                self.queries[view] = [0, 0.0]
+            self.latency[view].observe(seconds)
+            if size is not None:
+                self.size[view].observe(size)
+            q = self.queries[view]
+            q[0] += queries
+            q[1] += query_seconds
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "latency": {k: (list(h.counts), h.sum, h.count) for k, h in self.latency.items()},
+                "size": {k: (list(h.counts), h.sum, h.count) for k, h in self.size.items()},
+                "queries": {k: tuple(v) for k, v in self.queries.items()},
+                "counters": dict(self.counters),
+            }
+
+
+registry = Registry()
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+def _install_counter(counter):
+    connection.execute_wrappers.append(counter)
+
+
+def _remove_counter(counter):
+    connection.execute_wrappers.remove(counter)
+
+
+def _view_label(request):
+    match = getattr(request, "resolver_match", None)
+    # 매칭되지 않은 URL 은 하나로 묶어서 라벨 개수가 늘지 않게 한다
+    return (match.view_name or match.url_name or "-") if match else "unmatched"
+
+
+def _response_size(response):
+    if response.streaming:
+        length = response.get("Content-Length")
+        return int(length) if length and length.isdigit() else None
+    return len(response.content)
+
+
+class MetricsMiddleware:
+    """
+    요청 수/응답 시간/응답 크기/쿼리 수를 view 별로 기록.
+    ASGI 에서는 sync view 와 sync_to_async 로 돈 쿼리가 요청별 스레드(thread_sensitive)에서
+    실행되므로, 카운터도 그 스레드의 연결에 건다. 응답을 돌려준 뒤(스트리밍 중) 쿼리는 세지 않는다.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        counter = _QueryCounter()
+        start = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        self._record(request, response, time.perf_counter() - start, counter)
+        return response
+
+    async def __acall__(self, request):
+        counter = _QueryCounter()
+        start = time.perf_counter()
+        await sync_to_async(_install_counter, thread_sensitive=True)(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(_remove_counter, thread_sensitive=True)(counter)
+        self._record(request, response, time.perf_counter() - start, counter)
+        return response
+
+    def _record(self, request, response, seconds, counter):
+        registry.observe_request(
+            _view_label(request),
+            request.method,
+            response.status_code,
+            seconds,
+            _response_size(response),
+            counter.count,
+            counter.seconds,
+        )
+
+
+def _esc(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _histogram_lines(name, buckets, data):
+    lines = []
+    for view, (counts, total, count) in sorted(data.items()):
+        cumulative = 0
+        for bound, c in zip(buckets, counts):
+            cumulative += c
+            lines.append(f'{name}_bucket{{view="{_esc(view)}",le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{view="{_esc(view)}",le="+Inf"}} {count}')
+        lines.append(f'{name}_sum{{view="{_esc(view)}"}} {total}')
+        lines.append(f'{name}_count{{view="{_esc(view)}"}} {count}')
+    return lines
+
+
+def _gauges():
+    from .models import Command, CommandDelivery, Device, DeviceLog
+
+    now = timezone.now()
+    devices = Device.objects.filter(is_active=True).aggregate(
+        active=Count("id"),
+        online=Count("id", filter=Q(last_seen_at__gte=now - timedelta(seconds=settings.METRICS_ONLINE_WINDOW))),
+    )
+
+    # 최근 명령 중 아직 받아가지 않은 장비가 있는 것
+    # (대상/그룹 소속/전달 기록을 한 번에 JOIN 하면 행이 곱해지므로 따로 센다)
+    recent = dict(
+        Command.objects
+        .filter(created_at__gte=now - timedelta(seconds=settings.METRICS_PENDING_WINDOW))
+        .values_list("id", "all_devices")
+    )
+    ids = list(recent)
+
+    def per_command(qs, count):
+        return dict(qs.filter(command_id__in=ids).values("command_id").annotate(n=count).values_list("command_id", "n"))
+
+    direct = per_command(Command.targets.through.objects, Count("id"))
+    # 그룹 명령은 명령 전에 들어와 있던 장비만 (alert.inbox 의 join_cursor)
+    grouped = per_command(
+        Command.target_groups.through.objects,
+        Count(
+            "devicegroup__memberships__device",
+            filter=Q(devicegroup__memberships__join_cursor__lt=F("command_id")),
+            distinct=True,
+        ),
+    )
+    fetched = per_command(CommandDelivery.objects.filter(fetched_at__isnull=False), Count("id"))
+
+    pending_commands = pending_deliveries = 0
+    for command_id, all_devices in recent.items():
+        expected = devices["active"] if all_devices else direct.get(command_id, 0) + grouped.get(command_id, 0)
+        missing = max(0, expected - fetched.get(command_id, 0))
+        if missing:
+            pending_commands += 1
+            pending_deliveries += missing
+
+    recent_logs = DeviceLog.objects.filter(
+        created_at__gte=now - timedelta(seconds=settings.METRICS_LOG_RATE_WINDOW)
+    ).count()
+
+    return [
+        ("mfmc_devices_active", "활성 장비 수", devices["active"]),
+        ("mfmc_devices_online", "최근 접속한 활성 장비 수", devices["online"]),
+        ("mfmc_pending_commands", "아직 모든 대상이 받지 않은 최근 명령 수", pending_commands),
+        ("mfmc_pending_deliveries", "최근 명령 중 받지 않은 (명령, 장비) 수", pending_deliveries),
+        ("mfmc_device_logs_per_second", "최근 장비 로그 유입량 (건/초)", recent_logs / settings.METRICS_LOG_RATE_WINDOW),
+    ]
+
+
+def render():
+    snap = registry.snapshot()
+    lines = [
+        "# HELP mfmc_http_requests_total 처리한 요청 수",
+        "# TYPE mfmc_http_requests_total counter",
+    ]
+    for (view, method, status), count in sorted(snap["requests"].items()):
+        lines.append(
+            f'mfmc_http_requests_total{{view="{_esc(view)}",method="{method}",status="{status}"}} {count}'
+        )
+
+    lines += [
+        "# HELP mfmc_http_request_duration_seconds 응답 시간",
+        "# TYPE mfmc_http_request_duration_seconds histogram",
+    ]
+    lines += _histogram_lines("mfmc_http_request_duration_seconds", LATENCY_BUCKETS, snap["latency"])
+    lines += [
+        "# HELP mfmc_http_response_size_bytes 응답 크기 (스트리밍은 Content-Length 가 있을 때만)",
+        "# TYPE mfmc_http_response_size_bytes histogram",
+    ]
+    lines += _histogram_lines("mfmc_http_response_size_bytes", SIZE_BUCKETS, snap["size"])
+
+    lines += [
+        "# HELP mfmc_db_queries_total 요청 처리 중 실행한 SQL 수",
+        "# TYPE mfmc_db_queries_total counter",
+    ]
+    lines += [f'mfmc_db_queries_total{{view="{_esc(v)}"}} {q[0]}' for v, q in sorted(snap["queries"].items())]
+    lines += [
+        "# HELP mfmc_db_query_seconds_total 요청 처리 중 SQL 실행 시간",
+        "# TYPE mfmc_db_query_seconds_total counter",
+    ]
+    lines += [f'mfmc_db_query_seconds_total{{view="{_esc(v)}"}} {q[1]}' for v, q in sorted(snap["queries"].items())]
+
+    lines += [
+        "# HELP mfmc_device_logs_ingested_total 받은 장비 로그 수",
+        "# TYPE mfmc_device_logs_ingested_total counter",
+        f'mfmc_device_logs_ingested_total {snap["counters"].get("device_logs", 0)}',
+    ]
+
+    for name, help_text, value in _gauges():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+
+    return "\n".join(lines) + "\n"
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Prometheus 수집용. METRICS_TOKEN 이 설정돼 있으면 Bearer 토큰이 맞아야 한다.
+    토큰이 없으면 DEBUG 에서만 열고, 운영에서는 404 (장비 수/이름이 공개되지 않도록).
+    """
+    token = settings.METRICS_TOKEN
+    if not token and not settings.DEBUG:
+        return HttpResponse(status=404)
+    if token:
+        header = request.headers.get("Authorization", "")
+        if not header.startswith("Bearer ") or not constant_time_compare(header[7:], token):
+            return HttpResponse(status=401)
+
+    return HttpResponse(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,96 @@
+# Generated by Django 5.2.18
+
+# 원래(변경 전) 스키마. 이후 변경은 0002 부터 기능별로 나눠 둔다.
+# 이미 스키마가 있는 DB(직접 makemigrations 로 만들었거나 최신 스키마 전체를 한 번에 만든 DB)는
+# 표를 다시 만들지 않도록 기록만 맞춘다:  python manage.py migrate alert --fake
+
+import alert.models
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WavFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200, verbose_name='방송명')),
+                ('description', models.TextField(blank=True, verbose_name='상세 설명')),
+                ('file', models.FileField(upload_to='audios/', validators=[alert.models.validate_wav_file])),
+                ('uploaded_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': '방송 음원',
+                'verbose_name_plural': '방송 음원',
+            },
+        ),
+        migrations.CreateModel(
+            name='Device',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, default='', max_length=100)),
+                ('is_active', models.BooleanField(default=True)),
+                ('last_seen_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='device', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': '방송 장비',
+                'verbose_name_plural': '방송 장비',
+            },
+        ),
+        migrations.CreateModel(
+            name='DeviceLog',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(default='INFO', max_length=20)),
+                ('message', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='logs', to='alert.device')),
+            ],
+            options={
+                'verbose_name': '장비 로그',
+                'verbose_name_plural': '장비 로그',
+            },
+        ),
+        migrations.CreateModel(
+            name='Command',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('PLAY', 'PLAY'), ('STOP', 'STOP'), ('PING', 'PING')], max_length=10)),
+                ('all_devices', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('targets', models.ManyToManyField(blank=True, related_name='commands', to='alert.device')),
+                ('wav', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='alert.wavfile')),
+            ],
+            options={
+                'verbose_name': '방송 명령',
+                'verbose_name_plural': '방송 명령',
+            },
+        ),
+        migrations.CreateModel(
+            name='BroadcastLog',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(max_length=10)),
+                ('all_devices', models.BooleanField(default=False)),
+                ('executed_at', models.DateTimeField(auto_now_add=True)),
+                ('executed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='broadcast_logs', to=settings.AUTH_USER_MODEL)),
+                ('targets', models.ManyToManyField(blank=True, related_name='broadcast_logs', to='alert.device')),
+                ('wav', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='broadcast_logs', to='alert.wavfile')),
+            ],
+            options={
+                'verbose_name': '방송 로그',
+                'verbose_name_plural': '방송 로그',
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alert', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='last_command_id',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='command',
+            index=models.Index(fields=['all_devices', '-id'], name='alert_cmd_all_devices_id_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alert', '0002_command_cursors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wavfile',
+            name='sha256',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='wavfile',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alert', '0003_wavfile_sha256'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='cache_reported_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='cached_hashes',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='wavfile',
+            name='predistribute',
+            field=models.BooleanField(default=False, verbose_name='사전 배포'),
+        ),
+        migrations.AddField(
+            model_name='wavfile',
+            name='size',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
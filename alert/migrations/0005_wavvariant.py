@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alert', '0004_prefetch_manifest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WavVariant',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codec', models.CharField(choices=[('xz', 'xz (delta + LZMA2)')], max_length=10)),
+                ('file', models.FileField(upload_to='audios/variants/')),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('sha256', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('wav', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='alert.wavfile')),
+            ],
+            options={
+                'verbose_name': '방송 음원 압축본',
+                'verbose_name_plural': '방송 음원 압축본',
+                'constraints': [models.UniqueConstraint(fields=('wav', 'codec'), name='alert_wavvariant_wav_codec_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alert', '0005_wavvariant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wavfile',
+            name='bits_per_sample',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='wavfile',
+            name='channels',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='wavfile',
+            name='duration_ms',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='길이(ms)'),
+        ),
+        migrations.AddField(
+            model_name='wavfile',
+            name='sample_rate',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
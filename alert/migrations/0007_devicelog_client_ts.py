@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alert', '0006_wavfile_audio_info'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='devicelog',
+            name='client_ts',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
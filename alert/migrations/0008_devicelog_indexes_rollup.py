@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alert', '0007_devicelog_client_ts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceLogDaily',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('heartbeats', models.PositiveIntegerField(default=0)),
+                ('first_at', models.DateTimeField()),
+                ('last_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': '장비 일별 요약',
+                'verbose_name_plural': '장비 일별 요약',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='devicelog',
+            index=models.Index(fields=['device', '-created_at'], name='alert_devlog_device_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='devicelog',
+            index=models.Index(fields=['created_at'], name='alert_devlog_time_idx'),
+        ),
+        migrations.AddField(
+            model_name='devicelogdaily',
+            name='device',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_logs', to='alert.device'),
+        ),
+        migrations.AddConstraint(
+            model_name='devicelogdaily',
+            constraint=models.UniqueConstraint(fields=('device', 'date'), name='alert_devlogdaily_device_date_uniq'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alert', '0008_devicelog_indexes_rollup'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='viewer_groups',
+            field=models.ManyToManyField(blank=True, related_name='viewable_devices', to='auth.group', verbose_name='열람 그룹'),
+        ),
+    ]
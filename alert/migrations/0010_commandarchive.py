@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alert', '0009_device_viewer_groups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommandArchive',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('command_id', models.PositiveIntegerField(unique=True)),
+                ('action', models.CharField(max_length=10)),
+                ('all_devices', models.BooleanField(default=False)),
+                ('target_ids', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('wav', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='alert.wavfile')),
+            ],
+            options={
+                'verbose_name': '보관된 방송 명령',
+                'verbose_name_plural': '보관된 방송 명령',
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alert', '0010_commandarchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='broadcastlog',
+            name='command',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='broadcast_logs', to='alert.command'),
+        ),
+        migrations.CreateModel(
+            name='CommandDelivery',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fetched_at', models.DateTimeField(blank=True, null=True)),
+                ('downloaded_at', models.DateTimeField(blank=True, null=True)),
+                ('playing_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('command', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='alert.command')),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='alert.device')),
+            ],
+            options={
+                'verbose_name': '명령 전달 기록',
+                'verbose_name_plural': '명령 전달 기록',
+                'indexes': [models.Index(fields=['device', '-command'], name='alert_delivery_device_idx')],
+                'constraints': [models.UniqueConstraint(fields=('command', 'device'), name='alert_delivery_cmd_device_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alert', '0011_commanddelivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commandarchive',
+            name='target_group_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.CreateModel(
+            name='DeviceGroup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('last_command_id', models.PositiveIntegerField(blank=True, editable=False, null=True)),
+                ('devices', models.ManyToManyField(blank=True, related_name='device_groups', to='alert.device', verbose_name='장비')),
+            ],
+            options={
+                'verbose_name': '장비 그룹',
+                'verbose_name_plural': '장비 그룹',
+            },
+        ),
+        migrations.AddField(
+            model_name='broadcastlog',
+            name='target_groups',
+            field=models.ManyToManyField(blank=True, related_name='broadcast_logs', to='alert.devicegroup'),
+        ),
+        migrations.AddField(
+            model_name='command',
+            name='target_groups',
+            field=models.ManyToManyField(blank=True, related_name='commands', to='alert.devicegroup'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alert', '0012_devicegroup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='command',
+            name='play_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='commandarchive',
+            name='play_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='commanddelivery',
+            name='skew_ms',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
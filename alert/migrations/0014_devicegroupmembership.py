@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18
+
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# 옮겨 온 소속은 언제 들어왔는지 모르므로 모든 명령보다 먼저 들어온 것으로 둔다
+# (join_cursor=0: 그룹의 최신 명령을 계속 받는다, 이전과 같음)
+LONG_AGO = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def copy_memberships(apps, schema_editor):
+    DeviceGroup = apps.get_model("alert", "DeviceGroup")
+    Membership = apps.get_model("alert", "DeviceGroupMembership")
+    Old = DeviceGroup.devices.through
+    Membership.objects.bulk_create(
+        [
+            Membership(group_id=group_id, device_id=device_id)
+            for group_id, device_id in Old.objects.values_list("devicegroup_id", "device_id").iterator()
+        ],
+        batch_size=1000,
+    )
+    Membership.objects.update(joined_at=LONG_AGO)
+
+
+def copy_memberships_back(apps, schema_editor):
+    DeviceGroup = apps.get_model("alert", "DeviceGroup")
+    Membership = apps.get_model("alert", "DeviceGroupMembership")
+    Old = DeviceGroup.devices.through
+    Old.objects.bulk_create(
+        [
+            Old(devicegroup_id=group_id, device_id=device_id)
+            for group_id, device_id in Membership.objects.values_list("group_id", "device_id").iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alert', '0013_command_play_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceGroupMembership',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('join_cursor', models.PositiveIntegerField(default=0, editable=False)),
+                ('joined_at', models.DateTimeField(auto_now_add=True)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='group_memberships', to='alert.device')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='alert.devicegroup')),
+            ],
+            options={
+                'verbose_name': '장비 그룹 소속',
+                'verbose_name_plural': '장비 그룹 소속',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='devicegroupmembership',
+            constraint=models.UniqueConstraint(fields=('group', 'device'), name='alert_groupmember_group_device_uniq'),
+        ),
+        # M2M 에 through 를 붙이는 AlterField 는 지원되지 않으므로 새 표로 옮긴 뒤 필드를 바꾼다
+        migrations.RunPython(copy_memberships, copy_memberships_back),
+        migrations.RemoveField(
+            model_name='devicegroup',
+            name='devices',
+        ),
+        migrations.AddField(
+            model_name='devicegroup',
+            name='devices',
+            field=models.ManyToManyField(blank=True, related_name='device_groups', through='alert.DeviceGroupMembership', to='alert.device', verbose_name='장비'),
+        ),
+    ]
@@ -1,24 +1,29 @@
+import hashlib
+import tempfile
+
 from django.db import models
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group, User
 from django.core.exceptions import ValidationError
+from django.core.files import File
 from django.utils import timezone
 from django.conf import settings
 
+from .wav import WavError, parse_wav, strip_wav
+
 def validate_wav_file(f):
     name = (f.name or "").lower()
     if not name.endswith(".wav"):
         raise ValidationError("WAV(.wav) 파일만 업로드 가능합니다.")
 
+    # 청크 헤더만 따라가며 검사 (파일 전체를 메모리에 올리지 않음)
     pos = f.file.tell()
     try:
-        f.file.seek(0)
-        header = f.file.read(12)
+        parse_wav(f.file, max_size=settings.WAV_MAX_UPLOAD_BYTES)
+    except WavError as e:
+        raise ValidationError(str(e))
     finally:
         f.file.seek(pos)
 
-    if len(header) < 12 or header[0:4] != b"RIFF" or header[8:12] != b"WAVE":
-        raise ValidationError("유효한 WAV 파일이 아닙니다(RIFF/WAVE 헤더 없음).")
-
 
 class Device(models.Model):
     """
@@ -29,6 +34,18 @@ class Device(models.Model):
     is_active = models.BooleanField(default=True)
     last_seen_at = models.DateTimeField(null=True, blank=True)
 
+    # 이 장비와 로그를 볼 수 있는 어드민 그룹 (alert.permissions)
+    viewer_groups = models.ManyToManyField(
+        Group, blank=True, related_name="viewable_devices", verbose_name="열람 그룹"
+    )
+
+    # 이 장비를 지정한 명령 중 최신 ID (전체 명령은 제외, alert.inbox 에서 갱신)
+    last_command_id = models.PositiveIntegerField(null=True, blank=True, editable=False)
+
+    # 장비가 마지막으로 보고한 보유 음원 해시 목록 (/api/cache-report)
+    cached_hashes = models.JSONField(default=list, blank=True, editable=False)
+    cache_reported_at = models.DateTimeField(null=True, blank=True, editable=False)
+
     def __str__(self):
         return self.name or self.user.username
 
@@ -41,21 +58,185 @@ class Device(models.Model):
             raise ValidationError("스태프/슈퍼유저 계정은 장비로 지정할 수 없습니다.")
 
 
+class DeviceGroup(models.Model):
+    """
+    장비 묶음 (구역). 명령은 그룹만 참조하고, 소속 장비는 읽을 때 찾는다 (alert.inbox).
+    """
+    name = models.CharField(max_length=100, unique=True)
+    devices = models.ManyToManyField(
+        Device, blank=True, through="DeviceGroupMembership", related_name="device_groups", verbose_name="장비"
+    )
+
+    # 이 그룹을 지정한 명령 중 최신 ID (alert.inbox 에서 갱신)
+    last_command_id = models.PositiveIntegerField(null=True, blank=True, editable=False)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = "장비 그룹"
+        verbose_name_plural = "장비 그룹"
+
+
+class DeviceGroupMembership(models.Model):
+    """
+    그룹 소속. 들어오기 전에 그룹에 내려진 명령은 받지 않도록 그때의 그룹 커서를 남긴다.
+    """
+    group = models.ForeignKey(DeviceGroup, on_delete=models.CASCADE, related_name="memberships")
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name="group_memberships")
+
+    # 들어올 때 그룹의 last_command_id. 이보다 큰 그룹 명령만 받는다 (alert.signals 에서 채움)
+    join_cursor = models.PositiveIntegerField(default=0, editable=False)
+    joined_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.group} - {self.device}"
+
+    class Meta:
+        verbose_name = "장비 그룹 소속"
+        verbose_name_plural = "장비 그룹 소속"
+        constraints = [
+            models.UniqueConstraint(fields=["group", "device"], name="alert_groupmember_group_device_uniq"),
+        ]
+
+
 class WavFile(models.Model):
     title = models.CharField("방송명", max_length=200)
     description = models.TextField("상세 설명", blank=True)
 
     file = models.FileField(upload_to="audios/", validators=[validate_wav_file])
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # 장비가 명령 전에 미리 받아 두도록 manifest 에 사전 배포 대상으로 표시
+    predistribute = models.BooleanField("사전 배포", default=False)
+
+    # 파일 내용의 SHA-256 (ETag / 클라이언트 캐시 키) 와 바이트 크기
+    sha256 = models.CharField(max_length=64, blank=True, default="", editable=False)
+    size = models.PositiveBigIntegerField(default=0, editable=False)
+
+    # 업로드 시 WAV 헤더에서 읽어 둔 값 (alert.wav)
+    duration_ms = models.PositiveIntegerField("길이(ms)", default=0, editable=False)
+    sample_rate = models.PositiveIntegerField(default=0, editable=False)
+    channels = models.PositiveSmallIntegerField(default=0, editable=False)
+    bits_per_sample = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    # 파일에서 계산되는 필드 (update_fields 용)
+    FILE_INFO_FIELDS = ["sha256", "size", "duration_ms", "sample_rate", "channels", "bits_per_sample"]
 
     def __str__(self):
         return self.title
 
+    def read_audio_info(self):
+        """파일을 파싱해서 오디오 메타데이터 필드를 채운다. 파싱 결과(WavInfo)를 돌려준다."""
+        f = self.file
+        f.open("rb")
+        try:
+            info = parse_wav(f)
+        finally:
+            if f._committed:
+                f.close()
+        self.duration_ms = info.duration_ms
+        self.sample_rate = info.sample_rate
+        self.channels = info.channels
+        self.bits_per_sample = info.bits_per_sample
+        return info
+
+    def _strip_extra_chunks(self, info):
+        """fmt/data 외 청크(JUNK, LIST ...)를 걸러낸 임시 파일로 업로드 파일을 바꾼다."""
+        out = tempfile.SpooledTemporaryFile(max_size=10 * 1024 * 1024)
+        strip_wav(self.file, info, out)
+        out.seek(0)
+        self.file = File(out, name=self.file.name)
+        return out
+
+    def compute_digest(self):
+        h = hashlib.sha256()
+        size = 0
+        f = self.file
+        f.open("rb")
+        try:
+            f.seek(0)
+            for chunk in f.chunks():
+                h.update(chunk)
+                size += len(chunk)
+        finally:
+            if f._committed:
+                f.close()
+            else:
+                f.seek(0)
+        return h.hexdigest(), size
+
+    def backfill_file_info(self):
+        """
+        해시가 없는 예전 파일의 해시/메타데이터를 채운다 (장비 요청 경로에서도 불림).
+        save() 를 거치지 않으므로 시그널(압축본 생성 등)이 돌지 않는다.
+        """
+        try:
+            self.read_audio_info()
+        except WavError:
+            pass
+        self.sha256, self.size = self.compute_digest()
+        WavFile.objects.filter(pk=self.pk).update(**{f: getattr(self, f) for f in self.FILE_INFO_FIELDS})
+
+    def save(self, *args, **kwargs):
+        stripped = None
+        if self.file and not self.file._committed:
+            # 새로 올라온 파일: 메타데이터를 읽고 불필요한 청크는 저장 전에 제거
+            info = self.read_audio_info()
+            if info.extra_chunks:
+                stripped = self._strip_extra_chunks(info)
+        elif self.file and not self.sample_rate:
+            # 예전에 올라온 파일은 메타데이터만 채운다
+            try:
+                self.read_audio_info()
+            except WavError:
+                pass
+
+        try:
+            # 새 파일이 올라왔거나 아직 해시가 없으면 다시 계산
+            if self.file and (not self.file._committed or not self.sha256):
+                sha256, self.size = self.compute_digest()
+                # 내용이 바뀌었으면 커밋 후 압축본을 다시 만든다 (alert.signals)
+                self._content_changed = sha256 != self.sha256
+                self.sha256 = sha256
+            super().save(*args, **kwargs)
+        finally:
+            if stripped is not None:
+                stripped.close()
+
     class Meta:
         verbose_name = "방송 음원"
         verbose_name_plural = "방송 음원"
 
 
+class WavVariant(models.Model):
+    """
+    WavFile 의 무손실 압축본 (alert.codecs 에서 생성)
+    """
+    class Codec(models.TextChoices):
+        XZ = "xz", "xz (delta + LZMA2)"
+
+    wav = models.ForeignKey(WavFile, on_delete=models.CASCADE, related_name="variants")
+    codec = models.CharField(max_length=10, choices=Codec.choices)
+    file = models.FileField(upload_to="audios/variants/")
+
+    # 압축된 파일 기준 크기 / SHA-256 (ETag 용)
+    size = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.wav} [{self.codec}]"
+
+    class Meta:
+        verbose_name = "방송 음원 압축본"
+        verbose_name_plural = "방송 음원 압축본"
+        constraints = [
+            models.UniqueConstraint(fields=["wav", "codec"], name="alert_wavvariant_wav_codec_uniq"),
+        ]
+
+
 class Command(models.Model):
     class Action(models.TextChoices):
         PLAY = "PLAY", "PLAY"
@@ -65,9 +246,13 @@ class Command(models.Model):
     action = models.CharField(max_length=10, choices=Action.choices)
     wav = models.ForeignKey(WavFile, null=True, blank=True, on_delete=models.SET_NULL)
 
-    # 전체 명령인지 / 지정 명령인지
+    # 전체 명령인지 / 지정 명령인지 (장비 또는 그룹 지정)
     all_devices = models.BooleanField(default=False)
     targets = models.ManyToManyField(Device, blank=True, related_name="commands")
+    target_groups = models.ManyToManyField(DeviceGroup, blank=True, related_name="commands")
+
+    # 예약 재생 시각 (서버 시계 기준). 있으면 장비는 미리 받아 두었다가 이 시각에 같이 재생한다
+    play_at = models.DateTimeField(null=True, blank=True)
 
     # 클라이언트가 last_id로 비교할 값(명령 단위)
     created_at = models.DateTimeField(default=timezone.now)
@@ -78,8 +263,62 @@ class Command(models.Model):
     class Meta:
         verbose_name = "방송 명령"
         verbose_name_plural = "방송 명령"
+        indexes = [
+            # 최신 전체 명령 조회용
+            models.Index(fields=["all_devices", "-id"], name="alert_cmd_all_devices_id_idx"),
+        ]
+
+
+class CommandArchive(models.Model):
+    """
+    compact_commands 로 옮겨진 오래된 명령 (대상 장비/그룹은 ID 목록으로 보관)
+    """
+    command_id = models.PositiveIntegerField(unique=True)
+    action = models.CharField(max_length=10)
+    wav = models.ForeignKey(WavFile, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    all_devices = models.BooleanField(default=False)
+    target_ids = models.JSONField(default=list, blank=True)
+    target_group_ids = models.JSONField(default=list, blank=True)
+    play_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"#{self.command_id} {self.action} all={self.all_devices}"
+
+    class Meta:
+        verbose_name = "보관된 방송 명령"
+        verbose_name_plural = "보관된 방송 명령"
+
 
 
+class CommandDelivery(models.Model):
+    """
+    장비별 명령 전달 기록 (/api/ack). 시각은 장비가 보고한 값.
+    """
+    command = models.ForeignKey(Command, on_delete=models.CASCADE, related_name="deliveries")
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name="deliveries")
+    fetched_at = models.DateTimeField(null=True, blank=True)
+    downloaded_at = models.DateTimeField(null=True, blank=True)
+    playing_at = models.DateTimeField(null=True, blank=True)
+    # 예약 재생에서 실제 재생 시작 - play_at (ms, 장비가 추정한 서버 시계 기준)
+    skew_ms = models.IntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.command_id} -> {self.device}"
+
+    class Meta:
+        verbose_name = "명령 전달 기록"
+        verbose_name_plural = "명령 전달 기록"
+        constraints = [
+            models.UniqueConstraint(fields=["command", "device"], name="alert_delivery_cmd_device_uniq"),
+        ]
+        indexes = [
+            # 장비별 최근 전달 기록
+            models.Index(fields=["device", "-command"], name="alert_delivery_device_idx"),
+        ]
+
 
 class BroadcastLog(models.Model):
     """
@@ -103,9 +342,19 @@ class BroadcastLog(models.Model):
         related_name="broadcast_logs",
     )
 
+    # 이 실행으로 만들어진 명령 (장비 응답/지연 집계용)
+    command = models.ForeignKey(
+        Command,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="broadcast_logs",
+    )
+
     # 대상 장비
     all_devices = models.BooleanField(default=False)
     targets = models.ManyToManyField(Device, blank=True, related_name="broadcast_logs")
+    target_groups = models.ManyToManyField(DeviceGroup, blank=True, related_name="broadcast_logs")
 
     executed_at = models.DateTimeField(auto_now_add=True)
 
@@ -123,10 +372,39 @@ class DeviceLog(models.Model):
     level = models.CharField(max_length=20, default="INFO")
     message = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # 장비에서 로그가 발생한 시각 (/api/device-logs 로 모아서 보낸 경우)
+    client_ts = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.device} {self.level} {self.created_at}"
 
     class Meta:
         verbose_name = "장비 로그"
-        verbose_name_plural = "장비 로그"
\ No newline at end of file
+        verbose_name_plural = "장비 로그"
+        indexes = [
+            # 장비별 최근 로그 조회 (장비 화면, 장비 필터)
+            models.Index(fields=["device", "-created_at"], name="alert_devlog_device_time_idx"),
+            # 날짜 범위 조회 / 오래된 로그 정리
+            models.Index(fields=["created_at"], name="alert_devlog_time_idx"),
+        ]
+
+
+class DeviceLogDaily(models.Model):
+    """
+    오래된 하트비트 로그를 장비·날짜별로 합친 요약 (prune_device_logs 에서 생성)
+    """
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name="daily_logs")
+    date = models.DateField()
+    heartbeats = models.PositiveIntegerField(default=0)
+    first_at = models.DateTimeField()
+    last_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.device} {self.date}"
+
+    class Meta:
+        verbose_name = "장비 일별 요약"
+        verbose_name_plural = "장비 일별 요약"
+        constraints = [
+            models.UniqueConstraint(fields=["device", "date"], name="alert_devlogdaily_device_date_uniq"),
+        ]
\ No newline at end of file
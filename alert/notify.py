@@ -0,0 +1,101 @@
+"""
+명령 생성 알림 (long-poll / 스트림 대기 깨우기)
+
+- 같은 프로세스 안의 대기자는 Condition 으로 즉시 깨운다.
+- 같은 프로세스의 비동기(ASGI) 대기자는 이벤트 루프에 asyncio.Event 를 걸어 깨운다.
+- 다른 워커 프로세스에서 만든 명령은 캐시의 버전 값을 주기적으로 확인해서 감지한다.
+  프로세스별 캐시(LocMem)에서는 버전도 공유되지 않으므로, 대기하는 쪽(alert.views)이
+  CROSS_PROCESS_CHECK_SEC 마다 명령을 다시 찾는다.
+"""
+import asyncio
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = "alert:command_version"
+CROSS_PROCESS_CHECK_SEC = 1.0
+
+_cond = threading.Condition()
+_local_version = 0
+_async_waiters = set()
+
+
+def current_version():
+    return (_local_version, cache.get(VERSION_KEY, 0))
+
+
+async def acurrent_version():
+    return (_local_version, await cache.aget(VERSION_KEY, 0))
+
+
+def _notify():
+    global _local_version
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+    with _cond:
+        _local_version += 1
+        _cond.notify_all()
+        waiters = list(_async_waiters)
+
+    for loop, event in waiters:
+        loop.call_soon_threadsafe(event.set)
+
+
+def notify_command_created():
+    """명령이 커밋된 뒤 대기 중인 status 요청을 깨운다."""
+    transaction.on_commit(_notify)
+
+
+def wait_for_command(version, timeout):
+    """
+    version 이후 새 명령 알림이 오거나 timeout 이 지날 때까지 대기.
+    알림이 왔으면 True.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+
+        with _cond:
+            _cond.wait_for(
+                lambda: _local_version != version[0],
+                timeout=min(remaining, CROSS_PROCESS_CHECK_SEC),
+            )
+
+        if current_version() != version:
+            return True
+
+
+async def async_wait_for_command(version, timeout):
+    """wait_for_command 의 비동기 버전 (SSE 스트림용)."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return False
+
+        waiter = (loop, asyncio.Event())
+        with _cond:
+            _async_waiters.add(waiter)
+            changed = _local_version != version[0]
+        try:
+            if not changed:
+                await asyncio.wait_for(
+                    waiter[1].wait(),
+                    timeout=min(remaining, CROSS_PROCESS_CHECK_SEC),
+                )
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with _cond:
+                _async_waiters.discard(waiter)
+
+        if await acurrent_version() != version:
+            return True
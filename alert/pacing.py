@@ -0,0 +1,109 @@
+"""
+폴링 간격 안내 (/api/status 의 next_poll_ms, retry_after)
+
+장비가 모두 같은 주기로 폴링하면 정전/서버 재시작 뒤 한꺼번에 몰리고,
+전체 PLAY 직후에는 모든 장비가 같은 순간에 /api/file 을 부른다.
+- next_poll_ms: 다음 status 요청까지 기다릴 시간. 최근 status 유입량이 많을수록 늘린다.
+  명령을 받은 직후에는 뒤이은 STOP 등을 빨리 받도록 짧게.
+- retry_after: PLAY 음원을 받기 전에 기다릴 시간(초). 받을 장비 수에 맞춰 장비마다 다르게 흩어 준다.
+
+유입량은 프로세스 메모리에서만 센다 (POLL_TARGET_RPS 는 워커 1개 기준).
+지터(무작위 흔들기)는 클라이언트가 붙인다.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .inbox import command_recipients
+from .models import Command
+
+RECIPIENTS_KEY = "alert:pacing:recipients:{}"
+RECIPIENTS_TTL = 60
+
+# 장비별 다운로드 순서를 고르게 흩기 위한 값 (황금비)
+_GOLDEN = 0.6180339887498949
+
+
+class RateMeter:
+    """최근 window 초 동안의 초당 건수 (1초 단위 칸을 돌려 쓴다)."""
+
+    def __init__(self, window):
+        self.window = window
+        self._lock = threading.Lock()
+        self._counts = [0] * window
+        self._seconds = [-1] * window
+        self._started = None
+
+    def hit(self, now=None):
+        sec = int(time.monotonic() if now is None else now)
+        i = sec % self.window
+        with self._lock:
+            if self._started is None:
+                self._started = sec
+            if self._seconds[i] != sec:
+                self._seconds[i] = sec
+                self._counts[i] = 0
+            self._counts[i] += 1
+
+    def rate(self, now=None):
+        sec = int(time.monotonic() if now is None else now)
+        with self._lock:
+            if self._started is None:
+                return 0.0
+            total = sum(c for c, s in zip(self._counts, self._seconds) if sec - s < self.window)
+            # 막 시작한 프로세스는 지난 시간만큼만 나눈다 (재시작 직후 몰림을 놓치지 않게)
+            elapsed = min(self.window, sec - self._started + 1)
+        return total / elapsed
+
+
+polls = RateMeter(settings.POLL_LOAD_WINDOW)
+
+
+def load_factor():
+    """1 이면 여유, 2 면 목표 유입량의 2배."""
+    return max(1.0, polls.rate() / settings.POLL_TARGET_RPS)
+
+
+def _round_ms(ms):
+    # 값이 조금씩 바뀔 때마다 ETag 가 달라지지 않도록 500ms 단위로
+    return int(round(ms / 500) * 500)
+
+
+def next_poll_ms(has_command=False, long_poll=False):
+    factor = load_factor()
+    if has_command:
+        ms = settings.POLL_ACTIVE_INTERVAL_MS * factor
+    elif long_poll:
+        # long-poll 은 바로 다시 연결하는 게 기본, 부하가 있을 때만 쉬게 한다
+        ms = settings.POLL_INTERVAL_MS * (factor - 1)
+    else:
+        ms = settings.POLL_INTERVAL_MS * factor
+    return _round_ms(min(ms, settings.POLL_MAX_INTERVAL_MS))
+
+
+def _recipients(cmd):
+    """명령을 받을 장비 수 (명령별로 잠깐 캐시)."""
+    return cache.get_or_set(
+        RECIPIENTS_KEY.format(cmd.pk), lambda: command_recipients(cmd).count(), RECIPIENTS_TTL
+    )
+
+
+def download_delay(device, cmd):
+    """
+    PLAY 음원을 받기 전에 기다릴 시간(초).
+    받을 장비 수 / FILE_TARGET_RPS 초 안에 장비마다 다른 자리로 흩는다 (최대 FILE_SPREAD_MAX).
+    예약 재생은 play_at 까지 남은 시간의 절반까지 더 넓게 흩을 수 있다.
+    """
+    if cmd.action != Command.Action.PLAY or not cmd.wav_id:
+        return 0.0
+    limit = settings.FILE_SPREAD_MAX
+    if cmd.play_at:
+        limit = max(limit, (cmd.play_at - timezone.now()).total_seconds() / 2)
+    spread = min(limit, _recipients(cmd) / settings.FILE_TARGET_RPS)
+    if spread < 0.1:
+        return 0.0
+    slot = ((device.pk + cmd.pk) * _GOLDEN) % 1
+    return round(slot * spread, 2)
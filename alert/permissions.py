@@ -0,0 +1,75 @@
+"""
+장비 열람 권한
+
+- 슈퍼유저 / 모델 권한(alert.view_device)이 있는 사용자: 모든 장비
+- 그 외: 자기 그룹이 Device.viewer_groups 에 들어 있는 장비만
+
+조회는 SQL 서브쿼리 하나로 끝나고, 결과는 요청 동안 user 객체에 캐시한다
+(ModelBackend 의 _perm_cache 와 같은 방식).
+"""
+from django.contrib.auth.backends import BaseBackend
+
+from .models import Device
+
+VIEW_DEVICE_PERM = "alert.view_device"
+
+_CACHE_ATTR = "_alert_device_visibility"
+
+
+def _cached(user, key, compute):
+    cache = getattr(user, _CACHE_ATTR, None)
+    if cache is None:
+        cache = {}
+        setattr(user, _CACHE_ATTR, cache)
+    if key not in cache:
+        cache[key] = compute()
+    return cache[key]
+
+
+def sees_all_devices(user):
+    if not user.is_active:
+        return False
+    return _cached(user, "all", lambda: user.is_superuser or user.has_perm(VIEW_DEVICE_PERM))
+
+
+def visible_devices(user):
+    """user 가 볼 수 있는 장비 queryset (서브쿼리로 쓰려면 .values("pk"))."""
+    if sees_all_devices(user):
+        return Device.objects.all()
+    if not user.is_active or user.is_anonymous:
+        return Device.objects.none()
+    return Device.objects.filter(viewer_groups__user=user)
+
+
+def filter_visible(qs, user, field="device"):
+    """qs 를 user 가 볼 수 있는 장비의 것으로 제한 (IN 서브쿼리 1개)."""
+    if sees_all_devices(user):
+        return qs
+    return qs.filter(**{f"{field}__in": visible_devices(user).values("pk")})
+
+
+def visible_device_ids(user):
+    if sees_all_devices(user):
+        return None
+    return _cached(user, "ids", lambda: frozenset(visible_devices(user).values_list("pk", flat=True)))
+
+
+def has_visible_devices(user):
+    return _cached(user, "any", lambda: visible_devices(user).exists())
+
+
+def can_view_device(user, device):
+    ids = visible_device_ids(user)
+    return ids is None or device.pk in ids
+
+
+class DeviceViewBackend(BaseBackend):
+    """has_perm("alert.view_device", device) 를 viewer_groups 로 판단하는 객체 권한 백엔드."""
+
+    def has_perm(self, user_obj, perm, obj=None):
+        if perm != VIEW_DEVICE_PERM or not isinstance(obj, Device):
+            return False
+        if not user_obj.is_active or user_obj.is_anonymous:
+            return False
+        ids = visible_device_ids(user_obj)
+        return ids is None or obj.pk in ids
@@ -0,0 +1,85 @@
+"""
+장비 로그 보관 정리
+
+- 하트비트 로그는 일정 기간이 지나면 장비·날짜별 요약(DeviceLogDaily)으로 합치고 지운다.
+- 나머지 로그는 보관 기간이 지나면 지운다.
+둘 다 pk 를 batch_size 개씩 잘라서 처리하므로 한 트랜잭션이 커지지 않는다.
+"""
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.db.models.functions import TruncDate
+
+from .models import DeviceLog, DeviceLogDaily
+
+HEARTBEAT_PREFIX = "[HEARTBEAT]"
+
+
+def _rollup_batch(pks):
+    rows = (
+        DeviceLog.objects
+        .filter(pk__in=pks)
+        .annotate(date=TruncDate("created_at"))
+        .values("device_id", "date")
+        .annotate(count=Count("id"), first_at=Min("created_at"), last_at=Max("created_at"))
+    )
+    summary = {(r["device_id"], r["date"]): r for r in rows}
+
+    existing = {
+        (d.device_id, d.date): d
+        for d in DeviceLogDaily.objects.filter(
+            device_id__in={k[0] for k in summary},
+            date__in={k[1] for k in summary},
+        )
+    }
+
+    new, changed = [], []
+    for key, r in summary.items():
+        daily = existing.get(key)
+        if daily is None:
+            new.append(DeviceLogDaily(
+                device_id=key[0],
+                date=key[1],
+                heartbeats=r["count"],
+                first_at=r["first_at"],
+                last_at=r["last_at"],
+            ))
+        else:
+            daily.heartbeats += r["count"]
+            daily.first_at = min(daily.first_at, r["first_at"])
+            daily.last_at = max(daily.last_at, r["last_at"])
+            changed.append(daily)
+
+    DeviceLogDaily.objects.bulk_create(new)
+    DeviceLogDaily.objects.bulk_update(changed, ["heartbeats", "first_at", "last_at"])
+    DeviceLog.objects.filter(pk__in=pks).delete()
+
+
+def rollup_heartbeats(before, batch_size=5000):
+    """before 이전 하트비트 로그를 일별 요약으로 옮긴다. 옮긴 건수를 돌려준다."""
+    qs = (
+        DeviceLog.objects
+        .filter(created_at__lt=before, message__startswith=HEARTBEAT_PREFIX)
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+    total = 0
+    while True:
+        pks = list(qs[:batch_size])
+        if not pks:
+            return total
+        # 요약 반영과 삭제를 같은 트랜잭션에서 (중간에 멈춰도 두 번 세지 않음)
+        with transaction.atomic():
+            _rollup_batch(pks)
+        total += len(pks)
+
+
+def delete_old_logs(before, batch_size=5000):
+    """before 이전 로그를 지운다. 지운 건수를 돌려준다."""
+    qs = DeviceLog.objects.filter(created_at__lt=before).order_by("pk").values_list("pk", flat=True)
+    total = 0
+    while True:
+        pks = list(qs[:batch_size])
+        if not pks:
+            return total
+        DeviceLog.objects.filter(pk__in=pks).delete()
+        total += len(pks)
@@ -0,0 +1,142 @@
+"""
+시그널 처리
+- 명령 커서 (alert.inbox)
+- 음원 manifest (alert.library)
+- 음원 압축본 (alert.codecs)
+- 장비 last_seen_at 반영 (alert.heartbeat)
+
+모든 갱신은 커밋 후에 실행해서, 커밋 전 값을 다른 요청이 캐시에 올리는 일이 없게 한다.
+"""
+from functools import partial
+
+from django.core.signals import request_finished
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .codecs import build_variants_in_background
+from .heartbeat import flush_heartbeats
+from .inbox import (
+    ALL_KEY,
+    DEVICE_KEY,
+    GROUP_KEY,
+    bump_cached_cursor,
+    forget_cached_cursors,
+    forget_memberships,
+    set_join_cursors,
+    update_device_cursors,
+    update_group_cursors,
+)
+from .library import forget_manifest
+from .models import Command, DeviceGroup, DeviceGroupMembership, WavFile
+
+
+@receiver(post_save, sender=Command)
+def command_saved(sender, instance, created, **kwargs):
+    if instance.all_devices:
+        transaction.on_commit(partial(bump_cached_cursor, ALL_KEY, instance.id))
+    elif not created:
+        # 전체 -> 지정 으로 바뀐 경우 등
+        transaction.on_commit(partial(forget_cached_cursors, all_devices=True))
+
+
+@receiver(post_delete, sender=Command)
+def command_deleted(sender, instance, **kwargs):
+    # 지정 명령은 전체 명령 커서와 무관 (오래된 명령 정리 시 캐시를 건드리지 않도록)
+    if instance.all_devices:
+        transaction.on_commit(partial(forget_cached_cursors, all_devices=True))
+
+
+@receiver(m2m_changed, sender=Command.targets.through)
+def command_targets_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "post_add" and pk_set:
+        # DB 커서는 바로(같은 트랜잭션), 캐시는 커밋 후에 올린다
+        if reverse:
+            # device.commands.add(...)
+            update_device_cursors(Command(pk=max(pk_set)), [instance.pk])
+            key = DEVICE_KEY.format(instance.pk)
+            transaction.on_commit(partial(bump_cached_cursor, key, max(pk_set)))
+        else:
+            update_device_cursors(instance, list(pk_set))
+            for pk in pk_set:
+                transaction.on_commit(partial(bump_cached_cursor, DEVICE_KEY.format(pk), instance.pk))
+
+    elif action in ("post_remove", "post_clear"):
+        if reverse:
+            device_ids = [instance.pk]
+        elif pk_set:
+            device_ids = list(pk_set)
+        else:
+            # clear() 는 pk_set 이 없으므로 캐시 전체 만료에 맡긴다
+            device_ids = []
+        transaction.on_commit(partial(forget_cached_cursors, device_ids))
+
+
+@receiver(m2m_changed, sender=Command.target_groups.through)
+def command_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "post_add" and pk_set:
+        if reverse:
+            # group.commands.add(...)
+            update_group_cursors(Command(pk=max(pk_set)), [instance.pk])
+            key = GROUP_KEY.format(instance.pk)
+            transaction.on_commit(partial(bump_cached_cursor, key, max(pk_set)))
+        else:
+            update_group_cursors(instance, list(pk_set))
+            for pk in pk_set:
+                transaction.on_commit(partial(bump_cached_cursor, GROUP_KEY.format(pk), instance.pk))
+
+    elif action in ("post_remove", "post_clear"):
+        if reverse:
+            group_ids = [instance.pk]
+        else:
+            group_ids = list(pk_set or ())
+        transaction.on_commit(partial(forget_cached_cursors, group_ids=group_ids))
+
+
+@receiver(m2m_changed, sender=DeviceGroupMembership)
+def group_members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # 장비의 소속 그룹 캐시만 지운다 (명령 커서는 그룹 단위라 그대로)
+    if action == "post_add" and pk_set:
+        # 새로 들어온 장비는 그룹의 지난 명령을 받지 않는다
+        if reverse:
+            added = DeviceGroupMembership.objects.filter(device=instance, group_id__in=pk_set)
+        else:
+            added = DeviceGroupMembership.objects.filter(group=instance, device_id__in=pk_set)
+        set_join_cursors(added)
+    if action == "pre_clear" and not reverse:
+        # clear() 는 post_clear 에 pk_set 이 없으므로 미리 기억해 둔다
+        instance._cleared_device_ids = list(instance.devices.values_list("id", flat=True))
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if reverse:
+        device_ids = [instance.pk]
+    elif action == "post_clear":
+        device_ids = getattr(instance, "_cleared_device_ids", [])
+    else:
+        device_ids = list(pk_set or ())
+    transaction.on_commit(partial(forget_memberships, device_ids))
+
+
+@receiver(pre_delete, sender=DeviceGroup)
+def group_deleted(sender, instance, **kwargs):
+    device_ids = list(instance.devices.values_list("id", flat=True))
+    transaction.on_commit(partial(forget_memberships, device_ids))
+    transaction.on_commit(partial(forget_cached_cursors, group_ids=[instance.pk]))
+
+
+@receiver(post_save, sender=WavFile)
+@receiver(post_delete, sender=WavFile)
+def wav_file_changed(sender, **kwargs):
+    transaction.on_commit(forget_manifest)
+
+
+@receiver(post_save, sender=WavFile)
+def wav_file_uploaded(sender, instance, **kwargs):
+    if getattr(instance, "_content_changed", False):
+        instance._content_changed = False
+        transaction.on_commit(partial(build_variants_in_background, instance.pk))
+
+
+request_finished.connect(flush_heartbeats, dispatch_uid="alert.flush_heartbeats")
@@ -1,3 +1,719 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import json
+import struct
+import tempfile
+import time
+import wave
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import benchmark
+from .auth import issue_device_token
+from .checks import command_cache_check, metrics_token_check
+from .compaction import compact_commands
+from .delivery import percentile, record_acks
+from .heartbeat import HeartbeatRecorder, heartbeats
+from .inbox import command_recipients, dispatch_command, is_target
+from .library import build_manifest
+from .metrics import registry
+from .models import (
+    BroadcastLog,
+    Command,
+    CommandArchive,
+    CommandDelivery,
+    Device,
+    DeviceGroup,
+    DeviceGroupMembership,
+    DeviceLog,
+    WavFile,
+)
+from .wav import FORMAT_IEEE_FLOAT, FORMAT_PCM, WavError, parse_wav, strip_wav
+
+
+def _wav_bytes(frames=800):
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(8000)
+        w.writeframes(b"\0\0" * frames)
+    return buf.getvalue()
+
+
+def _fmt_chunk(audio_format=FORMAT_PCM, channels=1, sample_rate=8000, bits=16):
+    block_align = channels * bits // 8
+    return struct.pack("<HHIIHH", audio_format, channels, sample_rate, sample_rate * block_align, block_align, bits)
+
+
+def _riff(*chunks):
+    """(청크 ID, 내용) 목록으로 WAV 를 만든다. 홀수 길이 청크 뒤에는 패딩 바이트를 붙인다."""
+    body = b"".join(
+        cid + struct.pack("<I", len(data)) + data + (b"\0" if len(data) & 1 else b"") for cid, data in chunks
+    )
+    return b"RIFF" + struct.pack("<I", 4 + len(body)) + b"WAVE" + body
+
+
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+    MEDIA_ROOT=tempfile.mkdtemp(prefix="mfmc-test-"),
+)
+class AdminChangelistQueryTests(TestCase):
+    """
+    어드민 목록 화면의 쿼리 수 상한.
+    행 수를 늘려도 쿼리 수가 변하지 않아야 한다 (N+1 회귀 방지).
+    """
+
+    # 목록 화면 1회당 허용 쿼리 수 (세션/사용자/COUNT/목록/필터 등)
+    MAX_QUERIES = 12
+
+    CHANGELISTS = [
+        "/admin/alert/wavfile/",
+        "/admin/alert/command/",
+        "/admin/alert/broadcastlog/",
+        "/admin/alert/device/",
+        "/admin/alert/devicelog/",
+        "/admin/alert/devicegroup/",
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", password="pw")
+        cls.wav = WavFile(title="테스트 방송")
+        cls.wav.file.save("test.wav", ContentFile(_wav_bytes()))
+
+    def setUp(self):
+        cache.clear()
+        heartbeats.flush()  # 앞선 테스트의 기록이 요청 끝(request_finished)에 반영되어 세어지지 않도록
+        self.client.force_login(self.admin)
+
+    def _add_rows(self, n):
+        start = Device.objects.count()
+        devices = []
+        for i in range(start, start + n):
+            user = User.objects.create_user(f"device{i}", password="pw")
+            devices.append(Device.objects.create(user=user, name=f"장비{i}"))
+
+        for d in devices:
+            DeviceLog.objects.create(device=d, message="[HEARTBEAT] alive")
+            cmd = Command.objects.create(action=Command.Action.PLAY, wav=self.wav)
+            cmd.targets.set(devices)
+            log = BroadcastLog.objects.create(action="PLAY", wav=self.wav, executed_by=self.admin)
+            log.targets.set(devices)
+            group = DeviceGroup.objects.create(name=f"구역{d.pk}")
+            group.devices.set(devices)
+            dispatch_command(Command.Action.PLAY, wav=self.wav, groups=[group], executed_by=self.admin)
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return len(ctx.captured_queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        self._add_rows(3)
+        # manifest 등 캐시를 먼저 채워 두고 비교
+        for url in self.CHANGELISTS:
+            self.client.get(url)
+        small = {url: self._count_queries(url) for url in self.CHANGELISTS}
+
+        self._add_rows(20)
+        for url in self.CHANGELISTS:
+            with self.subTest(url=url):
+                count = self._count_queries(url)
+                self.assertEqual(count, small[url])
+                self.assertLessEqual(count, self.MAX_QUERIES)
+
+    def test_device_changelist_reads_manifest_once(self):
+        WavFile.objects.filter(pk=self.wav.pk).update(predistribute=True)
+        self._add_rows(5)
+        with mock.patch("alert.library.build_manifest", wraps=build_manifest) as manifest:
+            self.client.get("/admin/alert/device/")
+        self.assertEqual(manifest.call_count, 1)
+
+    def test_wavfile_change_form_queries_bounded(self):
+        self._add_rows(20)
+        url = f"/admin/alert/wavfile/{self.wav.pk}/change/"
+        self.assertLessEqual(self._count_queries(url), self.MAX_QUERIES)
+
+
+class StatusConditionalTests(TestCase):
+    """status 의 304 는 "새 명령 없음" 에만. 처리에 실패한 명령은 같은 last_id 로 다시 받아야 한다."""
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user("device", password="pw")
+        self.device = Device.objects.create(user=user)
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {issue_device_token(self.device)}"}
+
+    def _status(self, etag=None, **params):
+        headers = dict(self.auth)
+        if etag:
+            headers["HTTP_IF_NONE_MATCH"] = etag
+        return self.client.get("/api/status", params, **headers)
+
+    def test_none_is_not_modified(self):
+        first = self._status()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self._status(first["ETag"]).status_code, 304)
+
+    def test_command_is_resent_after_failed_handling(self):
+        none_etag = self._status()["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            cmd = dispatch_command(Command.Action.STOP)
+
+        first = self._status(none_etag)
+        self.assertEqual(first.json()["command_id"], cmd.id)
+
+        # 장비가 처리에 실패해서 last_id 가 그대로인 채 다시 묻는 경우 (이전 ETag 를 보내도)
+        retry = self._status(first.get("ETag") or none_etag)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json()["command_id"], cmd.id)
+
+        # 처리한 뒤에는 새 명령 없음
+        self.assertFalse(self._status(last_id=cmd.id).json()["has_command"])
+
+    def test_long_poll_notices_command_without_wakeup(self):
+        # 다른 워커에서 만든 명령: 이 프로세스에는 알림이 오지 않고, 몇 번 뒤에야 보인다
+        cmd = Command.objects.create(action=Command.Action.STOP, all_devices=True)
+        seen = iter([None, None, cmd])
+        with mock.patch("alert.views.CROSS_PROCESS_CHECK_SEC", 0.05), \
+                mock.patch("alert.views.latest_command", side_effect=lambda *a: next(seen)):
+            start = time.monotonic()
+            response = self._status(wait=10)
+        self.assertEqual(response.json()["command_id"], cmd.id)
+        self.assertLess(time.monotonic() - start, 5)
+
+
+class StreamCrossProcessTests(TestCase):
+    """SSE 도 알림 없이 생긴 명령(다른 워커)을 keepalive 간격까지 기다리지 않고 보낸다."""
+
+    async def test_stream_notices_command_without_wakeup(self):
+        user = await sync_to_async(User.objects.create_user)("dev", password="pw")
+        device = await Device.objects.acreate(user=user)
+        token = await sync_to_async(issue_device_token)(device)
+        cmd = await Command.objects.acreate(action=Command.Action.STOP, all_devices=True)
+        seen = iter([None, None, cmd])
+
+        with mock.patch("alert.views.CROSS_PROCESS_CHECK_SEC", 0.05), \
+                mock.patch("alert.views.latest_command", side_effect=lambda *a: next(seen)), \
+                self.settings(STREAM_KEEPALIVE_SEC=30):
+            response = await self.async_client.get("/api/stream", headers={"authorization": f"Bearer {token}"})
+            events = response.streaming_content.__aiter__()
+            await events.__anext__()  # retry:
+            start = time.monotonic()
+            event = await asyncio.wait_for(events.__anext__(), timeout=5)
+        self.assertIn(f"id: {cmd.id}", event.decode() if isinstance(event, bytes) else event)
+        self.assertLess(time.monotonic() - start, 5)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix="mfmc-test-"), WAV_VARIANTS_ON_UPLOAD=False)
+class FileRangeTests(TestCase):
+    """/api/file 의 Range 처리 (단일 구간만, 잘못된 헤더는 무시하고 전체)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.device = Device.objects.create(user=User.objects.create_user("dev", password="pw"))
+        cls.wav = WavFile(title="range")
+        cls.wav.file.save("range.wav", ContentFile(_wav_bytes(800)))
+        with cls.wav.file.open("rb") as f:
+            cls.body = f.read()
+
+    def setUp(self):
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {issue_device_token(self.device)}"}
+
+    def _get(self, **headers):
+        response = self.client.get("/api/file", {"wav_id": self.wav.pk}, **self.auth, **headers)
+        return response, b"".join(response.streaming_content) if response.streaming else response.content
+
+    def test_partial(self):
+        size = len(self.body)
+        for header, expected, content_range in [
+            ("bytes=0-9", self.body[:10], f"bytes 0-9/{size}"),
+            ("bytes=-10", self.body[-10:], f"bytes {size - 10}-{size - 1}/{size}"),
+            ("bytes=100-", self.body[100:], f"bytes 100-{size - 1}/{size}"),
+        ]:
+            response, body = self._get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 206, header)
+            self.assertEqual(body, expected, header)
+            self.assertEqual(response["Content-Range"], content_range)
+
+    def test_start_past_end_is_unsatisfiable(self):
+        response, _ = self._get(HTTP_RANGE=f"bytes={len(self.body)}-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(self.body)}")
+
+    def test_full_body_when_range_is_ignored(self):
+        for headers in [
+            {"HTTP_RANGE": "bytes=10-5"},
+            {"HTTP_RANGE": "bytes=0-9,20-29"},
+            {"HTTP_RANGE": "bytes=0-9", "HTTP_IF_RANGE": '"stale"'},
+        ]:
+            response, body = self._get(**headers)
+            self.assertEqual(response.status_code, 200, headers)
+            self.assertEqual(body, self.body, headers)
+
+
+class CommandCursorTests(TestCase):
+    """dispatch_command 를 거치지 않고 대상을 추가해도 DB 커서가 갱신되어 캐시가 비어도 명령을 받는다."""
+
+    def setUp(self):
+        cache.clear()
+        self.device = Device.objects.create(user=User.objects.create_user("dev", password="pw"))
+        self.token = issue_device_token(self.device)
+
+    def _command_id(self):
+        cache.clear()
+        data = self.client.get("/api/status", HTTP_AUTHORIZATION=f"Bearer {self.token}").json()
+        return data.get("command_id")
+
+    def test_targets_add(self):
+        cmd = Command.objects.create(action=Command.Action.STOP)
+        cmd.targets.add(self.device)
+        self.assertEqual(self._command_id(), cmd.id)
+
+        later = Command.objects.create(action=Command.Action.STOP)
+        self.device.commands.add(later)
+        self.assertEqual(self._command_id(), later.id)
+
+    def test_target_groups_add(self):
+        group = DeviceGroup.objects.create(name="zone")
+        group.devices.add(self.device)
+
+        cmd = Command.objects.create(action=Command.Action.STOP)
+        cmd.target_groups.add(group)
+        self.assertEqual(self._command_id(), cmd.id)
+
+        later = Command.objects.create(action=Command.Action.STOP)
+        group.commands.add(later)
+        self.assertEqual(self._command_id(), later.id)
+
+
+class WavParserTests(SimpleTestCase):
+    def _parse(self, data):
+        return parse_wav(io.BytesIO(data))
+
+    def test_odd_size_chunks_are_padded(self):
+        data = _riff((b"fmt ", _fmt_chunk(bits=8)), (b"LIST", b"abc"), (b"data", b"\x80" * 801))
+        info = self._parse(data)
+        self.assertEqual(info.extra_chunks, [("LIST", 12 + 8 + 16, 3)])
+        self.assertEqual((info.data_offset, info.data_size), (12 + 24 + 12 + 8, 801))
+
+        out = io.BytesIO()
+        strip_wav(io.BytesIO(data), info, out)
+        stripped = out.getvalue()
+        self.assertEqual(stripped, _riff((b"fmt ", _fmt_chunk(bits=8)), (b"data", b"\x80" * 801)))
+        self.assertEqual(len(stripped) % 2, 0)
+        self.assertEqual(self._parse(stripped).data_size, 801)
+
+    def test_missing_chunks(self):
+        fmt = (b"fmt ", _fmt_chunk())
+        data = (b"data", b"\0\0" * 10)
+        for chunks in ([data], [fmt], [data, fmt], [fmt, (b"LIST", b"info")]):
+            with self.subTest(chunks=[c[0] for c in chunks]), self.assertRaises(WavError):
+                self._parse(_riff(*chunks))
+
+    def test_truncated(self):
+        good = _riff((b"fmt ", _fmt_chunk()), (b"data", b"\0\0" * 10))
+        self.assertEqual(self._parse(good).data_size, 20)
+        for size in (0, 8, 11, 20, 12 + 8 + 16, len(good) - 1):
+            with self.subTest(size=size), self.assertRaises(WavError):
+                self._parse(good[:size])
+
+    def test_non_pcm_formats(self):
+        for audio_format in (0x0002, 0x0006, 0x0011, 0x0055):  # ADPCM, A-law, IMA ADPCM, MP3
+            with self.subTest(audio_format=hex(audio_format)), self.assertRaises(WavError):
+                self._parse(_riff((b"fmt ", _fmt_chunk(audio_format)), (b"data", b"\0\0" * 10)))
+
+        info = self._parse(_riff((b"fmt ", _fmt_chunk(FORMAT_IEEE_FLOAT, bits=32)), (b"data", b"\0" * 40)))
+        self.assertEqual((info.audio_format, info.bits_per_sample), (FORMAT_IEEE_FLOAT, 32))
+
+    def test_bad_fmt_values(self):
+        bad = bytearray(_fmt_chunk())
+        bad[12:14] = struct.pack("<H", 4)  # block_align 불일치
+        for fmt in (_fmt_chunk()[:14], _fmt_chunk(channels=0), _fmt_chunk(bits=12), bytes(bad)):
+            with self.assertRaises(WavError):
+                self._parse(_riff((b"fmt ", fmt), (b"data", b"\0\0" * 10)))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix="mfmc-test-"), WAV_VARIANTS_ON_UPLOAD=False)
+class WavUploadTests(TestCase):
+    def test_extra_chunks_stripped_before_hashing(self):
+        pcm = b"\x01\x02" * 400
+        uploaded = _riff((b"fmt ", _fmt_chunk()), (b"LIST", b"INFOISFT\x05\0\0\0mfmc\0\0"), (b"data", pcm))
+        # 어드민 업로드와 같은 경로 (저장 전까지 파일이 커밋되지 않음)
+        wav = WavFile(title="list", file=ContentFile(uploaded, name="list.wav"))
+        wav.save()
+
+        with wav.file.open("rb") as f:
+            stored = f.read()
+        self.assertEqual(stored, _riff((b"fmt ", _fmt_chunk()), (b"data", pcm)))
+        self.assertEqual(wav.sha256, hashlib.sha256(stored).hexdigest())
+        self.assertEqual(wav.size, len(stored))
+        self.assertEqual(wav.duration_ms, 50)
+        wav.refresh_from_db()
+        self.assertEqual(wav.sha256, hashlib.sha256(stored).hexdigest())
+
+
+class HeartbeatTests(TestCase):
+    def setUp(self):
+        self.recorder = HeartbeatRecorder()
+        self.device = Device.objects.create(user=User.objects.create_user("dev", password="pw"))
+
+    def test_flush_keeps_newer_db_value(self):
+        now = timezone.now()
+        self.recorder.record(self.device, now=now - timedelta(minutes=5))
+        Device.objects.filter(pk=self.device.pk).update(last_seen_at=now)  # 다른 프로세스가 먼저 반영
+        self.recorder.flush()
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.last_seen_at, now)
+
+        later = now + timedelta(minutes=5)
+        self.recorder.record(self.device, now=later)
+        self.recorder.flush()
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.last_seen_at, later)
+
+    def test_request_finished_flushes(self):
+        now = timezone.now()
+        with mock.patch("alert.heartbeat.heartbeats", self.recorder):
+            self.recorder.record(self.device, now=now)
+            self.assertIsNone(Device.objects.get(pk=self.device.pk).last_seen_at)
+            self.recorder._last_flush -= settings.HEARTBEAT_FLUSH_INTERVAL
+            self.client.get("/admin/login/")
+        self.assertEqual(Device.objects.get(pk=self.device.pk).last_seen_at, now)
+
+
+class CompactionTests(TestCase):
+    """정리 뒤에도 커서 명령이 남아서, 캐시가 비어도 장비가 같은 최신 명령을 받는다."""
+
+    def setUp(self):
+        cache.clear()
+        self.devices = [
+            Device.objects.create(user=User.objects.create_user(f"dev{i}", password="pw")) for i in range(3)
+        ]
+        self.tokens = [issue_device_token(d) for d in self.devices]
+        self.group = DeviceGroup.objects.create(name="zone")
+        self.group.devices.add(self.devices[2])
+
+    def _command(self, devices=(), groups=(), all_devices=False):
+        cmd = Command.objects.create(action=Command.Action.STOP, all_devices=all_devices)
+        cmd.targets.add(*devices)
+        cmd.target_groups.add(*groups)
+        return cmd
+
+    def _command_ids(self):
+        cache.clear()
+        return [
+            self.client.get("/api/status", HTTP_AUTHORIZATION=f"Bearer {t}").json().get("command_id")
+            for t in self.tokens
+        ]
+
+    def test_cursor_commands_survive(self):
+        a, b, c = self.devices
+        old_all = self._command(all_devices=True)
+        latest_all = self._command(all_devices=True)
+        old_a = self._command([a])
+        cursor_a = self._command([a])
+        old_group = self._command(groups=[self.group])
+        cursor_group = self._command(groups=[self.group])
+        cursor_b = self._command([b])
+
+        before = self._command_ids()
+        self.assertEqual(before, [cursor_a.id, cursor_b.id, cursor_group.id])
+
+        self.assertEqual(compact_commands(Command.objects.all(), batch_size=2), 3)
+        self.assertEqual(
+            set(Command.objects.values_list("id", flat=True)),
+            {latest_all.id, cursor_a.id, cursor_b.id, cursor_group.id},
+        )
+        self.assertEqual(
+            set(CommandArchive.objects.values_list("command_id", flat=True)),
+            {old_all.id, old_a.id, old_group.id},
+        )
+        self.assertEqual(CommandArchive.objects.get(command_id=old_group.id).target_group_ids, [self.group.id])
+        self.assertEqual(self._command_ids(), before)
+
+        # 그룹 명령만 받던 장비도 정리 뒤 최신 전체 명령이 새로 오면 그것을 받는다
+        newer = self._command(all_devices=True)
+        self.assertEqual(self._command_ids(), [newer.id] * 3)
+
+
+class BackfillCursorTests(TestCase):
+    """시그널 없이(bulk_create 등) 들어간 대상/소속도 backfill_command_cursors 로 커서가 맞춰진다."""
+
+    def test_backfill(self):
+        device, member = [
+            Device.objects.create(user=User.objects.create_user(f"dev{i}", password="pw")) for i in range(2)
+        ]
+        group = DeviceGroup.objects.create(name="zone")
+        now = timezone.now()
+        commands = Command.objects.bulk_create([Command(action=Command.Action.STOP) for _ in range(3)])
+        for i, cmd in enumerate(commands):
+            Command.objects.filter(pk=cmd.pk).update(created_at=now - timedelta(minutes=10 - i))
+        first, second, third = commands
+
+        Command.targets.through.objects.bulk_create([Command.targets.through(command=first, device=device)])
+        Command.target_groups.through.objects.bulk_create(
+            [Command.target_groups.through(command=c, devicegroup=group) for c in (first, second)]
+        )
+        # second 와 third 사이에 들어온 소속 (시그널이 없어 join_cursor=0)
+        DeviceGroupMembership.objects.bulk_create([DeviceGroupMembership(group=group, device=member)])
+        DeviceGroupMembership.objects.update(joined_at=now - timedelta(minutes=8, seconds=30))
+
+        call_command("backfill_command_cursors", stdout=io.StringIO())
+
+        device.refresh_from_db()
+        group.refresh_from_db()
+        self.assertEqual(device.last_command_id, first.id)
+        self.assertEqual(group.last_command_id, second.id)
+        self.assertEqual(DeviceGroupMembership.objects.get().join_cursor, second.id)
+
+        cache.clear()
+        token = issue_device_token(member)
+        data = self.client.get("/api/status", HTTP_AUTHORIZATION=f"Bearer {token}").json()
+        self.assertIsNone(data.get("command_id"))
+
+        Command.target_groups.through.objects.bulk_create([Command.target_groups.through(command=third, devicegroup=group)])
+        call_command("backfill_command_cursors", stdout=io.StringIO())
+        cache.clear()
+        data = self.client.get("/api/status", HTTP_AUTHORIZATION=f"Bearer {token}").json()
+        self.assertEqual(data.get("command_id"), third.id)
+
+
+class CacheReportTests(TestCase):
+    """cache-report 는 64자리 hex 문자열 목록만 받는다."""
+
+    def setUp(self):
+        self.device = Device.objects.create(user=User.objects.create_user("dev", password="pw"))
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {issue_device_token(self.device)}"}
+
+    def _report(self, body):
+        return self.client.post("/api/cache-report", json.dumps(body), content_type="application/json", **self.auth)
+
+    def test_valid_hashes_saved(self):
+        digest = "AB" * 32
+        self.assertEqual(self._report({"sha256": [digest]}).status_code, 200)
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.cached_hashes, [digest.lower()])
+
+    def test_invalid_bodies_rejected(self):
+        for body in (
+            {"sha256": "ab" * 32},
+            {"sha256": {"a": 1}},
+            {"sha256": [1]},
+            {"sha256": [None]},
+            {"sha256": ["ab" * 31]},
+            {"sha256": ["ab" * 33]},
+            {"sha256": ["zz" * 32]},
+            ["ab" * 32],
+        ):
+            self.assertEqual(self._report(body).status_code, 400, body)
+        self.device.refresh_from_db()
+        self.assertFalse(self.device.cached_hashes)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class GroupCommandTests(TestCase):
+    """그룹 명령은 소속 장비 수와 상관없이 같은 수의 쿼리로 기록되고, 소속 장비는 읽을 때 받는다."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", password="pw")
+
+    def setUp(self):
+        cache.clear()
+
+    def _group(self, name, n):
+        group = DeviceGroup.objects.create(name=name)
+        devices = []
+        for i in range(n):
+            user = User.objects.create_user(f"{name}-{i}", password="pw")
+            devices.append(Device.objects.create(user=user))
+        group.devices.set(devices)
+        return group, devices
+
+    def _dispatch_queries(self, group):
+        with CaptureQueriesContext(connection) as ctx:
+            dispatch_command(Command.Action.STOP, groups=[group], executed_by=self.admin)
+        return len(ctx.captured_queries)
+
+    def test_dispatch_writes_do_not_grow_with_members(self):
+        small, _ = self._group("small", 2)
+        large, _ = self._group("large", 50)
+        self.assertEqual(self._dispatch_queries(small), self._dispatch_queries(large))
+        self.assertFalse(Command.targets.through.objects.exists())
+        self.assertFalse(BroadcastLog.targets.through.objects.exists())
+
+    def _status(self, device):
+        token = issue_device_token(device)
+        return self.client.get("/api/status", HTTP_AUTHORIZATION=f"Bearer {token}").json()
+
+    def test_new_member_does_not_replay_group_command(self):
+        group, (member, _) = self._group("zone", 2)
+        _, (newcomer,) = self._group("other", 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cmd = dispatch_command(Command.Action.STOP, groups=[group])
+        self.assertEqual(self._status(member)["command_id"], cmd.id)
+        self.assertFalse(self._status(newcomer)["has_command"])
+
+        # 그룹에 새로 들어와도 들어오기 전에 내려진 그룹 명령은 받지 않는다
+        with self.captureOnCommitCallbacks(execute=True):
+            group.devices.add(newcomer)
+        self.assertFalse(self._status(newcomer)["has_command"])
+        self.assertFalse(is_target(cmd, newcomer))
+        self.assertNotIn(newcomer, command_recipients(cmd))
+
+        # 들어온 뒤의 그룹 명령은 받는다
+        with self.captureOnCommitCallbacks(execute=True):
+            later = dispatch_command(Command.Action.STOP, groups=[group])
+        self.assertEqual(self._status(newcomer)["command_id"], later.id)
+        self.assertTrue(is_target(later, newcomer))
+
+
+class MetricsAsgiTests(TestCase):
+    """ASGI 로 받은 요청도 sync view 가 실행한 쿼리 수를 센다 (0 으로 기록하지 않음)."""
+
+    async def test_counts_queries_of_sync_view(self):
+        await sync_to_async(cache.clear)()
+        user = await sync_to_async(User.objects.create_user)("dev", password="pw")
+        device = await Device.objects.acreate(user=user)
+        token = await sync_to_async(issue_device_token)(device)
+
+        before = registry.snapshot()["queries"].get("api_status", (0, 0.0))[0]
+        response = await self.async_client.get("/api/status", headers={"authorization": f"Bearer {token}"})
+        self.assertEqual(response.status_code, 200)
+        after = registry.snapshot()["queries"]["api_status"][0]
+        self.assertGreater(after, before)
+
+
+class MetricsAuthTests(TestCase):
+    """/metrics 는 토큰이 없으면 DEBUG 에서만 열린다."""
+
+    @override_settings(METRICS_TOKEN="", DEBUG=False)
+    def test_closed_without_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+        self.assertEqual([w.id for w in metrics_token_check(None)], ["alert.W002"])
+
+    @override_settings(METRICS_TOKEN="", DEBUG=True)
+    def test_open_in_debug(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+    @override_settings(METRICS_TOKEN="secret", DEBUG=False)
+    def test_token_required(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code, 401)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret").status_code, 200)
+        self.assertEqual(metrics_token_check(None), [])
+
+
+class CommandCacheCheckTests(SimpleTestCase):
+    """프로세스별 캐시에 명령 커서를 오래 두면 경고."""
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_long_ttl_on_local_cache_warns(self):
+        with self.settings(COMMAND_CACHE_TTL=300):
+            self.assertEqual([w.id for w in command_cache_check(None)], ["alert.W001"])
+        with self.settings(COMMAND_CACHE_TTL=3):
+            self.assertEqual(command_cache_check(None), [])
+
+
+class PercentileTests(SimpleTestCase):
+    """nearest-rank: 값 n 개의 p 백분위수는 ceil(p/100*n) 번째 값."""
+
+    def test_small_samples(self):
+        self.assertIsNone(percentile([], 50))
+        self.assertEqual(percentile([7], 50), 7)
+        self.assertEqual(percentile([7], 95), 7)
+        self.assertEqual(percentile([1, 2], 50), 1)
+        self.assertEqual(percentile([1, 2], 95), 2)
+        self.assertEqual(percentile([1, 2, 3], 50), 2)
+        self.assertEqual(percentile([1, 2, 3, 4], 50), 2)
+        self.assertEqual(percentile([1, 2, 3, 4], 75), 3)
+        self.assertEqual(percentile(list(range(1, 21)), 95), 19)
+        self.assertEqual(percentile(list(range(1, 101)), 7), 7)
+        self.assertEqual(percentile([1, 2, 3], 100), 3)
+        self.assertEqual(percentile([1, 2, 3], 0), 1)
+
+
+class RecordAcksTests(TestCase):
+    """이미 있는 전달 기록에 다음 단계를 보고해도 updated_at 이 바뀌는지 (bulk_update 는 auto_now 를 안 채움)."""
+
+    def test_later_stage_bumps_updated_at(self):
+        device = Device.objects.create(user=User.objects.create_user("dev", password="pw"))
+        cmd = dispatch_command(Command.Action.PLAY, devices=[device])
+        now = timezone.now()
+        record_acks(device, {cmd.id: {"fetched": now}})
+        delivery = CommandDelivery.objects.get(command=cmd, device=device)
+        CommandDelivery.objects.filter(pk=delivery.pk).update(updated_at=now - timedelta(hours=1))
+
+        record_acks(device, {cmd.id: {"playing": now}})
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.playing_at, now)
+        self.assertGreaterEqual(delivery.updated_at, now)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix="mfmc-test-"), WAV_VARIANTS_ON_UPLOAD=False)
+class BenchmarkSmokeTests(TransactionTestCase):
+    """manage.py benchmark 가 짧게라도 끝까지 돌고 결과를 남기는지."""
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_benchmark_writes_result(self):
+        out = tempfile.mkdtemp(prefix="mfmc-bench-")
+        # 테스트 DB(메모리 SQLite 공유 캐시)는 스레드끼리 테이블 잠금이 걸리므로 1개 스레드로만
+        call_command(
+            "benchmark",
+            devices=3,
+            duration=0.5,
+            concurrency=1,
+            dispatch_interval=0,
+            output=out,
+            label="smoke",
+            stdout=io.StringIO(),
+        )
+
+        files = list(Path(out).glob("*-smoke.json"))
+        self.assertEqual(len(files), 1)
+        result = json.loads(files[0].read_text(encoding="utf-8"))
+        self.assertIn("status", result["endpoints"])
+        self.assertEqual(result["total"]["errors"], 0)
+        # 측정용 장비는 끝나면 지운다
+        self.assertFalse(Device.objects.exists())
+
+    def test_dispatch_only_reaches_bench_devices(self):
+        real = Device.objects.create(user=User.objects.create_user("real", password="pw"))
+        devices, group, wav = benchmark.provision(3)
+        # 다른 스레드 없이 현재 스레드에서 잠깐 명령을 만든다
+        recorder = benchmark._Recorder()
+        benchmark._dispatcher(devices, group, wav, 0, time.monotonic() + 0.2, recorder, seed=0)
+        self.assertTrue(Command.objects.exists())
+        self.assertFalse(Command.objects.filter(all_devices=True).exists())
+        for cmd in Command.objects.all():
+            self.assertFalse(is_target(cmd, real))
+
+        benchmark.cleanup()
+        self.assertFalse(Command.objects.exists())
+        self.assertFalse(DeviceGroup.objects.exists())
+        self.assertEqual(list(Device.objects.all()), [real])
+
+    def test_refuses_non_scratch_database(self):
+        with mock.patch.object(benchmark, "is_scratch_database", return_value=False):
+            with self.assertRaises(CommandError):
+                call_command("benchmark", devices=1, duration=0, no_save=True, stdout=io.StringIO())
+        self.assertFalse(Device.objects.exists())
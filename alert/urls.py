@@ -2,7 +2,13 @@ from django.urls import path
 from . import views
 
 urlpatterns = [
+    path("token", views.token, name="api_token"),
     path("status", views.status, name="api_status"),
+    path("stream", views.stream, name="api_stream"),
     path("file", views.file, name="api_file"),
+    path("manifest", views.manifest, name="api_manifest"),
+    path("ack", views.ack, name="api_ack"),
+    path("cache-report", views.cache_report, name="api_cache_report"),
     path("device-log", views.device_log, name="device_log"),
+    path("device-logs", views.device_logs, name="device_logs"),
 ]
\ No newline at end of file
@@ -1,58 +1,209 @@
-from django.http import JsonResponse, FileResponse, HttpResponseBadRequest
+import json
+import re
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date
+from django.http import FileResponse, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_GET, require_POST
 from django.views.decorators.csrf import csrf_exempt
-from django.utils import timezone
-from django.db.models import Q
 
-from .auth import basic_auth_device
-from .models import Command, DeviceLog
+from .auth import authenticate_device, basic_auth_device, issue_device_token
+from .codecs import pick_variant
+from .delivery import STAGES, record_acks
+from .heartbeat import heartbeats
+from .inbox import is_target, latest_command
+from .library import build_manifest
+from .metrics import registry
+from .models import Command, Device, DeviceLog, WavFile
+from .pacing import download_delay, next_poll_ms, polls
+from .notify import (
+    CROSS_PROCESS_CHECK_SEC,
+    acurrent_version,
+    async_wait_for_command,
+    current_version,
+    wait_for_command,
+)
+
+
+def _epoch_ms(dt):
+    return int(dt.timestamp() * 1000)
+
+
+def _command_payload(cmd, device):
+    payload = {
+        "has_command": True,
+        "command_id": cmd.id,
+        "action": cmd.action,
+        "ts": int(cmd.created_at.timestamp()),
+    }
+    if cmd.action == Command.Action.PLAY and cmd.wav:
+        payload["filename"] = str(cmd.wav)
+        if cmd.wav.sha256:
+            payload["sha256"] = cmd.wav.sha256
+            payload["size"] = cmd.wav.size
+        if cmd.wav.duration_ms:
+            payload["duration_ms"] = cmd.wav.duration_ms
+        if cmd.play_at:
+            payload["play_at_ms"] = _epoch_ms(cmd.play_at)
+        delay = download_delay(device, cmd)
+        if delay:
+            payload["retry_after"] = delay
+    return payload
+
+
+
+@csrf_exempt
+@require_POST
+@basic_auth_device
+def token(request):
+    """
+    앱 비밀번호(Basic) -> 단기 Bearer 토큰 교환.
+    이후 요청은 토큰으로 보내면 매번 비밀번호 해시를 계산하지 않는다.
+    """
+    if not request.META.get("HTTP_AUTHORIZATION", "").startswith("Basic "):
+        return JsonResponse({"error": "basic_auth_required"}, status=401)
+
+    return JsonResponse({
+        "token": issue_device_token(request.device),
+        "expires_in": settings.DEVICE_TOKEN_MAX_AGE,
+    })
 
 
 @require_GET
 @basic_auth_device
 def status(request):
+    received = time.monotonic()
     device = request.device
     last_id = request.GET.get("last_id")
 
-    device.last_seen_at = timezone.now()
-    device.save(update_fields=["last_seen_at"])
-
-    qs = (
-        Command.objects
-        .filter(Q(all_devices=True) | Q(targets=device))
-        .order_by("-id")
-        .distinct()
-    )
+    heartbeats.record(device)
+    polls.hit()
 
+    last_id_int = None
     if last_id:
         try:
             last_id_int = int(last_id)
-            qs = qs.filter(id__gt=last_id_int)
         except ValueError:
             return JsonResponse({"error": "invalid_last_id"}, status=400)
 
-    cmd = qs.first()
-    if not cmd:
-        return JsonResponse({"has_command": False})
+    # wait=<초> : 새 명령이 생기거나 시간이 다 될 때까지 응답을 보류 (long-poll)
+    try:
+        wait = float(request.GET.get("wait") or 0)
+    except ValueError:
+        return JsonResponse({"error": "invalid_wait"}, status=400)
+    wait = max(0.0, min(wait, settings.LONG_POLL_MAX_WAIT))
+    deadline = time.monotonic() + wait
+
+    while True:
+        version = current_version()
+        cmd = latest_command(device, last_id_int)
+        remaining = deadline - time.monotonic()
+        if cmd or remaining <= 0:
+            break
+        # 다른 워커에서 만든 명령은 알림이 안 올 수 있으므로 (프로세스별 캐시) 명령도 주기적으로 다시 찾는다
+        wait_for_command(version, min(remaining, CROSS_PROCESS_CHECK_SEC))
+
+    # 다음 폴링까지 기다릴 시간: 부하와 명령 여부로 정한다 (ETag 에도 넣어서 바뀌면 304 가 아닌 본문으로)
+    poll_ms = next_poll_ms(has_command=cmd is not None, long_poll=wait > 0)
+    data = _command_payload(cmd, device) if cmd else {"has_command": False}
+    data["next_poll_ms"] = poll_ms
+
+    # 장비 시계 보정용: 응답 시각(서버 시계)과 요청을 붙잡고 있던 시간 (ETag 와 무관, 304 에는 없음)
+    data["server_time_ms"] = int(time.time() * 1000)
+    data["held_ms"] = int((time.monotonic() - received) * 1000)
+    response = JsonResponse(data)
+    if cmd:
+        # 명령 응답에는 ETag 를 주지 않는다: 장비가 처리에 실패해 같은 last_id 로 다시 물으면
+        # 304 가 아니라 같은 명령을 다시 받아야 한다
+        return response
+
+    # "새 명령 없음" 이 이전 응답과 같으면 304 (본문 없이)
+    response["ETag"] = f'W/"none-{poll_ms}"'
+    return get_conditional_response(request, etag=response["ETag"], response=response)
+
+
+async def _command_events(device, cursor):
+    yield f"retry: {settings.STREAM_RETRY_MS}\n\n"
+    keepalive_at = time.monotonic() + settings.STREAM_KEEPALIVE_SEC
+    while True:
+        version = await acurrent_version()
+        cmd = await sync_to_async(latest_command)(device, cursor)
+        if cmd:
+            cursor = cmd.id
+            data = json.dumps(await sync_to_async(_command_payload)(cmd, device))
+            yield f"id: {cmd.id}\nevent: command\ndata: {data}\n\n"
+            continue
+
+        # 다른 워커에서 만든 명령은 알림이 안 올 수 있으므로 (프로세스별 캐시) 명령도 주기적으로 다시 찾는다
+        remaining = keepalive_at - time.monotonic()
+        if remaining > 0:
+            await async_wait_for_command(version, min(remaining, CROSS_PROCESS_CHECK_SEC))
+            continue
+        keepalive_at = time.monotonic() + settings.STREAM_KEEPALIVE_SEC
+
+        # 연결 유지 중에도 장비 상태 확인 + last_seen 갱신
+        if not await Device.objects.filter(pk=device.pk, is_active=True).aexists():
+            return
+        await sync_to_async(heartbeats.record)(device)
+        yield ": keepalive\n\n"
 
-    payload = {
-        "has_command": True,
-        "command_id": cmd.id,
-        "action": cmd.action,
-        "ts": int(cmd.created_at.timestamp()),
-    }
-    if cmd.action == Command.Action.PLAY and cmd.wav:
-        payload["filename"] = str(cmd.wav)
-    return JsonResponse(payload)
+
+@require_GET
+async def stream(request):
+    """
+    Server-Sent Events 로 명령을 밀어주는 채널 (ASGI 로 띄워야 워커를 점유하지 않음).
+    재연결 시 Last-Event-ID 헤더(또는 last_id) 다음 명령부터 이어서 보낸다.
+    """
+    device, error = await sync_to_async(authenticate_device)(request)
+    if error:
+        return error
+
+    cursor = request.headers.get("Last-Event-ID") or request.GET.get("last_id")
+    if cursor:
+        try:
+            cursor = int(cursor)
+        except ValueError:
+            return JsonResponse({"error": "invalid_last_id"}, status=400)
+    else:
+        cursor = None
+
+    await sync_to_async(heartbeats.record)(device)
+
+    response = StreamingHttpResponse(
+        _command_events(device, cursor),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
 
 
 @require_GET
 @basic_auth_device
 def file(request):
+    """
+    command_id: 그 명령의 음원 (대상 장비만)
+    wav_id: 음원 라이브러리의 파일 (manifest 사전 다운로드용)
+    """
     command_id = request.GET.get("command_id")
-    if not command_id:
+    wav_id = request.GET.get("wav_id")
+    if not command_id and not wav_id:
         return HttpResponseBadRequest("command_id is required")
 
+    if wav_id:
+        try:
+            wav = WavFile.objects.filter(pk=int(wav_id)).first()
+        except ValueError:
+            return JsonResponse({"error": "invalid_wav_id"}, status=400)
+        if not wav or not wav.file:
+            return JsonResponse({"error": "not_found"}, status=404)
+        return _serve_wav(request, wav)
+
     try:
         cmd_id = int(command_id)
     except ValueError:
@@ -62,20 +213,144 @@ def file(request):
     if not cmd:
         return JsonResponse({"error": "not_found"}, status=404)
 
-    device = request.device
-    is_target = cmd.all_devices or cmd.targets.filter(id=device.id).exists()
-    if not is_target:
+    if not is_target(cmd, request.device):
         return JsonResponse({"error": "forbidden"}, status=403)
 
     if cmd.action != Command.Action.PLAY or not cmd.wav:
         return JsonResponse({"error": "not_a_play_command"}, status=400)
 
-    f = cmd.wav.file
-    return FileResponse(
-        f.open("rb"),
-        as_attachment=True,
-        filename=str(cmd.wav),
-    )
+    return _serve_wav(request, cmd.wav)
+
+
+def _serve_wav(request, wav):
+    """
+    accept=<codec,...> 로 받을 수 있는 압축 형식을 알려주면 가장 작은 압축본을 보낸다.
+    실제로 보낸 형식은 X-MFMC-Codec 헤더 (원본이면 wav).
+    """
+    if not wav.sha256:
+        wav.backfill_file_info()
+
+    accepted = [c.strip() for c in request.GET.get("accept", "").split(",") if c.strip()]
+    variant = pick_variant(wav, accepted)
+    if variant:
+        source, codec, etag, size = variant.file, variant.codec, f'"{variant.sha256}"', variant.size
+        filename = f"{wav}.wav.{variant.codec}"
+    else:
+        source, codec, etag, size = wav.file, "wav", f'"{wav.sha256}"', wav.file.size
+        filename = str(wav)
+
+    last_modified = int(wav.updated_at.timestamp())
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        not_modified["ETag"] = etag
+        return not_modified
+
+    f = source.open("rb")
+    byte_range = _parse_range(request, etag, size)
+    if byte_range is None:
+        response = FileResponse(f, as_attachment=True, filename=filename)
+    elif byte_range is False:
+        f.close()
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _iter_file_range(f, start, end - start + 1),
+            status=206,
+            content_type="application/octet-stream",
+        )
+        response["Content-Length"] = str(end - start + 1)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Disposition"] = content_disposition_header(True, filename)
+
+    response["Accept-Ranges"] = "bytes"
+    response["X-MFMC-Codec"] = codec
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    return response
+
+
+def _parse_range(request, etag, size):
+    """
+    Range: bytes=<start>-<end> (단일 구간만 지원)
+    None: 전체 전송, False: 만족할 수 없는 범위(416), (start, end): 부분 전송
+    """
+    header = request.headers.get("Range", "")
+    if not header.startswith("bytes=") or "," in header:
+        return None
+
+    # If-Range 가 현재 ETag 와 다르면 파일이 바뀐 것이므로 전체를 보낸다
+    if_range = request.headers.get("If-Range")
+    if if_range and if_range != etag:
+        return None
+
+    first, _, last = header[6:].strip().partition("-")
+    if not (first or last) or not all(v.isdigit() for v in (first, last) if v):
+        return None
+
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            # 문법에 맞지 않는 범위는 헤더를 무시하고 전체를 보낸다 (RFC 7233 2.1)
+            return None
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # bytes=-<n> : 마지막 n 바이트
+        start = max(size - int(last), 0)
+        end = size - 1
+
+    if start >= size:
+        return False
+    return start, end
+
+
+def _iter_file_range(f, start, length, chunk_size=64 * 1024):
+    try:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(chunk_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        f.close()
+
+
+@require_GET
+@basic_auth_device
+def manifest(request):
+    """음원 라이브러리 목록 (클라이언트가 한가할 때 미리 받아 두는 용도)."""
+    files, etag = build_manifest()
+    response = JsonResponse({"files": files})
+    response["ETag"] = etag
+    return get_conditional_response(request, etag=etag, response=response)
+
+
+SHA256_RE = re.compile(r"[0-9a-fA-F]{64}")
+
+
+@csrf_exempt
+@require_POST
+@basic_auth_device
+def cache_report(request):
+    """장비가 가지고 있는 음원 해시 목록 보고 -> 어드민 사전 배포 현황."""
+    try:
+        data = json.loads(request.body or b"{}")
+        hashes = data.get("sha256", [])
+    except (ValueError, AttributeError):
+        return JsonResponse({"error": "invalid_body"}, status=400)
+    # 문자열 목록이 아니면 통째로 거절 (잘라서 저장하면 틀린 해시가 현황에 섞인다)
+    if not isinstance(hashes, list) or not all(isinstance(h, str) and SHA256_RE.fullmatch(h) for h in hashes):
+        return JsonResponse({"error": "invalid_sha256"}, status=400)
+    hashes = [h.lower() for h in hashes][: settings.CACHE_REPORT_MAX_ITEMS]
+
+    device = request.device
+    device.cached_hashes = hashes
+    device.cache_reported_at = timezone.now()
+    device.save(update_fields=["cached_hashes", "cache_reported_at"])
+    return JsonResponse({"ok": True})
 
 
 @csrf_exempt
@@ -91,4 +366,102 @@ def device_log(request):
         level=level,
         message=message,
     )
-    return JsonResponse({"ok": True})
\ No newline at end of file
+    registry.inc("device_logs")
+    return JsonResponse({"ok": True})
+
+
+def _parse_log_records(request):
+    """JSON 배열(또는 {"logs": [...]}) / NDJSON 본문 -> dict 목록."""
+    body = request.body.decode("utf-8")
+    if request.content_type == "application/x-ndjson":
+        return [json.loads(line) for line in body.splitlines() if line.strip()]
+
+    data = json.loads(body or "[]")
+    if isinstance(data, dict):
+        data = data.get("logs", [])
+    if not isinstance(data, list):
+        raise ValueError("logs must be a list")
+    return data
+
+
+def _client_ts(value):
+    """장비 시각(epoch 초) -> datetime. 없거나 이상하면 None."""
+    try:
+        return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+
+
+# 예약 재생 오차(skew_ms)로 받을 수 있는 최대값 (하루)
+MAX_SKEW_MS = 24 * 60 * 60 * 1000
+
+
+@csrf_exempt
+@require_POST
+@basic_auth_device
+def device_logs(request):
+    """
+    로그 여러 건을 한 번에 받는다 (bulk_create 1회).
+    각 항목: {"level": ..., "message": ..., "ts": <epoch 초>}
+    """
+    try:
+        records = _parse_log_records(request)
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({"error": "invalid_body"}, status=400)
+
+    if len(records) > settings.DEVICE_LOG_BATCH_MAX:
+        return JsonResponse({"error": "too_many_logs", "max": settings.DEVICE_LOG_BATCH_MAX}, status=413)
+
+    device = request.device
+    logs = []
+    for r in records:
+        if not isinstance(r, dict):
+            return JsonResponse({"error": "invalid_body"}, status=400)
+        logs.append(DeviceLog(
+            device=device,
+            level=str(r.get("level") or "INFO")[:20],
+            message=str(r.get("message") or "")[:4000],
+            client_ts=_client_ts(r.get("ts")),
+        ))
+
+    DeviceLog.objects.bulk_create(logs, batch_size=500)
+    registry.inc("device_logs", len(logs))
+    return JsonResponse({"ok": True, "count": len(logs)})
+
+
+@csrf_exempt
+@require_POST
+@basic_auth_device
+def ack(request):
+    """
+    명령 전달 확인. 한 건 또는 여러 건:
+    {"command_id": 12, "fetched": <epoch 초>, "downloaded": ..., "playing": ..., "skew_ms": <예약 재생 오차>}
+    """
+    try:
+        data = json.loads(request.body or b"[]")
+        if isinstance(data, dict):
+            data = data.get("acks", [data])
+        if not isinstance(data, list):
+            raise ValueError("acks must be a list")
+
+        acks = {}
+        for item in data:
+            command_id = int(item["command_id"])
+            stages = acks.setdefault(command_id, {})
+            for stage in STAGES:
+                ts = _client_ts(item.get(stage))
+                if ts:
+                    stages[stage] = ts
+            if item.get("skew_ms") is not None:
+                skew = int(item["skew_ms"])
+                if abs(skew) > MAX_SKEW_MS:
+                    raise ValueError("skew_ms out of range")
+                stages["skew_ms"] = skew
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return JsonResponse({"error": "invalid_body"}, status=400)
+
+    if len(acks) > settings.ACK_BATCH_MAX:
+        return JsonResponse({"error": "too_many_acks", "max": settings.ACK_BATCH_MAX}, status=413)
+
+    count = record_acks(request.device, acks) if acks else 0
+    return JsonResponse({"ok": True, "count": count})
@@ -0,0 +1,140 @@
+"""
+WAV(RIFF) 파서
+
+파일 전체를 읽지 않고 청크 헤더만 따라가며(seek) 구조를 검사한다.
+fmt / data 외의 청크(JUNK, LIST, bext ...)는 strip_wav 로 걸러낼 수 있다.
+"""
+import struct
+from dataclasses import dataclass, field
+
+CHUNK_SIZE = 64 * 1024
+
+FORMAT_PCM = 0x0001
+FORMAT_IEEE_FLOAT = 0x0003
+FORMAT_EXTENSIBLE = 0xFFFE
+SUPPORTED_FORMATS = (FORMAT_PCM, FORMAT_IEEE_FLOAT, FORMAT_EXTENSIBLE)
+
+
+class WavError(ValueError):
+    pass
+
+
+@dataclass
+class WavInfo:
+    audio_format: int
+    channels: int
+    sample_rate: int
+    byte_rate: int
+    block_align: int
+    bits_per_sample: int
+    fmt_chunk: bytes
+    data_offset: int
+    data_size: int
+    file_size: int
+    extra_chunks: list = field(default_factory=list)
+
+    @property
+    def duration_ms(self):
+        return self.data_size * 1000 // self.byte_rate
+
+
+def parse_wav(f, max_size=None):
+    """
+    f: seek 가능한 바이너리 파일 객체. 읽은 뒤 위치는 처음(0)으로 돌려놓는다.
+    잘못된 파일이면 WavError.
+    """
+    try:
+        return _parse(f, max_size)
+    finally:
+        f.seek(0)
+
+
+def _parse(f, max_size):
+    f.seek(0, 2)
+    file_size = f.tell()
+    if max_size and file_size > max_size:
+        raise WavError(f"파일이 너무 큽니다({file_size} > {max_size} bytes).")
+
+    f.seek(0)
+    header = f.read(12)
+    if len(header) < 12 or header[0:4] != b"RIFF" or header[8:12] != b"WAVE":
+        raise WavError("유효한 WAV 파일이 아닙니다(RIFF/WAVE 헤더 없음).")
+
+    fmt = None
+    data = None
+    extra = []
+    pos = 12
+    while pos + 8 <= file_size:
+        f.seek(pos)
+        chunk_id, chunk_size = struct.unpack("<4sI", f.read(8))
+        body = pos + 8
+        if body + chunk_size > file_size:
+            if chunk_id == b"data":
+                raise WavError("data 청크가 잘렸습니다(파일 길이 부족).")
+            raise WavError(f"{chunk_id!r} 청크 크기가 파일 길이를 넘습니다.")
+
+        if chunk_id == b"fmt ":
+            if chunk_size < 16:
+                raise WavError("fmt 청크가 너무 짧습니다.")
+            fmt = f.read(chunk_size)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise WavError("fmt 청크가 data 청크보다 앞에 있어야 합니다.")
+            data = (body, chunk_size)
+        else:
+            extra.append((chunk_id.decode("latin-1"), pos, chunk_size))
+
+        # 청크는 2바이트 단위로 정렬
+        pos = body + chunk_size + (chunk_size & 1)
+
+    if fmt is None:
+        raise WavError("fmt 청크가 없습니다.")
+    if data is None:
+        raise WavError("data 청크가 없습니다.")
+
+    audio_format, channels, sample_rate, byte_rate, block_align, bits = struct.unpack("<HHIIHH", fmt[:16])
+    if audio_format not in SUPPORTED_FORMATS:
+        raise WavError(f"지원하지 않는 WAV 인코딩입니다(format=0x{audio_format:04x}).")
+    if not channels or not sample_rate or not bits or bits % 8:
+        raise WavError("fmt 청크 값이 올바르지 않습니다.")
+    if block_align != channels * bits // 8 or byte_rate != sample_rate * block_align:
+        raise WavError("fmt 청크의 block_align/byte_rate 가 맞지 않습니다.")
+    if data[1] == 0:
+        raise WavError("오디오 데이터가 비어 있습니다.")
+
+    return WavInfo(
+        audio_format=audio_format,
+        channels=channels,
+        sample_rate=sample_rate,
+        byte_rate=byte_rate,
+        block_align=block_align,
+        bits_per_sample=bits,
+        fmt_chunk=fmt,
+        data_offset=data[0],
+        data_size=data[1],
+        file_size=file_size,
+        extra_chunks=extra,
+    )
+
+
+def strip_wav(src, info, dst):
+    """fmt + data 청크만 남긴 WAV 를 dst 에 쓴다 (data 는 조금씩 복사)."""
+    fmt = info.fmt_chunk
+    fmt_padded = fmt + (b"\0" if len(fmt) & 1 else b"")
+    data_pad = b"\0" if info.data_size & 1 else b""
+    riff_size = 4 + 8 + len(fmt_padded) + 8 + info.data_size + len(data_pad)
+
+    dst.write(struct.pack("<4sI4s", b"RIFF", riff_size, b"WAVE"))
+    dst.write(struct.pack("<4sI", b"fmt ", len(fmt)) + fmt_padded)
+    dst.write(struct.pack("<4sI", b"data", info.data_size))
+
+    src.seek(info.data_offset)
+    remaining = info.data_size
+    while remaining > 0:
+        chunk = src.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            raise WavError("data 청크를 읽는 중 파일이 끝났습니다.")
+        dst.write(chunk)
+        remaining -= len(chunk)
+    dst.write(data_pad)
+    src.seek(0)
@@ -1,12 +1,22 @@
+import collections
+import email.utils
+import functools
+import hashlib
+import json
+import lzma
 import os
+import queue
+import random
 import time
 import tempfile
+import threading
 import traceback
 from pathlib import Path
 from typing import Optional
 
 import requests
-import winsound
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 # =========================
@@ -19,16 +29,142 @@ PASSWORD = os.getenv("MFMC_PASSWORD", "pass1234")
 POLL_INTERVAL = float(os.getenv("MFMC_POLL_INTERVAL", "3.0"))
 REQUEST_TIMEOUT = float(os.getenv("MFMC_REQUEST_TIMEOUT", "5.0"))
 HEARTBEAT_INTERVAL = int(os.getenv("MFMC_HEARTBEAT_INTERVAL", "120"))
+# 0보다 크면 long-poll 모드: 서버가 새 명령이 생길 때까지 최대 이 시간(초) 동안 응답을 보류 (기본 끔)
+# 대기 중인 요청마다 서버 워커 스레드 하나를 점유하므로, 서버를 장비 수 이상의 스레드로
+# 띄운 경우에만 켠다 (서버 mfmcAlertServer/settings.py 의 LONG_POLL_MAX_WAIT 참고)
+LONG_POLL_WAIT = float(os.getenv("MFMC_LONG_POLL_WAIT", "0"))
+# 폴링 간격에 곱할 무작위 흔들기 폭(0.2 = ±20%), 오류가 이어질 때 늘려 가는 대기 시간의 상한(초)
+POLL_JITTER = float(os.getenv("MFMC_POLL_JITTER", "0.2"))
+BACKOFF_MAX = float(os.getenv("MFMC_BACKOFF_MAX", "60"))
+# 예약 재생: 서버 시계 보정 값이 이 시간(초)보다 오래되면 다시 맞추고, 이보다 늦게 받은 예약은 재생하지 않음(초)
+CLOCK_SYNC_MAX_AGE = float(os.getenv("MFMC_CLOCK_SYNC_MAX_AGE", "300"))
+CLOCK_SYNC_SAMPLES = 3
+PLAY_LATE_MAX = float(os.getenv("MFMC_PLAY_LATE_MAX", "60"))
+# 다운로드 대기(retry_after) 뒤 음원 받기를 몇 번까지 시도할지
+DEFERRED_DOWNLOAD_ATTEMPTS = 3
+# poll: /api/status 반복 조회, stream: /api/stream (SSE) 연결 유지
+MODE = os.getenv("MFMC_MODE", "poll").lower()
+STREAM_READ_TIMEOUT = float(os.getenv("MFMC_STREAM_READ_TIMEOUT", "45"))
+# 1이면 앱 비밀번호를 /api/token 에서 Bearer 토큰으로 바꿔서 사용 (서버의 비밀번호 해시 계산 절약)
+USE_TOKEN = os.getenv("MFMC_USE_TOKEN", "1") == "1"
 
 STATE_DIR = Path(os.getenv("MFMC_STATE_DIR", tempfile.gettempdir()))
 LAST_ID_FILE = STATE_DIR / "mfmc_last_command_id.txt"
 WAV_FILE_PATH = STATE_DIR / "mfmc_received.wav"
+WAV_ETAG_FILE = STATE_DIR / "mfmc_received.etag"
+# 음원 캐시 (파일명 = 내용의 SHA-256), 용량을 넘으면 가장 오래 안 쓴 파일부터 삭제
+WAV_CACHE_DIR = STATE_DIR / "wav_cache"
+WAV_CACHE_MAX_BYTES = int(float(os.getenv("MFMC_WAV_CACHE_MAX_MB", "200")) * 1024 * 1024)
+# 음원 다운로드: 끊겼을 때 이어받기 재시도 횟수, 한 번에 쓰는 크기
+DOWNLOAD_RETRIES = int(os.getenv("MFMC_DOWNLOAD_RETRIES", "3"))
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# 서버에 요청할 압축 형식 (비우면 원본 WAV 만 받음)
+ACCEPT_CODECS = os.getenv("MFMC_ACCEPT_CODECS", "xz")
+# 사전 다운로드: manifest 동기화 주기(초), 속도 제한(KB/s, 0=제한 없음), 1이면 사전 배포 표시가 없는 음원도 받음
+PREFETCH_ENABLED = os.getenv("MFMC_PREFETCH", "1") == "1"
+PREFETCH_INTERVAL = float(os.getenv("MFMC_PREFETCH_INTERVAL", "600"))
+PREFETCH_KBPS = int(os.getenv("MFMC_PREFETCH_KBPS", "256"))
+PREFETCH_ALL = os.getenv("MFMC_PREFETCH_ALL", "0") == "1"
+
+# 서버 로그 전송: 백그라운드에서 모아서 /api/device-logs 로 보낸다
+LOG_BATCH_SIZE = int(os.getenv("MFMC_LOG_BATCH_SIZE", "50"))
+LOG_FLUSH_INTERVAL = float(os.getenv("MFMC_LOG_FLUSH_INTERVAL", "5"))
+LOG_QUEUE_MAX = int(os.getenv("MFMC_LOG_QUEUE_MAX", "1000"))
+# 전송하지 못한 명령 확인(ack)을 최대 몇 건까지 들고 있을지
+ACK_PENDING_MAX = 100
+
+# HTTP 연결 재사용: 연결 풀 크기, 연결 실패/5xx 재시도 횟수와 간격 계수(초)
+HTTP_POOL_SIZE = int(os.getenv("MFMC_HTTP_POOL_SIZE", "4"))
+HTTP_RETRIES = int(os.getenv("MFMC_HTTP_RETRIES", "2"))
+HTTP_BACKOFF = float(os.getenv("MFMC_HTTP_BACKOFF", "0.5"))
+# 재생 방식: auto(윈도우면 winsound) / winsound / null(재생 안 함, 테스트용)
+AUDIO_BACKEND = os.getenv("MFMC_AUDIO", "auto").lower()
 
 BASE_DIR = Path(os.path.dirname(os.path.abspath(__file__)))
 LOG_DIR = BASE_DIR / "logs"
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 
 _last_heartbeat_at = 0.0
+_status_etag: Optional[str] = None
+# 서버가 안내한 다음 폴링까지 대기 시간 (구버전 서버면 None)
+_next_poll_ms: Optional[int] = None
+
+
+def make_session() -> requests.Session:
+    """
+    모든 요청이 같이 쓰는 keep-alive 세션.
+    연결 실패와 502/503/504 는 GET 만 간격을 늘려 가며 다시 시도한다 (POST 는 중복될 수 있어 제외).
+    Retry-After 는 여기서 기다리지 않는다. 요청 안에서 잠들면 폴링 루프가 멈추고,
+    호출한 쪽(backoff_delay)이 같은 시간을 한 번 더 기다리게 된다.
+    """
+    retry = Retry(
+        total=HTTP_RETRIES,
+        read=0,
+        backoff_factor=HTTP_BACKOFF,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+SESSION = make_session()
+
+
+class DeviceAuth(requests.auth.AuthBase):
+    """
+    /api/token 으로 받은 Bearer 토큰을 붙인다.
+    토큰을 받을 수 없으면(구버전 서버 등) 잠시 Basic 인증으로 보낸다.
+    """
+
+    def __init__(self, username: str, password: str):
+        self.basic = requests.auth.HTTPBasicAuth(username, password)
+        self.token: Optional[str] = None
+        self.refresh_at = 0.0
+        self.lock = threading.Lock()
+
+    def _refresh(self) -> None:
+        try:
+            r = SESSION.post(f"{SERVER}/api/token", auth=self.basic, timeout=REQUEST_TIMEOUT)
+            r.raise_for_status()
+            data = r.json()
+            self.token = data["token"]
+            # 만료 전에 미리 갱신
+            self.refresh_at = time.time() + float(data.get("expires_in", 0)) * 0.9
+        except Exception:
+            self.token = None
+            self.refresh_at = time.time() + 60
+
+    def _on_response(self, r, **kwargs):
+        if r.status_code == 401:
+            with self.lock:
+                self.token = None
+                self.refresh_at = 0.0
+        return r
+
+    def __call__(self, r):
+        if not USE_TOKEN:
+            return self.basic(r)
+
+        with self.lock:
+            if time.time() >= self.refresh_at:
+                self._refresh()
+            token = self.token
+
+        if not token:
+            return self.basic(r)
+
+        r.headers["Authorization"] = f"Bearer {token}"
+        r.register_hook("response", self._on_response)
+        return r
+
+
+AUTH = DeviceAuth(USERNAME, PASSWORD)
 
 
 def current_log_path() -> Path:
@@ -36,6 +172,101 @@ def current_log_path() -> Path:
     return LOG_DIR / f"client_{date}.log"
 
 
+class LogShipper:
+    """
+    서버 로그/명령 확인(ack) 전송기.
+    log() 는 큐에 넣기만 하고, 전송은 백그라운드 스레드가 모아서 한 번에 한다.
+    큐가 가득 차면 새 로그는 버리고 버린 개수만 다음 전송에 알린다.
+    ack 는 명령별 단계 시각(fetched/downloaded/playing)을 모아 두었다가 같이 보낸다.
+    """
+
+    def __init__(self, auth: requests.auth.AuthBase):
+        self.auth = auth
+        self.queue: "queue.Queue[dict]" = queue.Queue(maxsize=LOG_QUEUE_MAX)
+        self.dropped = 0
+        self.thread: Optional[threading.Thread] = None
+        self.acks: dict = {}
+        self.ack_lock = threading.Lock()
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self._run, name="log-shipper", daemon=True)
+        self.thread.start()
+
+    def put(self, level: str, msg: str) -> None:
+        try:
+            self.queue.put_nowait({"level": level, "message": msg, "ts": time.time()})
+        except queue.Full:
+            self.dropped += 1
+
+    def ack(self, command_id: int, stage: str, skew_ms: Optional[int] = None) -> None:
+        """명령 처리 단계 시각 기록 (서버 시계 기준, 같은 단계는 처음 값만)."""
+        with self.ack_lock:
+            entry = self.acks.setdefault(command_id, {"command_id": command_id})
+            entry.setdefault(stage, CLOCK.now())
+            if skew_ms is not None:
+                entry.setdefault("skew_ms", skew_ms)
+
+    def _take_batch(self, pending: list) -> None:
+        deadline = time.monotonic() + LOG_FLUSH_INTERVAL
+        while len(pending) < LOG_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+    def _send(self, path: str, records: list) -> bool:
+        try:
+            r = SESSION.post(
+                f"{SERVER}{path}",
+                json=records,
+                auth=self.auth,
+                timeout=REQUEST_TIMEOUT,
+            )
+            # 4xx 는 다시 보내도 같으므로 버린다
+            return r.status_code < 500
+        except Exception:
+            return False
+
+    def _send_acks(self) -> None:
+        with self.ack_lock:
+            acks, self.acks = self.acks, {}
+        if not acks or self._send("/api/ack", list(acks.values())):
+            return
+        # 실패하면 다음 주기에 다시 (그 사이 새로 기록된 단계와 합침)
+        with self.ack_lock:
+            for command_id, stages in acks.items():
+                merged = self.acks.setdefault(command_id, {})
+                for k, v in stages.items():
+                    merged.setdefault(k, v)
+            for command_id in sorted(self.acks)[:-ACK_PENDING_MAX]:
+                del self.acks[command_id]
+
+    def _run(self) -> None:
+        pending: list = []
+        while True:
+            self._take_batch(pending)
+            self._send_acks()
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+                pending.append({"level": "WARNING", "message": f"[LOG] dropped={dropped}", "ts": time.time()})
+            if not pending:
+                continue
+
+            batch = pending[:LOG_BATCH_SIZE]
+            if self._send("/api/device-logs", batch):
+                del pending[:len(batch)]
+            else:
+                # 실패분은 다음 주기에 다시 보낸다 (오래된 것부터 버려서 크기 제한)
+                del pending[:max(0, len(pending) - LOG_QUEUE_MAX)]
+                time.sleep(LOG_FLUSH_INTERVAL)
+
+
+SHIPPER = LogShipper(AUTH)
+
+
 def log(msg: str, level: str = "INFO") -> None:
     line = time.strftime("[%Y-%m-%d %H:%M:%S] ") + f"[{level}] {msg}"
 
@@ -45,15 +276,7 @@ def log(msg: str, level: str = "INFO") -> None:
     except Exception:
         pass
 
-    try:
-        requests.post(
-            f"{SERVER}/api/device-log",
-            data={"level": level, "message": msg},
-            auth=(USERNAME, PASSWORD),
-            timeout=3,
-        )
-    except Exception:
-        pass
+    SHIPPER.put(level, msg)
 
 
 def log_exception(prefix: str, exc: Exception) -> None:
@@ -82,54 +305,606 @@ def save_last_id(v: int) -> None:
         pass
 
 
+# =========================
+# 음원 캐시
+# =========================
+_cache_stats = {"hits": 0, "misses": 0, "bytes_saved": 0}
+# 캐시 디렉터리를 쓰는 스레드(명령 처리 / 사전 다운로드) 간 잠금
+_cache_lock = threading.Lock()
+# 명령 처리가 캐시를 기다리는 중이면 set (사전 다운로드는 즉시 양보)
+_busy = threading.Event()
+
+
+def sha256_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_path(sha256: str) -> Path:
+    return WAV_CACHE_DIR / f"{sha256}.wav"
+
+
+def cache_lookup(sha256: str) -> Optional[Path]:
+    path = cache_path(sha256)
+    if not path.exists():
+        return None
+
+    if sha256_file(path) != sha256:
+        log(f"[CACHE] corrupted, removing {path.name}", level="WARNING")
+        path.unlink(missing_ok=True)
+        return None
+
+    # LRU: 사용 시각 갱신
+    os.utime(path, None)
+    return path
+
+
+def cache_evict(keep: Path) -> None:
+    files = sorted(WAV_CACHE_DIR.glob("*.wav"), key=lambda p: p.stat().st_mtime)
+    total = sum(p.stat().st_size for p in files)
+    for p in files:
+        if total <= WAV_CACHE_MAX_BYTES:
+            break
+        if p == keep:
+            continue
+        total -= p.stat().st_size
+        p.unlink(missing_ok=True)
+        log(f"[CACHE] evict {p.name}")
+
+
+def cache_store(part: Path, sha256: str) -> Path:
+    """다 받은 part 파일을 검증한 뒤 캐시에 넣는다."""
+    actual = sha256_file(part)
+    if actual != sha256:
+        part.unlink(missing_ok=True)
+        raise ValueError(f"hash mismatch expected={sha256} actual={actual}")
+
+    path = cache_path(sha256)
+    write_wav_atomic(part, path)
+    cache_evict(keep=path)
+    return path
+
+
+def cache_stats_text() -> str:
+    s = _cache_stats
+    return f"hits={s['hits']} misses={s['misses']} bytes_saved={s['bytes_saved']}"
+
+
 # =========================
 # 오디오 제어
 # =========================
+class AudioBackend:
+    """재생 장치. play 는 재생을 시작만 하고 바로 돌아와야 한다."""
+
+    name = "base"
+
+    def play(self, path: Path) -> None:
+        raise NotImplementedError
+
+    def stop(self) -> None:
+        raise NotImplementedError
+
+
+class WinsoundBackend(AudioBackend):
+    name = "winsound"
+
+    def __init__(self):
+        import winsound
+
+        self.winsound = winsound
+
+    def play(self, path: Path) -> None:
+        self.winsound.PlaySound(str(path), self.winsound.SND_FILENAME | self.winsound.SND_ASYNC)
+
+    def stop(self) -> None:
+        self.winsound.PlaySound(None, self.winsound.SND_PURGE)
+
+
+class NullBackend(AudioBackend):
+    """재생하지 않고 요청만 기록 (윈도우가 아닌 곳에서 테스트용)."""
+
+    name = "null"
+
+    def __init__(self):
+        self.played: list = []
+
+    def play(self, path: Path) -> None:
+        self.played.append(path)
+
+    def stop(self) -> None:
+        pass
+
+
+def make_audio_backend(name: str) -> AudioBackend:
+    if name == "null":
+        return NullBackend()
+    if name == "winsound":
+        return WinsoundBackend()
+    try:
+        return WinsoundBackend()
+    except ImportError:
+        return NullBackend()
+
+
+AUDIO = make_audio_backend(AUDIO_BACKEND)
+
+
 def stop_audio() -> None:
     try:
-        winsound.PlaySound(None, winsound.SND_PURGE)
+        AUDIO.stop()
     except Exception as e:
         log_exception("[AUDIO_STOP]", e)
 
 
-def play_wav(path: Path) -> None:
+def play_wav(path: Path) -> bool:
     stop_audio()
     try:
-        winsound.PlaySound(str(path), winsound.SND_FILENAME | winsound.SND_ASYNC)
+        AUDIO.play(path)
+        return True
     except Exception as e:
         log_exception("[AUDIO_PLAY]", e)
+        return False
+
+
+# =========================
+# 서버 시계
+# =========================
+class ClockSync:
+    """
+    서버 시계와의 차이(offset, 초) 추정.
+    status 응답의 server_time_ms(응답 시각)/held_ms(서버가 붙잡고 있던 시간)로 NTP 처럼 계산하고,
+    최근 표본 중 왕복 지연이 가장 짧은(= 가장 정확한) 것을 쓴다.
+    """
+
+    def __init__(self, keep: int = 8):
+        self.samples: collections.deque = collections.deque(maxlen=keep)
+        self.lock = threading.Lock()
+        self.updated_at: Optional[float] = None
+
+    def add(self, sent: float, received: float, server_time_ms: int, held_ms: int = 0) -> None:
+        """sent/received: 요청 전후의 time.time()"""
+        delay = max(0.0, (received - sent) - held_ms / 1000)
+        # 응답이 오는 데 왕복의 절반이 걸렸다고 본다
+        offset = server_time_ms / 1000 + delay / 2 - received
+        with self.lock:
+            self.samples.append((delay, offset))
+            self.updated_at = time.monotonic()
+
+    def offset(self) -> float:
+        with self.lock:
+            return min(self.samples)[1] if self.samples else 0.0
+
+    def age(self) -> float:
+        with self.lock:
+            return float("inf") if self.updated_at is None else time.monotonic() - self.updated_at
+
+    def now(self) -> float:
+        """서버 시계 기준 현재 시각 (epoch 초)."""
+        return time.time() + self.offset()
+
+
+CLOCK = ClockSync()
+
+
+def _clock_sample(sent: float, received: float, data: dict) -> None:
+    if "server_time_ms" in data:
+        CLOCK.add(sent, received, int(data["server_time_ms"]), int(data.get("held_ms") or 0))
+
+
+def sync_clock(auth: requests.auth.AuthBase, last_id: Optional[int]) -> None:
+    """예약 재생 전에 시계 표본을 몇 개 더 모은다 (ETag/명령 처리와 무관한 조회)."""
+    params = {"last_id": str(last_id)} if last_id is not None else {}
+    for _ in range(CLOCK_SYNC_SAMPLES):
+        try:
+            sent = time.time()
+            r = SESSION.get(f"{SERVER}/api/status", params=params, auth=auth, timeout=REQUEST_TIMEOUT)
+            received = time.time()
+            if r.status_code == 200:
+                _clock_sample(sent, received, r.json())
+        except Exception as e:
+            log_exception("[CLOCK]", e)
+            return
+    log(f"[CLOCK] offset={CLOCK.offset() * 1000:.1f}ms samples={len(CLOCK.samples)}")
+
+
+# =========================
+# 예약 재생
+# =========================
+# 타이머 해상도(윈도우 약 15ms)보다 정확히 맞추려고 마지막 이 시간(초)은 짧게 돌면서 기다린다
+_SPIN_SECONDS = 0.03
+
+
+def wait_until(server_ts: float, cancel: threading.Event) -> bool:
+    """서버 시계로 server_ts 가 될 때까지 기다린다. 취소되면 False."""
+    while True:
+        remaining = server_ts - CLOCK.now()
+        if remaining <= 0:
+            return True
+        if remaining > _SPIN_SECONDS:
+            # 기다리는 중에도 시계 보정 값이 바뀔 수 있으므로 길게 한 번에 자지 않는다
+            if cancel.wait(min(remaining - _SPIN_SECONDS, 1.0)):
+                return False
+        elif cancel.is_set():
+            return False
+        else:
+            time.sleep(0)
+
+
+class PlaybackScheduler:
+    """
+    예약 재생 1건을 기다렸다가 시작하고, 실제 시작 시각과 play_at 의 차이(skew_ms)를 ack 로 보고한다.
+    서버가 흩어 준 다운로드 대기(retry_after)도 여기서 기다린다 (메인 루프는 계속 폴링).
+    새 PLAY/STOP 이 오면 기다리던 예약은 취소한다.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending: Optional[threading.Event] = None
+
+    def _start(self, name: str, target, *args) -> None:
+        cancel = threading.Event()
+        with self.lock:
+            if self.pending:
+                self.pending.set()
+            self.pending = cancel
+        threading.Thread(target=target, args=(*args, cancel), name=name, daemon=True).start()
+
+    def schedule(self, command_id: int, path: Path, play_at: float) -> None:
+        self._start(f"play-{command_id}", self._run, command_id, path, play_at)
+
+    def defer(self, command_id: int, delay: float, job) -> None:
+        """delay 초 뒤 job(cancel) 실행. 그 전에 새 PLAY/STOP 이 오면 실행하지 않는다."""
+        self._start(f"deferred-{command_id}", self._run_deferred, command_id, delay, job)
+
+    def _run_deferred(self, command_id: int, delay: float, job, cancel: threading.Event) -> None:
+        if cancel.wait(delay):
+            log(f"[SCHEDULE] cancelled id={command_id}")
+            return
+        # 받는 동안에도 cancel() 이 닿도록 끝날 때까지 pending 으로 둔다
+        try:
+            job(cancel)
+        finally:
+            with self.lock:
+                if self.pending is cancel:
+                    self.pending = None
+
+    def cancel(self) -> None:
+        with self.lock:
+            cancel, self.pending = self.pending, None
+        if cancel:
+            cancel.set()
+
+    def _run(self, command_id: int, path: Path, play_at: float, cancel: threading.Event) -> None:
+        if not wait_until(play_at, cancel):
+            log(f"[SCHEDULE] cancelled id={command_id}")
+            return
+        ok = play_wav(path)
+        skew_ms = int(round((CLOCK.now() - play_at) * 1000))
+        with self.lock:
+            if self.pending is cancel:
+                self.pending = None
+        if ok:
+            SHIPPER.ack(command_id, "playing", skew_ms=skew_ms)
+        log(f"[SCHEDULE] played id={command_id} skew={skew_ms}ms offset={CLOCK.offset() * 1000:.1f}ms")
+
+
+PLAYBACK = PlaybackScheduler()
+
+
+def schedule_play(auth: requests.auth.AuthBase, command_id: int, path: Path, play_at: float,
+                  last_id: Optional[int]) -> None:
+    if CLOCK.age() > CLOCK_SYNC_MAX_AGE:
+        sync_clock(auth, last_id)
+
+    ahead = play_at - CLOCK.now()
+    if ahead < -PLAY_LATE_MAX:
+        log(f"[SCHEDULE] skip id={command_id} late={-ahead:.1f}s", level="WARNING")
+        return
+    log(f"[SCHEDULE] id={command_id} in {ahead:.2f}s")
+    PLAYBACK.schedule(command_id, path, play_at)
 
 
 # =========================
 # 서버 통신
 # =========================
-def fetch_status(auth: tuple[str, str], last_id: Optional[int]) -> dict:
-    params = {"last_id": str(last_id)} if last_id is not None else None
-    r = requests.get(
+def fetch_status(auth: requests.auth.AuthBase, last_id: Optional[int], wait: float = 0) -> dict:
+    global _status_etag, _next_poll_ms
+    params = {}
+    if last_id is not None:
+        params["last_id"] = str(last_id)
+    if wait > 0:
+        params["wait"] = str(wait)
+    # 304 에는 서버 시각이 없으므로 시계 표본이 오래되면 본문을 받는다
+    use_etag = _status_etag and CLOCK.age() < CLOCK_SYNC_MAX_AGE
+    headers = {"If-None-Match": _status_etag} if use_etag else None
+    sent = time.time()
+    r = SESSION.get(
         f"{SERVER}/api/status",
         params=params,
+        headers=headers,
         auth=auth,
-        timeout=REQUEST_TIMEOUT,
+        timeout=REQUEST_TIMEOUT + wait,
     )
+    received = time.time()
+    if r.status_code == 304:
+        # 마지막 응답과 같음 = 새 명령 없음
+        return {"has_command": False}
     r.raise_for_status()
-    return r.json()
+    _status_etag = r.headers.get("ETag")
+    data = r.json()
+    _clock_sample(sent, received, data)
+    # 304 에는 본문이 없으므로 마지막으로 받은 안내 값을 계속 쓴다 (값이 바뀌면 ETag 도 바뀜)
+    _next_poll_ms = data.get("next_poll_ms")
+    return data
+
+
+def forget_status_etag() -> None:
+    global _status_etag
+    _status_etag = None
+
 
+def stream_commands(auth: requests.auth.AuthBase, last_id: Optional[int]):
+    """
+    /api/stream (SSE) 에 연결해서 명령을 하나씩 돌려준다.
+    keepalive 를 받으면 None 을 돌려준다(하트비트 처리용).
+    """
+    headers = {"Accept": "text/event-stream"}
+    if last_id is not None:
+        headers["Last-Event-ID"] = str(last_id)
 
-def download_wav(auth: tuple[str, str], command_id: int) -> bytes:
-    r = requests.get(
-        f"{SERVER}/api/file",
-        params={"command_id": str(command_id)},
+    with SESSION.get(
+        f"{SERVER}/api/stream",
+        headers=headers,
         auth=auth,
-        timeout=60,
+        stream=True,
+        timeout=(REQUEST_TIMEOUT, STREAM_READ_TIMEOUT),
+    ) as r:
+        r.raise_for_status()
+        data_lines = []
+        for line in r.iter_lines(decode_unicode=True):
+            if line is None:
+                continue
+            if not line:
+                if data_lines:
+                    yield json.loads("\n".join(data_lines))
+                data_lines = []
+                continue
+            if line.startswith(":"):
+                yield None
+                continue
+
+            field, _, value = line.partition(":")
+            if field == "data":
+                data_lines.append(value[1:] if value.startswith(" ") else value)
+
+
+class DownloadInterrupted(Exception):
+    pass
+
+
+def download_wav(
+    auth: requests.auth.AuthBase,
+    params: dict,
+    part: Path,
+    if_none_match: Optional[str] = None,
+    max_bytes_per_sec: int = 0,
+    interrupt: Optional[threading.Event] = None,
+) -> Optional[str]:
+    """
+    /api/file 을 part 파일로 조금씩 받는다(메모리에 전체를 올리지 않음).
+    중간에 끊기면 받은 곳부터 Range 요청으로 이어받는다.
+    받은 파일의 ETag(없으면 "")를 돌려주고, if_none_match 와 같아서 받을 필요가 없으면(304) None.
+
+    max_bytes_per_sec: 0보다 크면 속도 제한 (사전 다운로드용)
+    interrupt: set 되면 DownloadInterrupted (받은 부분은 남겨서 나중에 이어받음)
+    """
+    etag_path = part.with_name(part.name + ".etag")
+    part.parent.mkdir(parents=True, exist_ok=True)
+
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        offset = part.stat().st_size if part.exists() else 0
+        try:
+            saved_etag = etag_path.read_text(encoding="utf-8").strip() if offset else ""
+        except Exception:
+            saved_etag = ""
+
+        headers = {}
+        if offset and saved_etag:
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = saved_etag
+        elif if_none_match:
+            headers["If-None-Match"] = if_none_match
+
+        try:
+            with SESSION.get(
+                f"{SERVER}/api/file",
+                params=params,
+                headers=headers,
+                auth=auth,
+                stream=True,
+                timeout=(REQUEST_TIMEOUT, 60),
+            ) as r:
+                if r.status_code == 304:
+                    return None
+                if r.status_code == 416 and r.headers.get("Content-Range") == f"bytes */{offset}":
+                    # 이미 끝까지 받아 둔 상태
+                    etag_path.unlink(missing_ok=True)
+                    return saved_etag
+                if r.status_code == 416:
+                    # 서버 파일이 더 작아짐 -> 처음부터 다시
+                    part.unlink(missing_ok=True)
+                    etag_path.unlink(missing_ok=True)
+                r.raise_for_status()
+
+                etag = r.headers.get("ETag", "")
+                if etag:
+                    etag_path.write_text(etag, encoding="utf-8")
+                else:
+                    etag_path.unlink(missing_ok=True)
+
+                # 206 이면 이어쓰기, 200 이면(파일이 바뀌었거나 Range 미지원) 처음부터
+                started = time.monotonic()
+                received = 0
+                with open(part, "ab" if r.status_code == 206 else "wb") as f:
+                    for chunk in r.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+                        received += len(chunk)
+                        if interrupt is not None and interrupt.is_set():
+                            raise DownloadInterrupted()
+                        if max_bytes_per_sec > 0:
+                            ahead = received / max_bytes_per_sec - (time.monotonic() - started)
+                            if ahead > 0:
+                                time.sleep(ahead)
+
+            etag_path.unlink(missing_ok=True)
+            return etag
+
+        except requests.exceptions.RequestException as e:
+            if attempt >= DOWNLOAD_RETRIES:
+                raise
+            received = part.stat().st_size if part.exists() else 0
+            log(
+                f"[DOWNLOAD] interrupted {params} received={received} "
+                f"retry={attempt + 1}/{DOWNLOAD_RETRIES} err={repr(e)}",
+                level="WARNING",
+            )
+            time.sleep(min(2 ** attempt, 10))
+
+
+XZ_MAGIC = b"\xfd7zXZ\x00"
+
+
+def decode_download(part: Path) -> None:
+    """받은 파일이 압축본이면 그 자리에서 원본 WAV 로 푼다."""
+    with open(part, "rb") as f:
+        magic = f.read(len(XZ_MAGIC))
+    if magic != XZ_MAGIC:
+        return
+
+    decoded = part.with_suffix(".decoded")
+    decompressor = lzma.LZMADecompressor()
+    with open(part, "rb") as src, open(decoded, "wb") as dst:
+        for chunk in iter(lambda: src.read(DOWNLOAD_CHUNK_SIZE), b""):
+            dst.write(decompressor.decompress(chunk))
+    if not decompressor.eof:
+        decoded.unlink(missing_ok=True)
+        part.unlink(missing_ok=True)
+        raise ValueError("truncated xz download")
+    decoded.replace(part)
+
+
+def file_params(**params) -> dict:
+    if ACCEPT_CODECS:
+        params["accept"] = ACCEPT_CODECS
+    return params
+
+
+def write_wav_atomic(tmp: Path, dest: Path = WAV_FILE_PATH) -> None:
+    tmp.replace(dest)
+
+
+def fetch_cached_wav(auth: requests.auth.AuthBase, command_id: int, sha256: str) -> Path:
+    """캐시에 없으면 받는다."""
+    # 사전 다운로드 중이면 멈추게 하고 캐시를 넘겨받는다
+    _busy.set()
+    with _cache_lock:
+        _busy.clear()
+        path = cache_lookup(sha256)
+        if path:
+            size = path.stat().st_size
+            _cache_stats["hits"] += 1
+            _cache_stats["bytes_saved"] += size
+            log(f"[CACHE] HIT sha256={sha256[:12]} size={size} {cache_stats_text()}")
+            return path
+
+        part = cache_path(sha256).with_suffix(".part")
+        download_wav(auth, file_params(command_id=str(command_id)), part)
+        downloaded = part.stat().st_size
+        decode_download(part)
+        path = cache_store(part, sha256)
+
+    size = path.stat().st_size
+    _cache_stats["misses"] += 1
+    _cache_stats["bytes_saved"] += max(size - downloaded, 0)
+    log(f"[CACHE] MISS sha256={sha256[:12]} downloaded={downloaded} size={size} {cache_stats_text()}")
+    return path
+
+
+# =========================
+# 사전 다운로드 (manifest 동기화)
+# =========================
+_manifest_etag: Optional[str] = None
+_manifest_files: list = []
+_reported_hashes: Optional[list] = None
+
+
+def fetch_manifest(auth: requests.auth.AuthBase) -> list:
+    global _manifest_etag, _manifest_files
+    headers = {"If-None-Match": _manifest_etag} if _manifest_etag else None
+    r = SESSION.get(f"{SERVER}/api/manifest", headers=headers, auth=auth, timeout=REQUEST_TIMEOUT)
+    if r.status_code == 304:
+        return _manifest_files
+    r.raise_for_status()
+    _manifest_etag = r.headers.get("ETag")
+    _manifest_files = r.json().get("files", [])
+    return _manifest_files
+
+
+def report_cache(auth: requests.auth.AuthBase) -> None:
+    """보유 음원이 바뀌었을 때만 서버에 보고."""
+    global _reported_hashes
+    hashes = sorted(p.stem for p in WAV_CACHE_DIR.glob("*.wav")) if WAV_CACHE_DIR.exists() else []
+    if hashes == _reported_hashes:
+        return
+    r = SESSION.post(
+        f"{SERVER}/api/cache-report",
+        json={"sha256": hashes},
+        auth=auth,
+        timeout=REQUEST_TIMEOUT,
     )
     r.raise_for_status()
-    return r.content
+    _reported_hashes = hashes
+
+
+def prefetch_once(auth: requests.auth.AuthBase) -> None:
+    files = [f for f in fetch_manifest(auth) if f.get("sha256") and (PREFETCH_ALL or f.get("predistribute"))]
+    for f in files:
+        sha256 = f["sha256"]
+        if _busy.is_set():
+            return
+        with _cache_lock:
+            if cache_path(sha256).exists():
+                continue
+            part = cache_path(sha256).with_suffix(".part")
+            try:
+                download_wav(
+                    auth,
+                    file_params(wav_id=str(f["id"])),
+                    part,
+                    max_bytes_per_sec=PREFETCH_KBPS * 1024,
+                    interrupt=_busy,
+                )
+            except DownloadInterrupted:
+                log(f"[PREFETCH] paused for command sha256={sha256[:12]}")
+                return
+            downloaded = part.stat().st_size
+            decode_download(part)
+            cache_store(part, sha256)
+            log(f"[PREFETCH] stored sha256={sha256[:12]} downloaded={downloaded} size={f.get('size')}")
 
+    report_cache(auth)
 
-def write_wav_atomic(data: bytes) -> None:
-    tmp = WAV_FILE_PATH.with_suffix(".tmp")
-    tmp.write_bytes(data)
-    tmp.replace(WAV_FILE_PATH)
+
+def prefetch_loop(auth: requests.auth.AuthBase) -> None:
+    while True:
+        try:
+            prefetch_once(auth)
+        except Exception as e:
+            log_exception("[PREFETCH]", e)
+        time.sleep(PREFETCH_INTERVAL)
 
 
 # =========================
@@ -143,77 +918,251 @@ def maybe_heartbeat(last_id: Optional[int]) -> None:
         log(f"[HEARTBEAT] alive last_id={last_id}")
 
 
+# =========================
+# 명령 처리
+# =========================
+def fetch_command_wav(auth: requests.auth.AuthBase, cmd_id: int, sha256: Optional[str]) -> Path:
+    if sha256:
+        return fetch_cached_wav(auth, cmd_id, sha256)
+
+    # 해시를 주지 않는 서버: 단일 파일 + ETag 재사용
+    current_etag = None
+    try:
+        if WAV_FILE_PATH.exists():
+            current_etag = WAV_ETAG_FILE.read_text(encoding="utf-8").strip()
+    except Exception:
+        pass
+
+    etag = download_wav(
+        auth,
+        {"command_id": str(cmd_id)},
+        WAV_FILE_PATH.with_suffix(".tmp"),
+        current_etag,
+    )
+    if etag is None:
+        log(f"[FILE] not modified, reuse {WAV_FILE_PATH.name}")
+    else:
+        write_wav_atomic(WAV_FILE_PATH.with_suffix(".tmp"))
+        try:
+            if etag:
+                WAV_ETAG_FILE.write_text(etag, encoding="utf-8")
+            else:
+                WAV_ETAG_FILE.unlink(missing_ok=True)
+        except Exception:
+            pass
+    return WAV_FILE_PATH
+
+
+def play_command(auth: requests.auth.AuthBase, cmd_id: int, sha256: Optional[str], play_at_ms,
+                 cancel: Optional[threading.Event] = None) -> None:
+    """음원을 받아서 바로 재생하거나 play_at 에 예약한다."""
+    path = fetch_command_wav(auth, cmd_id, sha256)
+    SHIPPER.ack(cmd_id, "downloaded")
+    if cancel is not None and cancel.is_set():
+        # 받는 사이에 새 PLAY/STOP 이 왔다
+        log(f"[SCHEDULE] cancelled id={cmd_id}")
+        return
+    if play_at_ms:
+        # 미리 받아 두고 정해진 시각에 다른 장비들과 같이 재생
+        schedule_play(auth, cmd_id, path, int(play_at_ms) / 1000, cmd_id)
+    elif play_wav(path):
+        SHIPPER.ack(cmd_id, "playing")
+
+
+def deferred_play(auth: requests.auth.AuthBase, cmd_id: int, sha256: str, play_at_ms,
+                  cancel: threading.Event) -> None:
+    """대기 후 받기. 메인 루프가 이미 last_id 를 넘겼으므로 실패하면 취소될 때까지 몇 번 더 받아 본다."""
+    for attempt in range(1, DEFERRED_DOWNLOAD_ATTEMPTS + 1):
+        try:
+            play_command(auth, cmd_id, sha256, play_at_ms, cancel)
+            return
+        except Exception as e:
+            log_exception(f"[DOWNLOAD] id={cmd_id} attempt={attempt}", e)
+            if attempt == DEFERRED_DOWNLOAD_ATTEMPTS or cancel.wait(backoff_delay(attempt, e)):
+                return
+
+
+def handle_command(auth: requests.auth.AuthBase, data: dict, last_id: Optional[int]) -> Optional[int]:
+    """명령 하나를 처리하고 새 last_id 를 돌려준다."""
+    cmd_id = int(data["command_id"])
+    action = (data.get("action") or "").upper()
+
+    if last_id is not None and cmd_id <= last_id:
+        return last_id
+
+    SHIPPER.ack(cmd_id, "fetched")
+
+    if action == "STOP":
+        log(f"[COMMAND] STOP id={cmd_id}")
+        PLAYBACK.cancel()
+        stop_audio()
+
+    elif action == "PLAY":
+        filename = data.get("filename", "unknown")
+        sha256 = data.get("sha256")
+        play_at_ms = data.get("play_at_ms")
+        log(f"[COMMAND] PLAY id={cmd_id} file={filename} play_at_ms={play_at_ms}")
+        PLAYBACK.cancel()
+
+        # 전체 방송 때 서버가 흩어 준 다운로드 대기 시간(초). 캐시에 있으면 기다릴 필요 없다
+        delay = float(data.get("retry_after") or 0)
+        if sha256 and delay > 0 and not cache_lookup(sha256):
+            # 기다리는 동안에도 폴링은 계속한다 (그 사이 STOP/새 PLAY 가 오면 취소)
+            log(f"[DOWNLOAD] wait {delay:.2f}s before fetching command={cmd_id}")
+            PLAYBACK.defer(cmd_id, delay, functools.partial(deferred_play, auth, cmd_id, sha256, play_at_ms))
+        else:
+            play_command(auth, cmd_id, sha256, play_at_ms)
+
+    elif action == "PING":
+        log(f"[COMMAND] PING id={cmd_id}")
+        log(f"Ping received from server. Client is active. Command ID: {cmd_id}", level="INFO")
+
+    else:
+        log(f"[COMMAND] UNKNOWN action={action} id={cmd_id}", level="WARNING")
+
+    save_last_id(cmd_id)
+    return cmd_id
+
+
+# =========================
+# 폴링 간격
+# =========================
+def jittered(seconds: float) -> float:
+    """모든 장비가 같은 순간에 요청하지 않도록 ±POLL_JITTER 만큼 흔든다."""
+    return max(0.0, seconds * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER))
+
+
+def next_poll_delay() -> float:
+    """다음 status 요청까지 기다릴 시간(초). 서버 안내가 없으면 설정값."""
+    if _next_poll_ms is not None:
+        return jittered(_next_poll_ms / 1000)
+    return 0.0 if LONG_POLL_WAIT > 0 else jittered(POLL_INTERVAL)
+
+
+def retry_after_seconds(exc: Exception) -> Optional[float]:
+    """429/503 응답의 Retry-After (초 또는 HTTP 날짜)."""
+    response = getattr(exc, "response", None)
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(failures: int, exc: Optional[Exception] = None) -> float:
+    """
+    연속 실패 횟수만큼 간격을 두 배씩 늘린다 (BACKOFF_MAX 까지).
+    절반~전체 사이에서 무작위로 골라서 재연결이 한꺼번에 몰리지 않게 하고,
+    서버가 Retry-After 를 주면 그보다 일찍 다시 요청하지 않는다.
+    """
+    base = min(BACKOFF_MAX, POLL_INTERVAL * 2 ** max(failures - 1, 0))
+    delay = random.uniform(base / 2, base)
+    retry_after = retry_after_seconds(exc) if exc is not None else None
+    if retry_after is not None:
+        delay = max(delay, retry_after * random.uniform(1, 1 + POLL_JITTER))
+    return delay
+
+
 # =========================
 # 메인 루프
 # =========================
+def run_stream(auth: requests.auth.AuthBase, last_id: Optional[int]) -> None:
+    failures = 0
+    while True:
+        error = None
+        try:
+            for data in stream_commands(auth, last_id):
+                failures = 0
+                if data is None:
+                    maybe_heartbeat(last_id)
+                    continue
+                last_id = handle_command(auth, data, last_id)
+
+        except requests.exceptions.RequestException as e:
+            error = e
+            log_exception("[NETWORK]", e)
+        except Exception as e:
+            error = e
+            log_exception("[UNEXPECTED]", e)
+
+        # 연결이 끊기면 잠시 후 last_id 부터 다시 연결 (실패가 이어지면 점점 길게)
+        failures += 1
+        time.sleep(backoff_delay(failures, error))
+
+
 def main() -> None:
+    SHIPPER.start()
     log(
         "[STARTUP] "
         f"server={SERVER} "
         f"user={USERNAME} "
+        f"mode={MODE} "
         f"poll={POLL_INTERVAL}s "
+        f"long_poll_wait={LONG_POLL_WAIT}s "
+        f"jitter={POLL_JITTER} backoff_max={BACKOFF_MAX}s "
+        f"clock_sync={CLOCK_SYNC_MAX_AGE}s play_late_max={PLAY_LATE_MAX}s "
         f"state_dir={STATE_DIR} "
+        f"wav_cache_max={WAV_CACHE_MAX_BYTES}B "
+        f"codecs={ACCEPT_CODECS or 'wav'} "
+        f"prefetch={PREFETCH_ENABLED}/{PREFETCH_INTERVAL}s/{PREFETCH_KBPS}KBps "
+        f"audio={AUDIO.name} "
+        f"http_pool={HTTP_POOL_SIZE} "
         f"log_dir={LOG_DIR} "
         f"heartbeat={HEARTBEAT_INTERVAL}s"
     )
 
     STATE_DIR.mkdir(parents=True, exist_ok=True)
 
-    auth = (USERNAME, PASSWORD)
+    auth = AUTH
     last_id = load_last_id()
     if last_id is not None:
         log(f"[STATE] last_command_id={last_id}")
 
-    while True:
-        try:
-            data = fetch_status(auth, last_id)
-
-            if not data.get("has_command"):
-                maybe_heartbeat(last_id)
-                time.sleep(POLL_INTERVAL)
-                continue
+    if PREFETCH_ENABLED:
+        threading.Thread(target=prefetch_loop, args=(auth,), name="prefetch", daemon=True).start()
 
-            cmd_id = int(data["command_id"])
-            action = (data.get("action") or "").upper()
-
-            if last_id is not None and cmd_id <= last_id:
-                time.sleep(POLL_INTERVAL)
-                continue
+    if MODE == "stream":
+        run_stream(auth, last_id)
+        return
 
-            if action == "STOP":
-                log(f"[COMMAND] STOP id={cmd_id}")
-                stop_audio()
-                last_id = cmd_id
-                save_last_id(last_id)
+    # 정전/서버 재시작 뒤 모든 장비가 같은 순간에 접속하지 않도록 첫 요청을 흩어 준다
+    time.sleep(random.uniform(0, POLL_INTERVAL))
 
-            elif action == "PLAY":
-                filename = data.get("filename", "unknown")
-                log(f"[COMMAND] PLAY id={cmd_id} file={filename}")
-
-                wav_bytes = download_wav(auth, cmd_id)
-                write_wav_atomic(wav_bytes)
-                play_wav(WAV_FILE_PATH)
-
-                last_id = cmd_id
-                save_last_id(last_id)
-
-            elif action == "PING":
-                log(f"[COMMAND] PING id={cmd_id}")
-                log(f"Ping received from server. Client is active. Command ID: {cmd_id}", level="INFO")
-                last_id = cmd_id
-                save_last_id(last_id)
+    failures = 0
+    while True:
+        try:
+            data = fetch_status(auth, last_id, LONG_POLL_WAIT)
+            failures = 0
 
+            if data.get("has_command"):
+                try:
+                    last_id = handle_command(auth, data, last_id)
+                except Exception:
+                    # 처리하지 못한 명령은 다음 폴링에서 304 없이 다시 받는다
+                    forget_status_etag()
+                    raise
             else:
-                log(f"[COMMAND] UNKNOWN action={action} id={cmd_id}", level="WARNING")
-                last_id = cmd_id
-                save_last_id(last_id)
+                maybe_heartbeat(last_id)
+
+            # 서버가 안내한 간격 (long-poll 은 보통 0 = 바로 다음 명령을 기다림)
+            delay = next_poll_delay()
 
         except requests.exceptions.RequestException as e:
+            failures += 1
             log_exception("[NETWORK]", e)
+            delay = backoff_delay(failures, e)
         except Exception as e:
+            failures += 1
             log_exception("[UNEXPECTED]", e)
+            delay = backoff_delay(failures)
 
-        time.sleep(POLL_INTERVAL)
+        time.sleep(delay)
 
 
 if __name__ == "__main__":
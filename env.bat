@@ -6,6 +6,8 @@ set MFMC_SERVER=http://127.0.0.1:8000
 set MFMC_USERNAME=device01
 set MFMC_PASSWORD=
 set MFMC_POLL_INTERVAL=5
+REM long-poll(초). 서버가 장비 수 이상의 스레드로 떠 있을 때만 켠다 (0=끔)
+set MFMC_LONG_POLL_WAIT=0
 set MFMC_REQUEST_TIMEOUT=5
 set MFMC_HEARTBEAT_INTERVAL_SEC=300
 set MFMC_SERVER_LOG_MIN_LEVEL=INFO
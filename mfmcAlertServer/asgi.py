@@ -3,6 +3,9 @@ ASGI config for mfmcAlertServer project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+/api/stream (SSE 명령 채널)은 ASGI 서버로 띄워야 연결마다 워커를 점유하지 않는다.
+    예) uvicorn mfmcAlertServer.asgi:application
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'alert.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,14 +76,75 @@ WSGI_APPLICATION = 'mfmcAlertServer.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# MFMC_DB=sqlite(기본) | postgres
+
+if os.getenv("MFMC_DB", "sqlite").lower() == "postgres":
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv("MFMC_DB_NAME", "mfmc"),
+            'USER': os.getenv("MFMC_DB_USER", "mfmc"),
+            'PASSWORD': os.getenv("MFMC_DB_PASSWORD", ""),
+            'HOST': os.getenv("MFMC_DB_HOST", "127.0.0.1"),
+            'PORT': os.getenv("MFMC_DB_PORT", "5432"),
+            # 요청마다 새로 연결하지 않고 재사용, 재사용 전에 끊긴 연결인지 확인
+            'CONN_MAX_AGE': int(os.getenv("MFMC_DB_CONN_MAX_AGE", "300")),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if os.getenv("MFMC_DB_POOL") == "1":
+        # psycopg 3 연결 풀 (psycopg[pool] 필요). 풀을 쓰면 CONN_MAX_AGE 는 0 이어야 한다.
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv("MFMC_DB_POOL_MIN", "2")),
+            'max_size': int(os.getenv("MFMC_DB_POOL_MAX", "20")),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv("MFMC_SQLITE_PATH") or BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                # 다른 연결이 쓰는 중이면 바로 "database is locked" 대신 기다린다(초)
+                'timeout': float(os.getenv("MFMC_SQLITE_TIMEOUT", "20")),
+                # 쓰기 트랜잭션은 처음부터 쓰기 잠금을 잡아서 읽기->쓰기 승격 교착을 피한다
+                'transaction_mode': 'IMMEDIATE',
+                # WAL: 읽기와 쓰기가 서로 막지 않음 / NORMAL: WAL 에서는 안전하면서 fsync 를 줄임
+                'init_command': (
+                    "PRAGMA journal_mode=WAL;"
+                    "PRAGMA synchronous=NORMAL;"
+                    "PRAGMA mmap_size=134217728;"
+                ),
+            },
+        }
+    }
+
+
+# Cache
+# 워커 프로세스/서버가 여러 대면 명령 커서 캐시와 long-poll 알림을 공유하도록 Redis 를 지정한다.
+
+if os.getenv("MFMC_REDIS_URL"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ["MFMC_REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
     }
-}
 
 
+# 장비 단위 열람 권한(Device.viewer_groups)은 alert.permissions 에서 판단
+AUTHENTICATION_BACKENDS = [
+    "django.contrib.auth.backends.ModelBackend",
+    "alert.permissions.DeviceViewBackend",
+]
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -119,4 +182,73 @@ USE_TZ = True
 STATIC_URL = 'static/'
 
 MEDIA_URL = "/media/"
-MEDIA_ROOT = BASE_DIR / "media"
\ No newline at end of file
+MEDIA_ROOT = BASE_DIR / "media"
+
+# 방송 시스템
+# /api/status?wait=<초> long-poll 최대 대기 시간
+# status 는 sync view 라 기다리는 요청마다 워커 스레드 하나를 점유한다 (ASGI 에서도 같음).
+# 장비가 long-poll 을 쓰면 서버의 스레드 수를 장비 수 이상으로 띄운다. 클라이언트 기본값은 끔
+# (연결을 오래 유지하려면 비동기로 도는 /api/stream 을 쓴다).
+LONG_POLL_MAX_WAIT = 25
+
+# /api/status 의 다음 폴링 안내(ms): 기본 간격, 명령을 받은 직후 간격, 상한
+POLL_INTERVAL_MS = 3000
+POLL_ACTIVE_INTERVAL_MS = 1000
+POLL_MAX_INTERVAL_MS = 60 * 1000
+# 워커 1개가 감당할 status 요청 수(건/초). 최근 POLL_LOAD_WINDOW 초 유입량이 이보다 많으면 간격을 비례해서 늘린다
+POLL_TARGET_RPS = 200
+POLL_LOAD_WINDOW = 10
+# PLAY 음원 다운로드 분산: 목표 처리량(건/초), 최대 분산 시간(초)
+FILE_TARGET_RPS = 50
+FILE_SPREAD_MAX = 5
+
+# 예약 재생(play_at)은 최대 이 시간(초) 뒤까지 지정할 수 있다
+SCHEDULED_PLAY_MAX_AHEAD = 24 * 60 * 60
+
+# /api/stream (SSE) keepalive 주기와 클라이언트 재연결 대기 시간
+STREAM_KEEPALIVE_SEC = 15
+STREAM_RETRY_MS = 3000
+
+# 장비 인증: Bearer 토큰 유효 시간(초), 검증된 Basic 인증 캐시 크기/유지 시간(초)
+DEVICE_TOKEN_MAX_AGE = 60 * 60
+DEVICE_AUTH_CACHE_SIZE = 10000
+DEVICE_AUTH_CACHE_TTL = 5 * 60
+
+# last_seen_at 기록: DB 값이 이 시간(초)보다 오래됐을 때만 쓰고, 모아서 주기적으로 반영
+HEARTBEAT_RESOLUTION = 60
+HEARTBEAT_FLUSH_INTERVAL = 10
+HEARTBEAT_CACHE_TTL = 60 * 60 * 24
+
+# 장비별 최신 명령 ID 캐시 유지 시간(초). 새 명령은 커밋 즉시 캐시에 반영된다.
+# 프로세스별 캐시(LocMem)는 다른 워커가 만든 명령을 반영하지 못하므로 몇 초만 둔다 (alert.checks)
+COMMAND_CACHE_TTL = 5 * 60 if os.getenv("MFMC_REDIS_URL") else 3
+
+# /api/cache-report 로 받는 보유 음원 해시 최대 개수
+CACHE_REPORT_MAX_ITEMS = 1000
+
+# 업로드 가능한 WAV 최대 크기(바이트)
+WAV_MAX_UPLOAD_BYTES = 200 * 1024 * 1024
+
+# 음원 업로드 뒤 별도 스레드에서 압축본을 만들지 (끄면 manage.py build_audio_variants 로만 만든다)
+WAV_VARIANTS_ON_UPLOAD = True
+
+# /api/device-logs 한 번에 받을 수 있는 로그 최대 건수
+DEVICE_LOG_BATCH_MAX = 500
+
+# 장비 로그 보관 기간(일): 하트비트는 일별 요약으로 옮긴 뒤 삭제 (manage.py prune_device_logs)
+DEVICE_LOG_HEARTBEAT_RETENTION_DAYS = 2
+DEVICE_LOG_RETENTION_DAYS = 90
+
+# 방송 명령 보관 기간(일) (manage.py compact_commands). PING 은 금방 쌓이므로 짧게.
+COMMAND_RETENTION_DAYS = 30
+COMMAND_PING_RETENTION_DAYS = 1
+
+# /api/ack 한 번에 받을 수 있는 명령 수
+ACK_BATCH_MAX = 100
+
+# /metrics (Prometheus) Bearer 토큰: 비우면 DEBUG 에서만 열리고 운영에서는 404
+METRICS_TOKEN = os.getenv("MFMC_METRICS_TOKEN", "")
+# 온라인 장비로 볼 최근 접속 기준(초), 미수신 명령을 셀 기간(초), 로그 유입량 계산 기간(초)
+METRICS_ONLINE_WINDOW = 5 * 60
+METRICS_PENDING_WINDOW = 10 * 60
+METRICS_LOG_RATE_WINDOW = 5 * 60
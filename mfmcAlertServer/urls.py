@@ -19,9 +19,12 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from alert.metrics import metrics_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include("alert.urls")),
+    path("metrics", metrics_view, name="metrics"),
 ]
 
 # ✅ 개발용: DEBUG=True일 때만 /media/ 서빙